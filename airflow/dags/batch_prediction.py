@@ -3,6 +3,7 @@ import json
 from textwrap import dedent
 import pendulum
 import os
+import logging
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 
@@ -27,11 +28,14 @@ with DAG(
         os.system(f"aws s3 sync s3://{bucket_name}/input_files /app/input_files")
 
     def batch_prediction(**kwargs):
-        from thyroid.pipeline.batch_prediction import start_batch_prediction
+        from thyroid.config import env_var
+        from thyroid.pipeline.batch_prediction import start_parallel_batch_prediction
         input_dir = "/app/input_files"
-        for file_name in os.listdir(input_dir):
-            #make prediction
-            start_batch_prediction(input_file_path=os.path.join(input_dir,file_name))
+        #make prediction of all files, model is loaded once and files are predicted in parallel,
+        #each file is read in chunks so that memory of parallel workers stays bounded
+        summary = start_parallel_batch_prediction(input_dir=input_dir, chunk_size=env_var.batch_prediction_chunk_size)
+        #failed files are listed in the summary saved in prediction folder, other files are still uploaded
+        logging.info(f"Predicted files: {summary['n_success']}, failed files: {summary['n_failed']}")
     
     def sync_prediction_dir_to_s3_bucket(**kwargs):
         bucket_name = os.getenv("BUCKET_NAME")
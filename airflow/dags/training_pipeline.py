@@ -22,7 +22,9 @@ with DAG(                         # Directed Acyclic Graph
     
     def training(**kwargs):                                                      # Defining function for training pipeline
         from thyroid.pipeline.training_pipeline import start_training_pipeline    # Starting training pipeline from thyroid
-        start_training_pipeline()
+        # Every try of a dag run uses the same artifact dir, so a retry resumes after the last completed stage
+        artifact_dir = os.path.join("/app/artifact", kwargs["ts_nodash"])
+        start_training_pipeline(resume=artifact_dir)
     
     def sync_artifact_to_s3_bucket(**kwargs):                                    # Defining function to Store artifacts and models to S3 bucket
         bucket_name = os.getenv("BUCKET_NAME")
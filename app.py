@@ -4,8 +4,11 @@ import numpy as np
 import pandas as pd
 from thyroid.predictor import ModelResolver
 from thyroid.logger import logging
-from thyroid.utils import load_object
 from thyroid.exception import ThyroidException
+from thyroid.serving.model_bundle import InvalidRequestError
+from thyroid.serving.micro_batcher import MicroBatcher
+from thyroid.serving.model_watcher import ModelWatcher
+from thyroid.serving.prediction_cache import PredictionCache
 
 app = Flask(__name__)
 
@@ -14,9 +17,27 @@ logging.info("Creating model resolver object")
 model_resolver = ModelResolver(model_registry="saved_models")   # Location where models are saved
 
 
-# Load the model
-target_encoder = load_object(file_path=model_resolver.get_latest_target_encoder_path())
-model = load_object(file_path=model_resolver.get_latest_model_path())
+# Loading, warming up and hot swapping the latest model version in background,
+# the thread is started by the first request of each server process
+model_watcher = ModelWatcher(model_resolver=model_resolver, poll_interval=30.0)
+
+# Caching outputs of repeated feature vectors, keyed by the model version which scored them
+prediction_cache = PredictionCache(max_size=100000, ttl_seconds=3600)
+
+
+def predict_with_serving_model(input_arr:np.ndarray):
+    """
+    Scores the input with the model version serving at this moment
+    """
+    model_bundle = model_watcher.model_bundle
+    return prediction_cache.predict(input_arr=input_arr, model_version=model_bundle.model_dir, predict_fn=model_bundle.predict)
+
+# Coalescing concurrent real time requests into one model call (flush at 256 rows or 2 ms)
+micro_batcher = MicroBatcher(predict_fn=predict_with_serving_model, max_batch_size=256, max_wait_ms=2.0)
+
+@app.before_request
+def start_model_watcher():
+    model_watcher.start()
 
 @app.route('/')
 def home():
@@ -29,11 +50,17 @@ def home():
 @app.route('/predict_api', methods=['POST'])
 def predict_api():
     try:
+        model_bundle = model_watcher.model_bundle
+        if model_bundle is None:
+            return render_template('home.html', output_text="Model is loading, please try again."), 503
         data = [float(x) for x in request.form.values()]
+        if len(data)!=len(model_bundle.feature_names):
+            # A row of another width would fail the whole micro batch it is stacked into
+            return render_template('home.html', output_text=f"Expected {len(model_bundle.feature_names)} values, got {len(data)}."), 400
         final_data = np.array(data).reshape(1,-1)
         logging.info(f"The input for the real time prediction: {final_data}")
-        prediction = model.predict(final_data)
-        cat_prediction = target_encoder.inverse_transform(prediction)
+        prediction, cat_label, probability = micro_batcher.predict(final_data)
+        cat_prediction = np.array([cat_label])
         print(cat_prediction)
         logging.info(f"The decoded output for the real time prediction: {cat_prediction}")
         
@@ -42,6 +69,96 @@ def predict_api():
     except Exception as e:
         raise ThyroidException(error_message=e, error_detail=sys)
 
+@app.route('/v1/predict', methods=['POST'])
+def predict_v1():
+    """
+    Scores many named feature records with one vectorized predict_proba call
+    Request body: {"records": [{"age": 41, "sex": 0, ...}, ...]} or {"columns": {"age": [41, ...], ...}}
+    Optional "orient" in body or query string: "columns" (default) or "records" for the output layout
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload,dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+        # Holding one model version for the whole request even if a new version is swapped in meanwhile
+        model_bundle = model_watcher.model_bundle
+        if model_bundle is None:
+            return jsonify({"error": "Model is not ready"}), 503
+        orient = request.args.get("orient", payload.get("orient","columns"))
+        if orient not in ("columns","records"):
+            return jsonify({"error": "orient must be 'columns' or 'records'"}), 400
+
+        try:
+            if "records" in payload:
+                input_arr = model_bundle.records_to_array(records=payload["records"])
+            elif "columns" in payload:
+                input_arr = model_bundle.columns_to_array(columns=payload["columns"])
+            else:
+                raise InvalidRequestError("Request body must have 'records' or 'columns'")
+        except InvalidRequestError as e:
+            return jsonify({"error": str(e), "feature_names": model_bundle.feature_names}), 400
+
+        logging.info(f"Scoring {input_arr.shape[0]} records with model version: {model_bundle.version}")
+        prediction, cat_prediction, probability = prediction_cache.predict(input_arr=input_arr,
+                                                    model_version=model_bundle.model_dir, predict_fn=model_bundle.predict)
+
+        if orient=="records":
+            predictions = [{"prediction": int(pred), "label": str(label), "probability": dict(zip(model_bundle.labels, map(float,proba)))}
+                            for pred, label, proba in zip(prediction, cat_prediction, probability)]
+            return jsonify({"model_version": model_bundle.version, "predictions": predictions})
+
+        return jsonify({"model_version": model_bundle.version,
+                        "prediction": prediction.tolist(),
+                        "label": cat_prediction.tolist(),
+                        "probability": {label: probability[:,index].tolist() for index,label in enumerate(model_bundle.labels)}})
+
+    except Exception as e:
+        raise ThyroidException(error_message=e, error_detail=sys)
+
+@app.route('/v1/batcher/stats', methods=['GET'])
+def batcher_stats():
+    """
+    Reports queue depth and batch size histograms of the real time micro batcher
+    """
+    try:
+        return jsonify(micro_batcher.get_stats())
+
+    except Exception as e:
+        raise ThyroidException(error_message=e, error_detail=sys)
+@app.route('/v1/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Reports hit and miss counts of the prediction cache
+    """
+    try:
+        return jsonify(prediction_cache.get_stats())
+
+    except Exception as e:
+        raise ThyroidException(error_message=e, error_detail=sys)
+
+@app.route('/v1/model', methods=['GET'])
+def model_status():
+    """
+    Reports which model version is serving
+    """
+    try:
+        return jsonify(model_watcher.get_status())
+
+    except Exception as e:
+        raise ThyroidException(error_message=e, error_detail=sys)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe, ready only after a model version is loaded and warmed up
+    """
+    try:
+        status = model_watcher.get_status()
+        return jsonify(status), (200 if status["ready"] else 503)
+
+    except Exception as e:
+        raise ThyroidException(error_message=e, error_detail=sys)
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,41 @@
+"""
+Single row latency of the compiled InferencePlan against the pandas path of start_batch_prediction
+Run from project root: python benchmarks/inference_plan_benchmark.py
+"""
+import timeit
+import numpy as np
+import pandas as pd
+
+from thyroid.predictor import ModelResolver
+from thyroid.serving.model_bundle import ModelBundle
+
+DATA_FILE_PATH = "hypothyroid.csv"
+N_CALLS = 200
+
+
+def pandas_path(model_bundle:ModelBundle, df:pd.DataFrame):
+    """
+    Same steps as start_batch_prediction on a one row dataframe
+    """
+    df = model_bundle.preprocessor.transform(df)
+    input_arr = model_bundle.knn_imputer.transform(df[model_bundle.feature_names])
+    prediction = model_bundle.model.predict(input_arr)
+    return model_bundle.target_encoder.inverse_transform(prediction)
+
+
+if __name__=="__main__":
+    model_resolver = ModelResolver(model_registry="saved_models")
+    model_bundle = ModelBundle(model_dir=model_resolver.get_latest_dir_path(), model_resolver=model_resolver)
+    plan = model_bundle.inference_plan
+    raw_df = pd.read_csv(DATA_FILE_PATH)
+
+    # One record with all lab values and one with a missing lab value (goes through the imputer)
+    complete_index = int(np.flatnonzero((raw_df[plan.feature_names]!="?").all(axis=1).values)[0])
+    missing_index = int(np.flatnonzero((raw_df[plan.feature_names]=="?").any(axis=1).values)[0])
+
+    for name,row_index in (("complete record",complete_index),("record with null",missing_index)):
+        row_df = raw_df.iloc[[row_index]]
+        record = row_df.iloc[0].to_dict()
+        pandas_time = min(timeit.repeat(lambda: pandas_path(model_bundle, row_df), number=N_CALLS, repeat=3))/N_CALLS
+        plan_time = min(timeit.repeat(lambda: plan.predict_record(record), number=N_CALLS, repeat=3))/N_CALLS
+        print(f"{name}: pandas path {pandas_time*1e6:.1f} us, inference plan {plan_time*1e6:.1f} us, speedup {pandas_time/plan_time:.1f}x")
@@ -0,0 +1,65 @@
+"""
+Fit and transform time of PatternKNNImputer (grouped dense and KD-tree indexed) against KNNImputer for growing training sizes
+Training rows are drawn from the data the saved imputer was fitted on, with its missingness patterns and some
+jitter on the lab values, queries are incomplete rows drawn the same way
+Run from project root: python benchmarks/knn_imputer_benchmark.py
+"""
+import time
+import numpy as np
+import pandas as pd
+from sklearn.impute import KNNImputer
+
+from thyroid.utils import load_object
+from thyroid.predictor import ModelResolver
+from thyroid.imputer import PatternKNNImputer
+
+N_ROWS = [10_000, 100_000, 1_000_000]
+N_QUERIES = 1000
+N_NEIGHBORS = 7
+CONTINUOUS_COLUMNS = ['age', 'TSH', 'T3', 'TT4', 'T4U', 'FTI']
+
+
+def sample_rows(fit_X:np.ndarray, feature_names:list, n_rows:int, random_state:np.random.RandomState)->pd.DataFrame:
+    df = pd.DataFrame(fit_X[random_state.randint(0, fit_X.shape[0], size=n_rows)].astype(np.float64), columns=feature_names)
+    for column in [column for column in CONTINUOUS_COLUMNS if column in feature_names]:
+        df[column] = df[column]*random_state.uniform(0.95, 1.05, size=n_rows)
+    return df
+
+
+def timed(function):
+    start_time = time.perf_counter()
+    output = function()
+    return output, time.perf_counter()-start_time
+
+
+if __name__=="__main__":
+    model_resolver = ModelResolver(model_registry="saved_models")
+    knn_imputer = load_object(file_path=model_resolver.get_latest_knn_imputer_path())
+    feature_names = list(knn_imputer.feature_names_in_)
+    fit_X = knn_imputer.steps[-1][1]._fit_X
+    random_state = np.random.RandomState(42)
+
+    incomplete_rows = fit_X[np.isnan(fit_X).any(axis=1)]
+    queries = sample_rows(fit_X=incomplete_rows, feature_names=feature_names, n_rows=N_QUERIES, random_state=random_state)
+
+    for n_rows in N_ROWS:
+        train_df = sample_rows(fit_X=fit_X, feature_names=feature_names, n_rows=n_rows, random_state=random_state)
+
+        timings, outputs, n_trees = dict(), dict(), 0
+        # One imputer at a time so that the 1M rows case fits in memory
+        for name,imputer in [("brute", KNNImputer(n_neighbors=N_NEIGHBORS)),
+                            ("grouped", PatternKNNImputer(n_neighbors=N_NEIGHBORS, algorithm="brute")),
+                            ("indexed", PatternKNNImputer(n_neighbors=N_NEIGHBORS, algorithm="kd_tree"))]:
+            imputer, fit_time = timed(lambda: imputer.fit(train_df))
+            outputs[name], transform_time = timed(lambda: imputer.transform(queries))
+            timings[name] = (fit_time, transform_time)
+            n_trees = len(getattr(imputer, "index_", {})) or n_trees
+            del imputer
+
+        # Grouped output is the same as KNNImputer, indexed output only differs where several training rows are tied at the k-th distance
+        # (indexed takes them in training row order, see PatternKNNImputer)
+        grouped_equal_rows = (outputs["grouped"]==outputs["brute"]).all(axis=1).mean()
+        indexed_equal_rows = np.isclose(outputs["brute"], outputs["indexed"]).all(axis=1).mean()
+        print(f"{n_rows:>9} rows: fit " + ", ".join(f"{name} {fit_time:6.2f} s" for name,(fit_time,_) in timings.items()) + f" ({n_trees} trees) | "
+            f"transform {N_QUERIES} rows " + ", ".join(f"{name} {transform_time:7.2f} s" for name,(_,transform_time) in timings.items()) + " | "
+            f"equal rows grouped {grouped_equal_rows:.1%}, indexed {indexed_equal_rows:.1%}")
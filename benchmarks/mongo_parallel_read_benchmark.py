@@ -0,0 +1,126 @@
+"""
+Read time of a collection with parallel _id range reads against one cursor for growing parallelism
+The collection is served by an in-process stand-in of the server: documents sorted by _id, every cursor batch
+and aggregation is a round trip which holds one of SERVER_SLOTS slots for ROUND_TRIP_SECONDS, so reads are
+latency bound until all slots are busy (server saturation)
+Run from project root: python benchmarks/mongo_parallel_read_benchmark.py
+"""
+import time
+import random
+import bisect
+import threading
+import pandas as pd
+from bson import ObjectId
+
+from thyroid import utils
+
+N_DOCUMENTS = 100_000
+BATCH_SIZE = 1000
+ROUND_TRIP_SECONDS = 0.05
+SERVER_SLOTS = 8
+PARALLELISM = [1, 2, 4, 8, 16]
+DATA_FILE_PATH = "hypothyroid.csv"
+
+
+class StandInServer:
+    def __init__(self, ids:list, bodies:list):
+        self.documents = list(zip(ids, bodies))    # (_id, document without _id) sorted by _id
+        self.ids = ids
+        self.slots = threading.Semaphore(SERVER_SLOTS)
+        self.round_trips = 0
+
+    def round_trip(self):
+        with self.slots:
+            self.round_trips += 1
+            time.sleep(ROUND_TRIP_SECONDS)
+
+    def get_range(self, query:dict)->list:
+        id_query = query.get("_id", {})
+        start = bisect.bisect_right(self.ids, id_query["$gt"]) if "$gt" in id_query else 0
+        end = bisect.bisect_right(self.ids, id_query["$lte"]) if "$lte" in id_query else len(self.ids)
+        return self.documents[start:end]
+
+
+class StandInCursor:
+    def __init__(self, server:StandInServer, documents:list, projection:dict, batch_size:int):
+        self.server = server
+        self.documents = documents
+        self.projection = projection or {}
+        self.batch_size = batch_size
+
+    def sort(self, key, direction=1):
+        if isinstance(key, list):
+            key, direction = key[0]
+        if direction==-1:
+            self.documents = self.documents[::-1]
+        return self
+
+    def limit(self, n_documents:int):
+        self.documents = self.documents[:n_documents]
+        self.batch_size = n_documents
+        return self
+
+    def __iter__(self):
+        for start in range(0, len(self.documents), self.batch_size):
+            self.server.round_trip()
+            for _id,body in self.documents[start:start+self.batch_size]:
+                if self.projection.get("_id")==0:
+                    yield body
+                elif self.projection.get("_id")==1:
+                    yield {"_id": _id}
+                else:
+                    yield {"_id": _id, **body}
+
+
+class StandInCollection:
+    def __init__(self, server:StandInServer):
+        self.server = server
+
+    def find(self, query:dict=None, projection:dict=None, batch_size:int=101):
+        return StandInCursor(server=self.server, documents=self.server.get_range(query or {}), projection=projection, batch_size=batch_size)
+
+    def count_documents(self, query:dict)->int:
+        self.server.round_trip()
+        return len(self.server.get_range(query))
+
+    def aggregate(self, pipeline:list):
+        documents = self.server.get_range(pipeline[0]["$match"])
+        self.server.round_trip()
+        sample = random.sample(documents, min(pipeline[1]["$sample"]["size"], len(documents)))
+        return [{"_id": _id} for _id,_ in sample]
+
+
+class StandInClient:
+    def __init__(self, server:StandInServer):
+        self.collection = StandInCollection(server=server)
+
+    def __getitem__(self, name):
+        return self if name=="HealthCare" else self.collection
+
+
+if __name__=="__main__":
+    df = pd.read_csv(DATA_FILE_PATH).astype(str)
+    records = df.to_dict(orient="records")
+    random_state = random.Random(42)
+    bodies = [records[random_state.randrange(len(records))] for _ in range(N_DOCUMENTS)]
+    server = StandInServer(ids=[ObjectId() for _ in range(N_DOCUMENTS)], bodies=bodies)
+    client = StandInClient(server=server)
+
+    timings = dict()
+    reference = None
+    for parallelism in [0]+PARALLELISM:
+        server.round_trips = 0
+        start_time = time.perf_counter()
+        if parallelism==0:
+            # One cursor over the whole collection, as before
+            chunks = list(utils.iter_collection_chunks(database_name="HealthCare", collection_name="Thyroid",
+                                                    batch_size=BATCH_SIZE, client=client, sort=[("_id", 1)]))
+        else:
+            chunks = list(utils.iter_collection_chunks_parallel(database_name="HealthCare", collection_name="Thyroid",
+                                                            parallelism=parallelism, batch_size=BATCH_SIZE, client=client))
+        timings[parallelism] = time.perf_counter()-start_time
+        df = pd.concat(chunks, ignore_index=True)
+        reference = df if reference is None else reference
+        name = "single cursor" if parallelism==0 else f"parallelism {parallelism:>2}"
+        print(f"{name}: {timings[parallelism]:6.2f} s, speedup {timings[0]/timings[parallelism]:5.2f}x, "
+            f"{server.round_trips} round trips, same rows in same order: {df.equals(reference)}")
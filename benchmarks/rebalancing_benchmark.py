@@ -0,0 +1,70 @@
+"""
+Runtime and peak memory of the class rebalancing methods of the training set for growing training sets,
+with the f1 score on a held out test set which is never rebalanced
+The training set is the preprocessed hypothyroid data replicated with small noise on the lab values,
+nulls are filled with column medians so that only rebalancing is measured. SMOTETomek time grows with the square
+of the rows (about 9 s for 10k and 4 minutes for 50k training rows), so it is skipped above SMOTE_TOMEK_MAX_ROWS
+Run from project root: python benchmarks/rebalancing_benchmark.py
+"""
+import time
+import tracemalloc
+import numpy as np
+from xgboost import XGBClassifier
+from sklearn.metrics import f1_score
+from sklearn.preprocessing import LabelEncoder
+from sklearn.model_selection import train_test_split
+
+from thyroid import schema, rebalancing
+from thyroid.config import TARGET_COLUMN
+from thyroid.preprocessor import ThyroidPreprocessor
+from thyroid.components.data_validation import DataValidation
+
+DATA_FILE_PATH = "hypothyroid.csv"
+N_TRAIN_ROWS = [10_000, 50_000, 250_000]
+SMOTE_TOMEK_MAX_ROWS = 50_000
+NOISE_SCALE = 0.01      # standard deviation of the noise, relative to the standard deviation of each lab value
+RANDOM_STATE = 42
+
+
+def get_arrays():
+    df = schema.read_csv(file_path=DATA_FILE_PATH)
+    df = df.drop(columns=DataValidation.unnecessary_columns+["TBG"])
+    y = LabelEncoder().fit_transform(df.pop(TARGET_COLUMN)).astype(schema.TARGET_DTYPE)
+    x = ThyroidPreprocessor().fit_transform(df).to_numpy(dtype=schema.FEATURE_DTYPE)
+    x = np.where(np.isnan(x), np.nanmedian(x, axis=0), x).astype(schema.FEATURE_DTYPE)
+    numeric_index = [index for index,column in enumerate(df.columns) if column in schema.NUMERIC_COLUMNS]
+    return x, y, numeric_index
+
+
+def replicate(x:np.ndarray, y:np.ndarray, numeric_index:list, n_rows:int, random_state:np.random.RandomState):
+    index = random_state.randint(0, x.shape[0], size=n_rows)
+    x_replicated = x[index]
+    noise = random_state.normal(size=(n_rows, len(numeric_index)))*x[:,numeric_index].std(axis=0)*NOISE_SCALE
+    x_replicated[:,numeric_index] += noise.astype(x.dtype)
+    return x_replicated, y[index]
+
+
+if __name__=="__main__":
+    x, y, numeric_index = get_arrays()
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, stratify=y, random_state=RANDOM_STATE)
+    random_state = np.random.RandomState(RANDOM_STATE)
+
+    for n_rows in N_TRAIN_ROWS:
+        x_large, y_large = replicate(x=x_train, y=y_train, numeric_index=numeric_index, n_rows=n_rows, random_state=random_state)
+        print(f"Training rows: {n_rows}, minority rows: {int(np.bincount(y_large).min())}")
+        for method in rebalancing.REBALANCING_METHODS:
+            if method=="smote_tomek" and n_rows>SMOTE_TOMEK_MAX_ROWS:
+                print(f"  {method:>16}: skipped above {SMOTE_TOMEK_MAX_ROWS} rows")
+                continue
+            tracemalloc.start()
+            start_time = time.perf_counter()
+            x_rebalanced, y_rebalanced = rebalancing.rebalance(x=x_large, y=y_large, method=method, random_state=RANDOM_STATE)
+            seconds = time.perf_counter()-start_time
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            params = {"scale_pos_weight": rebalancing.get_scale_pos_weight(y=y_rebalanced)} if method=="scale_pos_weight" else {}
+            model = XGBClassifier(n_estimators=100, max_depth=6, learning_rate=0.1, random_state=RANDOM_STATE, **params)
+            model.fit(x_rebalanced, y_rebalanced)
+            print(f"  {method:>16}: {seconds:7.2f} s, peak memory {peak_memory/2**20:7.1f} MB, "
+                f"rows after {x_rebalanced.shape[0]:>7}, test f1 {f1_score(y_true=y_test, y_pred=model.predict(x_test)):.4f}")
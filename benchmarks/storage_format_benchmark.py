@@ -0,0 +1,47 @@
+"""
+Write time, read time and file size of the stage hand-off formats of DataFrameStorage, with a round trip check that
+parquet and arrow files read back with the same dtypes and values as the csv of the same data
+The data is the hypothyroid file replicated and written as csv parts the way the feature store keeps its partitions
+Run from project root: python benchmarks/storage_format_benchmark.py
+"""
+import os
+import time
+import tempfile
+import pandas as pd
+
+from thyroid.storage import DataFrameStorage, FILE_EXTENSIONS
+
+DATA_FILE_PATH = "hypothyroid.csv"
+N_PARTS = 10
+READ_COLUMNS = ["age", "sex", "TSH", "T3", "binaryClass"]
+
+
+if __name__=="__main__":
+    df = pd.read_csv(DATA_FILE_PATH, dtype=str)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        part_file_paths = []
+        for index in range(N_PARTS):
+            part_file_path = os.path.join(temp_dir, "parts", f"part-{index:05d}.csv")
+            os.makedirs(os.path.dirname(part_file_path), exist_ok=True)
+            df.to_csv(part_file_path, index=False)
+            part_file_paths.append(part_file_path)
+
+        outputs = dict()
+        for storage_format,extension in FILE_EXTENSIONS.items():
+            storage = DataFrameStorage(storage_format=storage_format)
+            file_path = os.path.join(temp_dir, f"train{extension}")
+            start_time = time.perf_counter()
+            storage.write_csv_parts(part_file_paths=part_file_paths, file_path=file_path)
+            write_time = time.perf_counter()-start_time
+            start_time = time.perf_counter()
+            outputs[storage_format] = storage.read(file_path=file_path)
+            read_time = time.perf_counter()-start_time
+            start_time = time.perf_counter()
+            projected = storage.read(file_path=file_path, columns=READ_COLUMNS)
+            projected_read_time = time.perf_counter()-start_time
+
+            reference = outputs["csv"]
+            same_dtypes = reference.dtypes.astype(str).equals(outputs[storage_format].dtypes.astype(str))
+            print(f"{storage_format:>8}: {os.path.getsize(file_path)/2**20:6.2f} MB, write {write_time:6.3f} s, read {read_time:6.3f} s, "
+                f"read {len(READ_COLUMNS)} columns {projected_read_time:6.3f} s | same dtypes as csv: {same_dtypes}, "
+                f"same values: {reference.equals(outputs[storage_format])}, projected columns: {list(projected.columns)==READ_COLUMNS}")
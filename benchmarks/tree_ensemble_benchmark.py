@@ -0,0 +1,37 @@
+"""
+Latency of the flattened NumPy TreeEnsemble against XGBoost inplace_predict for several batch sizes
+Run from project root: python benchmarks/tree_ensemble_benchmark.py
+"""
+import timeit
+import numpy as np
+
+from thyroid.utils import load_object
+from thyroid.predictor import ModelResolver
+from thyroid.serving.tree_ensemble import TreeEnsemble
+
+BATCH_SIZES = [1, 4, 16, 64, 256, 1024]
+N_CALLS = 20
+
+
+if __name__=="__main__":
+    model_resolver = ModelResolver(model_registry="saved_models")
+    model = load_object(file_path=model_resolver.get_latest_model_path())
+    knn_imputer = load_object(file_path=model_resolver.get_latest_knn_imputer_path())
+    booster = model.get_booster()
+    tree_ensemble = TreeEnsemble.from_booster(booster=model)
+
+    # Rows from the data the imputer was fitted on, with some null values for the default directions
+    random_state = np.random.RandomState(42)
+    fit_X = knn_imputer.steps[-1][1]._fit_X
+    input_arr = fit_X[random_state.randint(0, fit_X.shape[0], size=max(BATCH_SIZES))].astype(np.float32)
+    input_arr[random_state.rand(*input_arr.shape)<0.05] = np.nan
+
+    import xgboost
+    margin_equal = np.array_equal(tree_ensemble.predict_margin(input_arr), booster.predict(xgboost.DMatrix(input_arr), output_margin=True))
+    print(f"Margin equal to XGBoost: {margin_equal}")
+
+    for batch_size in BATCH_SIZES:
+        batch = input_arr[:batch_size]
+        xgboost_time = min(timeit.repeat(lambda: booster.inplace_predict(batch), number=N_CALLS, repeat=3))/N_CALLS
+        numpy_time = min(timeit.repeat(lambda: tree_ensemble.predict_proba(batch), number=N_CALLS, repeat=3))/N_CALLS
+        print(f"batch {batch_size:>5}: xgboost {xgboost_time*1e6:10.1f} us, numpy {numpy_time*1e6:10.1f} us")
@@ -1,21 +1,23 @@
-import json
-import pymongo
-import pandas as pd
-from thyroid.config import mongo_client
+import argparse
+from thyroid.bulk_loader import load_csv
 
 DATA_FILE_PATH="/config/workspace/hypothyroid.csv"
 DATABASE_NAME="HealthCare"
 COLLECTION_NAME="Thyroid"
+BATCH_SIZE=5000
+N_WORKERS=4
 
 if __name__=="__main__":
-    df = pd.read_csv(DATA_FILE_PATH)
-    print(f"Rows and columns: {df.shape}")
+    parser = argparse.ArgumentParser(description="Load a csv into mongo db, rows already loaded are skipped")
+    parser.add_argument("--file", default=DATA_FILE_PATH)
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=N_WORKERS)
+    parser.add_argument("--source", default=None, help="Prefix of the idempotent record key, file name by default")
+    args = parser.parse_args()
 
-    #Convert dataframe to json so that we can dump these record in mongo db
-    df.reset_index(drop=True,inplace=True)
-
-    # Each record will represent one row
-    json_record = list(json.loads(df.T.to_json()).values())
-    print(json_record[1])
-    #insert converted json record to mongo db
-    mongo_client[DATABASE_NAME][COLLECTION_NAME].insert_many(json_record)
+    # Streaming the csv in batches and inserting them with unordered bulk writes
+    summary = load_csv(file_path=args.file, database_name=args.database, collection_name=args.collection,
+                    batch_size=args.batch_size, n_workers=args.workers, source=args.source)
+    print(f"Inserted {summary['inserted']} records, skipped {summary['duplicates']} already loaded in {summary['seconds']:.1f} seconds")
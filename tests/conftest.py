@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from thyroid import schema, utils
+from thyroid.config import TARGET_COLUMN
+from thyroid.predictor import ModelResolver
+from thyroid.baseline_profile import BaselineProfile
+from thyroid.preprocessor import ThyroidPreprocessor
+from thyroid.entity.config_entity import (TARGET_ENCODER_OBJECT_FILE_NAME, MODEL_FILE_NAME, KNN_IMPUTER_OBJECT_FILE_NAME,
+                                        PREPROCESSOR_OBJECT_FILE_NAME, BASELINE_PROFILE_FILE_NAME)
+
+DATA_FILE_PATH = "hypothyroid.csv"
+N_FIT_ROWS = 3000
+# Features of the trained model (those of saved_models), validation drops the rest
+FEATURE_NAMES = ["age", "sex", "on thyroxine", "on antithyroid medication", "sick", "pregnant", "thyroid surgery", "I131 treatment",
+                "query hypothyroid", "query hyperthyroid", "lithium", "goitre", "tumor", "hypopituitary", "psych",
+                "TSH", "TT4", "T4U", "FTI"]
+
+
+@pytest.fixture(scope="session")
+def raw_df()->pd.DataFrame:
+    """
+    Hypothyroid data as read by the pipeline, '?' as null
+    """
+    return schema.read_csv(file_path=DATA_FILE_PATH)
+
+
+@pytest.fixture(scope="session")
+def feature_arr(raw_df)->np.ndarray:
+    """
+    Preprocessed features in float64, null values left for the imputer
+    """
+    return ThyroidPreprocessor().fit_transform(raw_df.drop(columns=[TARGET_COLUMN]))[FEATURE_NAMES].to_numpy(dtype=np.float64)
+
+
+@pytest.fixture(scope="session")
+def training_objects(raw_df)->dict:
+    """
+    Preprocessor, imputation pipeline, model and target encoder fitted like DataTransformation and ModelTrainer do,
+    on the first N_FIT_ROWS rows
+    """
+    from sklearn.preprocessing import LabelEncoder
+    from xgboost import XGBClassifier
+    from thyroid.components.data_transformation import DataTransformation
+
+    fit_df = raw_df.iloc[:N_FIT_ROWS]
+    preprocessor = ThyroidPreprocessor()
+    input_df = preprocessor.fit_transform(fit_df.drop(columns=[TARGET_COLUMN]))[FEATURE_NAMES]
+    knn_imputer = DataTransformation.get_knn_imputer_object()
+    input_arr = knn_imputer.fit_transform(input_df)
+    target_encoder = LabelEncoder().fit(fit_df[TARGET_COLUMN])
+    model = XGBClassifier(n_estimators=30, max_depth=3).fit(input_arr, target_encoder.transform(fit_df[TARGET_COLUMN]))
+    return {"preprocessor": preprocessor, "knn_imputer": knn_imputer, "model": model, "target_encoder": target_encoder}
+
+
+def save_model_version(model_registry:str, training_objects:dict, baseline_df:pd.DataFrame, knn_imputer=None,
+                        with_preprocessor:bool=True)->str:
+    """
+    Saves the training objects as model version 0 of model_registry like ModelPusher does, with the baseline
+    profile of baseline_df. knn_imputer replaces the fitted one, with_preprocessor False gives a version saved
+    before the preprocessor was added
+    returns model_registry
+    """
+    model_resolver = ModelResolver(model_registry=model_registry)
+    model_dir = os.path.join(model_registry, "0")
+    objects = [(model_resolver.knn_imputer_dir_name, KNN_IMPUTER_OBJECT_FILE_NAME, knn_imputer or training_objects["knn_imputer"]),
+                (model_resolver.model_dir_name, MODEL_FILE_NAME, training_objects["model"]),
+                (model_resolver.target_encoder_dir_name, TARGET_ENCODER_OBJECT_FILE_NAME, training_objects["target_encoder"])]
+    if with_preprocessor:
+        objects.append((model_resolver.preprocessor_dir_name, PREPROCESSOR_OBJECT_FILE_NAME, training_objects["preprocessor"]))
+    for dir_name,file_name,obj in objects:
+        utils.save_object(file_path=os.path.join(model_dir, dir_name, file_name), obj=obj)
+    BaselineProfile.from_dataframe(df=baseline_df).save(file_path=os.path.join(model_dir, model_resolver.baseline_profile_dir_name,
+                                                                            BASELINE_PROFILE_FILE_NAME))
+    return model_registry
@@ -0,0 +1,30 @@
+import os
+import pandas as pd
+import pytest
+
+from thyroid import utils
+from thyroid.exception import ThyroidException
+from thyroid.pipeline.batch_prediction import BatchPredictionObjects, start_batch_prediction, get_report_file_path
+from conftest import DATA_FILE_PATH, save_model_version
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1000])
+def test_files_predicted_by_one_process_keep_their_own_report(chunk_size, tmp_path, monkeypatch, training_objects, raw_df):
+    model_registry = save_model_version(model_registry=str(tmp_path/"saved_models"), training_objects=training_objects, baseline_df=raw_df)
+    input_df = pd.read_csv(DATA_FILE_PATH, dtype=str)
+    missing_column_file_path, complete_file_path = str(tmp_path/"missing_column.csv"), str(tmp_path/"complete.csv")
+    input_df.drop(columns=["TSH"]).to_csv(missing_column_file_path, index=False)
+    input_df.to_csv(complete_file_path, index=False)
+    monkeypatch.chdir(tmp_path)
+
+    # Same objects for both files, as a pool worker which predicts several files
+    prediction_objects = BatchPredictionObjects(model_registry=model_registry)
+    with pytest.raises(ThyroidException):
+        start_batch_prediction(input_file_path=missing_column_file_path, chunk_size=chunk_size, prediction_objects=prediction_objects)
+    start_batch_prediction(input_file_path=complete_file_path, chunk_size=chunk_size, prediction_objects=prediction_objects)
+
+    missing_column_report = utils.read_yaml_file(file_path=get_report_file_path(input_file_path=missing_column_file_path))
+    complete_report = utils.read_yaml_file(file_path=get_report_file_path(input_file_path=complete_file_path))
+    assert "TSH" in missing_column_report["missing_columns_within_input_dataset"]
+    assert "missing_columns_within_input_dataset" not in complete_report
+    assert "data_drift_within_input_dataset" in complete_report
@@ -0,0 +1,32 @@
+import mongomock
+import pandas as pd
+
+from thyroid.config import RECORD_KEY_FIELD
+from thyroid.bulk_loader import load_csv, LOAD_MARKER_COLLECTION
+from conftest import DATA_FILE_PATH
+
+DATABASE_NAME = "thyroid"
+COLLECTION_NAME = "records"
+
+
+def test_load_into_collection_seeded_without_record_key(tmp_path):
+    client = mongomock.MongoClient()
+    input_df = pd.read_csv(DATA_FILE_PATH, dtype=str).head(500)
+    file_path = str(tmp_path/"records.csv")
+    input_df.to_csv(file_path, index=False)
+
+    # Documents inserted as the former data_dump.py did, without record key
+    seeded_records = input_df.head(100).astype(object).where(input_df.head(100).notna(), None).to_dict(orient="records")
+    client[DATABASE_NAME][COLLECTION_NAME].insert_many(seeded_records)
+
+    summary = load_csv(file_path=file_path, database_name=DATABASE_NAME, collection_name=COLLECTION_NAME, batch_size=64, client=client)
+    assert (summary["inserted"], summary["duplicates"]) == (input_df.shape[0], 0)
+
+    # Loading the file again only finds duplicates of the keyed documents
+    summary = load_csv(file_path=file_path, database_name=DATABASE_NAME, collection_name=COLLECTION_NAME, batch_size=64, client=client)
+    assert (summary["inserted"], summary["duplicates"]) == (0, input_df.shape[0])
+
+    collection = client[DATABASE_NAME][COLLECTION_NAME]
+    assert collection.count_documents({RECORD_KEY_FIELD: {"$exists": False}}) == len(seeded_records)
+    assert collection.count_documents({RECORD_KEY_FIELD: {"$exists": True}}) == input_df.shape[0]
+    assert client[DATABASE_NAME][LOAD_MARKER_COLLECTION].count_documents({}) == 0
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from sklearn.impute import KNNImputer
+from sklearn.metrics.pairwise import nan_euclidean_distances
+
+from thyroid.imputer import PatternKNNImputer
+
+N_NEIGHBORS = 7
+N_FIT_ROWS = 3000
+
+
+def is_tied_at_kth_distance(distances:np.ndarray, n_neighbors:int)->bool:
+    """
+    True if the k-th and (k+1)-th distances are equal up to the rounding of |x|^2+|y|^2-2xy in KNNImputer
+    """
+    distances = np.sort(distances)
+    return bool(np.isclose(distances[n_neighbors-1]**2, distances[n_neighbors]**2, rtol=1e-9, atol=1e-8))
+
+
+@pytest.fixture(scope="module")
+def fit_arr(feature_arr):
+    return feature_arr[:N_FIT_ROWS]
+
+
+@pytest.fixture(scope="module")
+def kd_tree_output(fit_arr, feature_arr):
+    return PatternKNNImputer(n_neighbors=N_NEIGHBORS).fit(fit_arr).transform(feature_arr)
+
+
+def test_kd_tree_is_default():
+    assert PatternKNNImputer().algorithm=="kd_tree"
+    assert PatternKNNImputer.from_knn_imputer(KNNImputer().fit(np.eye(3))).algorithm=="kd_tree"
+
+
+def test_kd_tree_differs_from_knn_imputer_only_at_tied_distances(fit_arr, feature_arr, kd_tree_output):
+    knn_output = KNNImputer(n_neighbors=N_NEIGHBORS).fit(fit_arr).transform(feature_arr)
+    distances = nan_euclidean_distances(feature_arr, fit_arr)
+    fit_mask = np.isnan(fit_arr)
+
+    assert not np.isnan(kd_tree_output).any()
+    rows, cols = np.nonzero(kd_tree_output!=knn_output)
+    assert rows.size>0
+    for row,col in zip(rows, cols):
+        assert is_tied_at_kth_distance(distances=distances[row, ~fit_mask[:, col]], n_neighbors=N_NEIGHBORS), (row, col)
+
+
+def test_ball_tree_gives_same_output(fit_arr, feature_arr, kd_tree_output):
+    ball_tree_output = PatternKNNImputer(n_neighbors=N_NEIGHBORS, algorithm="ball_tree").fit(fit_arr).transform(feature_arr)
+    np.testing.assert_array_equal(ball_tree_output, kd_tree_output)
+
+
+def test_output_does_not_depend_on_row_blocking(fit_arr, feature_arr, kd_tree_output):
+    imputer = PatternKNNImputer(n_neighbors=N_NEIGHBORS).fit(fit_arr)
+    permutation = np.random.RandomState(0).permutation(feature_arr.shape[0])
+    np.testing.assert_array_equal(imputer.transform(feature_arr[permutation]), kd_tree_output[permutation])
+
+    # Rows alone take the path without tree for patterns fitted rows do not have
+    missing_rows = np.flatnonzero(np.isnan(feature_arr).any(axis=1))[:200]
+    single_rows = np.vstack([imputer.transform(feature_arr[[row]]) for row in missing_rows])
+    np.testing.assert_array_equal(single_rows, kd_tree_output[missing_rows])
+
+
+def test_search_without_tree_gives_same_neighbors(fit_arr, feature_arr, kd_tree_output):
+    imputer = PatternKNNImputer(n_neighbors=N_NEIGHBORS).fit(fit_arr)
+    imputer.index_ = dict()
+    imputer.leaf_size = feature_arr.shape[0]+1
+    np.testing.assert_array_equal(imputer.transform(feature_arr), kd_tree_output)
+
+
+def test_transform_does_not_change_fitted_trees(fit_arr, feature_arr):
+    imputer = PatternKNNImputer(n_neighbors=N_NEIGHBORS).fit(fit_arr)
+    index = dict(imputer.index_)
+    unseen_pattern = feature_arr[:100].copy()
+    unseen_pattern[:, [0, -1]] = np.nan
+    imputer.transform(unseen_pattern)
+    assert imputer.index_==index
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from sklearn.impute import KNNImputer
+from sklearn.pipeline import Pipeline
+
+from thyroid import schema
+from thyroid.config import TARGET_COLUMN
+from thyroid.imputer import PatternKNNImputer
+from thyroid.preprocessor import AGE_OUTLIER_LIMIT
+from thyroid.serving.inference_plan import InferencePlan
+from conftest import FEATURE_NAMES, N_FIT_ROWS
+
+
+@pytest.fixture(scope="module")
+def input_df(raw_df):
+    return raw_df.drop(columns=[TARGET_COLUMN])
+
+
+@pytest.fixture(scope="module", params=["pattern_knn_imputer", "knn_imputer"])
+def knn_imputer(request, training_objects, input_df):
+    """
+    Imputer of the current training pipeline and sklearn KNNImputer of model versions saved before it
+    """
+    if request.param=="pattern_knn_imputer":
+        return training_objects["knn_imputer"]
+    fit_df = training_objects["preprocessor"].transform(input_df.iloc[:N_FIT_ROWS])[FEATURE_NAMES]
+    return Pipeline(steps=[("imputer", KNNImputer(n_neighbors=7).fit(fit_df))])
+
+
+def test_predict_matrix_matches_preprocessor_and_imputer(training_objects, knn_imputer, input_df):
+    """
+    Same probabilities as preprocessing the dataframe, imputing with the imputer as batch prediction loads it
+    (a sklearn KNNImputer converted to PatternKNNImputer) and predicting with the model
+    """
+    preprocessor, model = training_objects["preprocessor"], training_objects["model"]
+    plan = InferencePlan(knn_imputer=knn_imputer, model=model, target_encoder=training_objects["target_encoder"],
+                        preprocessor=preprocessor)
+
+    # Rows with null or outlier 'age' or null 'sex' are the ones the preprocessor changes
+    age, sex = input_df["age"], input_df[schema.SEX_COLUMN]
+    filled_rows = np.flatnonzero((age.isna() | (age>AGE_OUTLIER_LIMIT) | sex.isna()).to_numpy())
+    assert filled_rows.size>0
+
+    expected_arr = PatternKNNImputer.from_knn_imputer(knn_imputer=knn_imputer).transform(preprocessor.transform(input_df)[FEATURE_NAMES])
+    expected_proba = model.predict_proba(expected_arr)[:, 1]
+
+    input_arr = schema.encode_features(df=input_df)[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    prediction, _, probability = plan.predict_matrix(input_arr=input_arr.copy())
+    np.testing.assert_allclose(probability[:, 1], expected_proba, atol=1e-6)
+    np.testing.assert_array_equal(prediction, (expected_proba>0.5).astype(np.int64))
+
+    _, _, filled_probability = plan.predict_matrix(input_arr=input_arr[filled_rows].copy())
+    np.testing.assert_allclose(filled_probability[:, 1], expected_proba[filled_rows], atol=1e-6)
+
+
+def test_predict_record_matches_predict_matrix(training_objects, input_df):
+    plan = InferencePlan(knn_imputer=training_objects["knn_imputer"], model=training_objects["model"],
+                        target_encoder=training_objects["target_encoder"], preprocessor=training_objects["preprocessor"])
+    input_arr = schema.encode_features(df=input_df)[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    _, _, probability = plan.predict_matrix(input_arr=input_arr.copy())
+    for row in range(0, input_arr.shape[0], 37):
+        _, _, positive_proba = plan.predict_record(record=input_arr[row].copy())
+        assert positive_proba==pytest.approx(probability[row, 1], abs=1e-6)
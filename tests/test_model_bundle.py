@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import KNNImputer
+from sklearn.pipeline import Pipeline
+
+from thyroid import schema
+from thyroid.config import TARGET_COLUMN
+from thyroid.predictor import ModelResolver
+from thyroid.serving.model_bundle import ModelBundle
+from thyroid.pipeline.batch_prediction import BatchPredictionObjects, start_batch_prediction
+from conftest import DATA_FILE_PATH, FEATURE_NAMES, N_FIT_ROWS, save_model_version
+
+
+@pytest.fixture(params=["current", "without_preprocessor", "knn_imputer"])
+def model_registry(request, tmp_path, training_objects, raw_df)->str:
+    """
+    Registry with one model version, versions saved before the preprocessor was added have none,
+    the earliest ones have a sklearn KNNImputer
+    """
+    knn_imputer = None
+    if request.param=="knn_imputer":
+        fit_df = training_objects["preprocessor"].transform(raw_df.iloc[:N_FIT_ROWS].drop(columns=[TARGET_COLUMN]))[FEATURE_NAMES]
+        knn_imputer = Pipeline(steps=[("imputer", KNNImputer(n_neighbors=7).fit(fit_df))])
+    return save_model_version(model_registry=str(tmp_path/"saved_models"), training_objects=training_objects, baseline_df=raw_df,
+                            knn_imputer=knn_imputer, with_preprocessor=request.param=="current")
+
+
+def test_bundle_matches_batch_prediction(model_registry, raw_df, tmp_path, monkeypatch):
+    input_file_path = str(tmp_path/"input.csv")
+    pd.read_csv(DATA_FILE_PATH, dtype=str).drop(columns=[TARGET_COLUMN]).to_csv(input_file_path, index=False)
+    monkeypatch.chdir(tmp_path)
+
+    prediction_objects = BatchPredictionObjects(model_registry=model_registry)
+    prediction_df = pd.read_csv(start_batch_prediction(input_file_path=input_file_path, prediction_objects=prediction_objects))
+
+    model_resolver = ModelResolver(model_registry=model_registry)
+    model_bundle = ModelBundle(model_dir=model_resolver.get_latest_dir_path(), model_resolver=model_resolver)
+    # Records as sent to /v1/predict: flags and 'sex' as category codes, null as None
+    encoded_df = schema.encode_features(df=raw_df)[FEATURE_NAMES].astype(object)
+    records = encoded_df.where(encoded_df.notna(), None).to_dict(orient="records")
+    prediction, label, _ = model_bundle.predict(input_arr=model_bundle.records_to_array(records=records))
+
+    np.testing.assert_array_equal(prediction, prediction_df["prediction"].to_numpy())
+    np.testing.assert_array_equal(label.astype(str), prediction_df["cat_pred"].astype(str).to_numpy())
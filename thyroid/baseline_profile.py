@@ -0,0 +1,112 @@
+import os, sys
+import numpy as np
+import pandas as pd
+from typing import Optional
+from thyroid import utils
+from thyroid.exception import ThyroidException
+
+
+QUANTILES = [0.0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0]
+N_HISTOGRAM_BINS = 10
+MAX_CATEGORIES = 50
+
+
+class BaselineProfile:
+    """
+    This class holds the statistics of the base dataset which validation compares against:
+    data type, null rate and number of classes of every column, category counts of categorical
+    columns and quantiles and histogram of numeric columns.
+
+    It is built once per training run and saved as yaml with the model version, so validation
+    works from a few values per column instead of parsing the base csv again.
+    """
+    def __init__(self, n_rows:int, columns:dict):
+        self.n_rows = n_rows
+        self.columns = columns      # column name -> statistics
+
+    @classmethod
+    def from_dataframe(cls, df:pd.DataFrame)->"BaselineProfile":
+        """
+        This function computes the statistics of base df ('?' already read as null)
+        """
+        try:
+            columns = dict()
+            for column in df.columns:
+                data = df[column]
+                value_counts = data.value_counts()
+                value_counts = value_counts[value_counts>0]     # categories of a category column which do not occur
+                statistics = {"dtype": str(data.dtype),
+                            "null_rate": float(data.isna().mean()) if len(data) else 0.0,
+                            "n_classes": int(len(value_counts))}
+
+                non_null = data.dropna()
+                numeric = pd.to_numeric(non_null, errors="coerce")
+                if len(non_null)>0 and numeric.notna().all():
+                    numeric = numeric.astype(np.float64)
+                    statistics["quantiles"] = {float(quantile): float(value) for quantile,value in zip(QUANTILES, numeric.quantile(QUANTILES))}
+                    counts, bin_edges = np.histogram(numeric, bins=N_HISTOGRAM_BINS)
+                    statistics["histogram"] = {"bin_edges": bin_edges.tolist(), "counts": counts.tolist()}
+                elif len(value_counts)<=MAX_CATEGORIES:
+                    statistics["categories"] = {str(value): int(count) for value,count in value_counts.items()}
+
+                columns[str(column)] = statistics
+            return cls(n_rows=int(df.shape[0]), columns=columns)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def save(self, file_path:str)->None:
+        utils.write_yaml_file(file_path=file_path, data={"n_rows": self.n_rows, "columns": self.columns})
+
+    @classmethod
+    def load(cls, file_path:str)->"BaselineProfile":
+        try:
+            if not os.path.exists(file_path):
+                raise Exception(f"The file: {file_path} is not exists")
+            profile = utils.read_yaml_file(file_path=file_path)
+            return cls(n_rows=profile["n_rows"], columns=profile["columns"])
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_missing_value_columns(self, threshold:float)->list:
+        """
+        Columns of base dataset with null rate above threshold
+        """
+        return [column for column,statistics in self.columns.items() if statistics["null_rate"]>threshold]
+
+    def get_required_columns(self, threshold:float, exclude_columns:Optional[list]=None)->list:
+        """
+        Columns of base dataset left after dropping missing value columns and exclude_columns
+        """
+        exclude_columns = exclude_columns or []
+        missing_value_columns = self.get_missing_value_columns(threshold=threshold)
+        return [column for column in self.columns if column not in missing_value_columns and column not in exclude_columns]
+
+    @staticmethod
+    def get_current_statistics(df:pd.DataFrame):
+        """
+        Returns data type and number of classes of each column of current df
+        """
+        current_dtypes = {column: df[column].dtype for column in df.columns}
+        current_n_classes = {column: int(df[column].nunique()) for column in df.columns}
+        return current_dtypes, current_n_classes
+
+    def data_drift(self, base_columns:list, current_dtypes:dict, current_n_classes:dict)->dict:
+        """
+        Same checks as comparing against base df: data type and number of classes of each base column
+        current_dtypes : column name to dtype
+        current_n_classes : column name to number of distinct non null values
+        """
+        drift_report=dict()
+        for base_column in base_columns:
+            statistics = self.columns[base_column]
+            if statistics["dtype"] == str(current_dtypes[base_column]):
+                drift_report[base_column] = {"Same data type": True}
+            else:
+                drift_report[base_column] = {"Same data type": False}
+
+            if statistics["n_classes"] == current_n_classes[base_column]:
+                drift_report[base_column] = {"Column has equal number of classes": True}
+            else:
+                drift_report[base_column] = {"Column has equal number of classes": False}
+        return drift_report
@@ -0,0 +1,153 @@
+import os, sys
+import time
+import pandas as pd
+from typing import Iterator
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from thyroid.logger import logging
+from thyroid.exception import ThyroidException
+from thyroid.config import mongo_client, RECORD_KEY_FIELD
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+# One document per load in progress: {"_id": "<collection>:<source>", "collection", "pending_from_id", "started_at"}
+LOAD_MARKER_COLLECTION = "bulk_loads"
+
+
+def iter_documents(file_path:str, batch_size:int, source:str)->Iterator[list]:
+    """
+    Streams the csv as lists of at most batch_size documents, values are kept as text and empty cells as null
+    every document gets the idempotent key <source>:<row number> in RECORD_KEY_FIELD and an _id made here,
+    so that _id order (which ingestion reads in) is the row order even though batches are written concurrently
+    """
+    row_number = 0
+    for chunk in pd.read_csv(file_path, dtype=str, chunksize=batch_size):
+        columns = ["_id"]+list(chunk.columns)+[RECORD_KEY_FIELD]
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        chunk.insert(0, "_id", [ObjectId() for _ in range(chunk.shape[0])])
+        chunk[RECORD_KEY_FIELD] = [f"{source}:{index}" for index in range(row_number, row_number+chunk.shape[0])]
+        row_number += chunk.shape[0]
+        yield [dict(zip(columns, row)) for row in chunk.itertuples(index=False, name=None)]
+
+
+def insert_documents(collection, documents:list)->tuple:
+    """
+    Unordered bulk insert, documents whose key is already loaded are skipped
+    returns number of inserted and duplicate documents
+    """
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        other_errors = [error for error in errors if error.get("code")!=DUPLICATE_KEY_ERROR_CODE]
+        if len(other_errors)>0:
+            raise
+        return e.details.get("nInserted", len(documents)-len(errors)), len(errors)
+
+
+def create_record_key_index(collection)->None:
+    """
+    Unique index on the idempotent key. The index is sparse: documents loaded before the key existed (by the
+    former data_dump.py) have no key and are left out of it, instead of all colliding as null keys.
+    A unique index already on the key is kept as it is
+    """
+    try:
+        for index in collection.index_information().values():
+            if list(index["key"])==[(RECORD_KEY_FIELD, 1)] and index.get("unique", False):
+                return
+        collection.create_index(RECORD_KEY_FIELD, unique=True, sparse=True)
+
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def get_loading_bound(database_name:str, collection_name:str, client=None):
+    """
+    Returns the first _id of the earliest batch not yet committed by any load in progress, None if no load is
+    in progress. Batches are committed out of order, so documents from this _id on may still have gaps and
+    ingestion must not move its watermark past it. A load killed without cleanup keeps its marker (and the bound)
+    until the same source is loaded again
+    """
+    try:
+        client = mongo_client if client is None else client
+        markers = list(client[database_name][LOAD_MARKER_COLLECTION].find({"collection": collection_name}))
+        return min((marker["pending_from_id"] for marker in markers), default=None)
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def load_csv(file_path:str, database_name:str, collection_name:str, batch_size:int=5000, n_workers:int=4,
+            client=None, source:str=None)->dict:
+    """
+    Description: This function loads a csv into a collection
+    =========================================================
+    Params:
+    file_path: csv file
+    batch_size: documents per bulk write
+    n_workers: threads writing batches at once, each on its own pooled connection
+    client: mongo client, thyroid.config.mongo_client if None
+    source: prefix of the idempotent key, file name if None. Loading the same source again (e.g. to resume
+    after a failure) only inserts the rows which are missing, thanks to a unique index on the key
+    (see create_record_key_index), documents of the collection without key are left as they are
+
+    While loading, a marker in LOAD_MARKER_COLLECTION holds the first _id of the earliest batch not yet
+    committed, so ingestion only reads the contiguous committed prefix (see get_loading_bound)
+    =========================================================
+    return counts of inserted and duplicate documents
+    """
+    try:
+        client = mongo_client if client is None else client
+        source = source or os.path.basename(file_path)
+        collection = client[database_name][collection_name]
+        create_record_key_index(collection=collection)
+
+        # Every _id made by this process from now on is above the marker
+        markers = client[database_name][LOAD_MARKER_COLLECTION]
+        marker_id = f"{collection_name}:{source}"
+        markers.replace_one({"_id": marker_id}, {"_id": marker_id, "collection": collection_name,
+                            "pending_from_id": ObjectId(), "started_at": time.time()}, upsert=True)
+
+        start_time = time.time()
+        n_inserted, n_duplicates = 0, 0
+        batches = iter_documents(file_path=file_path, batch_size=batch_size, source=source)
+        try:
+            # At most 2*n_workers batches in memory, batches are kept in submission (_id) order by their first _id
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                submitted = deque()
+                def submit(n_batches:int)->None:
+                    for documents in islice(batches, n_batches):
+                        submitted.append((documents[0]["_id"], executor.submit(insert_documents, collection, documents)))
+                submit(2*n_workers)
+                pending = {future for _,future in submitted}
+                while len(pending)>0:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        inserted, duplicates = future.result()
+                        n_inserted += inserted
+                        n_duplicates += duplicates
+                    n_submitted = len(submitted)
+                    submit(len(done))
+                    pending |= {future for _,future in list(submitted)[n_submitted:]}
+
+                    # Moving the marker past the batches committed without a gap before them
+                    n_committed = 0
+                    while len(submitted)>0 and submitted[0][1].done():
+                        submitted.popleft()
+                        n_committed += 1
+                    if n_committed>0:
+                        markers.update_one({"_id": marker_id}, {"$set": {"pending_from_id": submitted[0][0] if len(submitted)>0 else ObjectId()}})
+        finally:
+            # Nothing of this load is written after the executor is shut down
+            markers.delete_one({"_id": marker_id})
+
+        summary = {"source": source, "inserted": n_inserted, "duplicates": n_duplicates, "seconds": time.time()-start_time}
+        logging.info(f"Loaded {file_path} into {database_name}.{collection_name}: {summary}")
+        return summary
+
+    except Exception as e:
+        raise ThyroidException(e, sys)
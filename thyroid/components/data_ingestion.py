@@ -2,23 +2,28 @@ import os,sys
 import pandas as pd 
 import numpy as np
 
-from thyroid import utils
+from thyroid import utils, schema
 from thyroid.logger import logging
+from thyroid.storage import DataFrameStorage
+from thyroid.feature_store import FeatureStore
+from thyroid.bulk_loader import get_loading_bound
 from thyroid.exception import ThyroidException
 from thyroid.entity import config_entity, artifact_entity
 
-from sklearn.model_selection import train_test_split
+from bson import ObjectId
 
 
 
 class DataIngestion:
-    def __init__(self, data_ingestion_config:config_entity.DataIngestionConfig):
+    def __init__(self, data_ingestion_config:config_entity.DataIngestionConfig, mongo_client=None):
         '''
         Storing the input to a variable to use in pipeline
+        mongo_client : client to read the collection with, thyroid.config.mongo_client if None
         '''
         try:
             logging.info(f"{'>>'*20} Data Ingestion {'<<'*20}")
             self.data_ingestion_config = data_ingestion_config
+            self.mongo_client = mongo_client
         except Exception as e:
             raise SensorException(e, sys)
 
@@ -26,43 +31,49 @@ class DataIngestion:
         """
         This function takes Input: Database name and collection name
         and returns output: feature store file, train file and test file
+
+        Only documents after the watermark of the feature store are read and appended to it as a new partition,
+        split into train and test by record hash so that earlier records keep their split
         """
         try:
-            logging.info(f"Exporting collection data as pandas dataframe")
-            # Exporting collection data as pandas dataframe
-            df:pd.DataFrame  = utils.get_collection_as_dataframe(
-                database_name=self.data_ingestion_config.database_name, 
-                collection_name=self.data_ingestion_config.collection_name)
-
-            logging.info("Replacing '?' value to np.NAN")
-
-            # Replace na with Nan
-            df.replace(to_replace="?",value=np.NAN,inplace=True)
-
-            logging.info("Save data in feature store")
-            # Save data in feature store
-            logging.info("Create feature store folder if not available")
-            #Create feature store folder if not available
-            feature_store_dir = os.path.dirname(self.data_ingestion_config.feature_store_file_path)
-            os.makedirs(feature_store_dir,exist_ok=True)
-            logging.info("Save df to feature store folder")
-            # Save df to feature store folder
-            df.to_csv(path_or_buf=self.data_ingestion_config.feature_store_file_path,index=False,header=True)
-
-
-            logging.info("split dataset into train and test set")
-            # split dataset into train and test set
-            train_df,test_df = train_test_split(df,test_size=self.data_ingestion_config.test_size, random_state=42)
-            
-            logging.info("create dataset directory folder if not available")
-            # Create dataset directory folder if not available
-            dataset_dir = os.path.dirname(self.data_ingestion_config.train_file_path)
-            os.makedirs(dataset_dir,exist_ok=True)
-
-            logging.info("Saving train df and test df to dataset folder")
-            # Saving train df and test df to dataset folder
-            train_df.to_csv(path_or_buf=self.data_ingestion_config.train_file_path,index=False,header=True)
-            test_df.to_csv(path_or_buf=self.data_ingestion_config.test_file_path,index=False,header=True)
+            feature_store = FeatureStore(store_dir=self.data_ingestion_config.feature_store_dir)
+            watermark = feature_store.state["watermark"]
+            lower_id = ObjectId(watermark) if watermark is not None else None
+
+            # Upper bound taken first so that documents inserted while streaming wait for the next run
+            latest_id = utils.get_latest_id(database_name=self.data_ingestion_config.database_name,
+                collection_name=self.data_ingestion_config.collection_name,
+                query={"_id": {"$gt": lower_id}} if lower_id is not None else {}, client=self.mongo_client)
+            # A bulk load in progress commits batches out of order, documents from its first uncommitted batch
+            # on wait for the next run so that the watermark never moves past a batch which is not written yet
+            loading_bound = get_loading_bound(database_name=self.data_ingestion_config.database_name,
+                collection_name=self.data_ingestion_config.collection_name, client=self.mongo_client)
+            if latest_id is not None and loading_bound is not None and loading_bound<=latest_id:
+                logging.info(f"Bulk load in progress, reading documents before {loading_bound} only")
+                id_query = {"$lt": loading_bound} if lower_id is None else {"$gt": lower_id, "$lt": loading_bound}
+                latest_id = utils.get_latest_id(database_name=self.data_ingestion_config.database_name,
+                    collection_name=self.data_ingestion_config.collection_name, query={"_id": id_query}, client=self.mongo_client)
+
+            if latest_id is None:
+                logging.info(f"No new documents after watermark {watermark}")
+            else:
+                logging.info(f"Streaming new documents up to {latest_id} in chunks of {self.data_ingestion_config.batch_size} rows "
+                            f"with {self.data_ingestion_config.parallelism} parallel range reads to feature store")
+                # Null tokens of the schema ('?') replaced by NaN in each chunk as it arrives, values stay as text
+                # in the feature store and every stage parses them with the schema dtypes
+                chunks = (chunk.mask(chunk.isin(schema.NA_VALUES)) for chunk in utils.iter_collection_chunks_parallel(
+                    database_name=self.data_ingestion_config.database_name, 
+                    collection_name=self.data_ingestion_config.collection_name,
+                    lower_id=lower_id, upper_id=latest_id, parallelism=self.data_ingestion_config.parallelism,
+                    batch_size=self.data_ingestion_config.batch_size, client=self.mongo_client))
+                feature_store.append_partition(chunks=chunks, test_size=self.data_ingestion_config.test_size,
+                                            watermark=str(latest_id))
+
+            logging.info("Exporting feature store, train and test set of all partitions to artifact dir")
+            storage = DataFrameStorage(storage_format=self.data_ingestion_config.storage_format)
+            feature_store.export(kind="data", file_path=self.data_ingestion_config.feature_store_file_path, storage=storage)
+            feature_store.export(kind="train", file_path=self.data_ingestion_config.train_file_path, storage=storage)
+            feature_store.export(kind="test", file_path=self.data_ingestion_config.test_file_path, storage=storage)
             
             # Prepare artifact  
 
@@ -4,14 +4,17 @@ import pandas as pd
 from thyroid import utils
 from typing import Optional
 from thyroid.logger import logging
+from thyroid.storage import DataFrameStorage
 from thyroid.config import TARGET_COLUMN
 from thyroid.exception import ThyroidException
+from thyroid.baseline_profile import BaselineProfile
 from thyroid.entity import artifact_entity,config_entity
 
 
 
 class DataValidation:
 
+    unnecessary_columns = ['TSH measured', 'T3 measured', 'TT4 measured', 'T4U measured', 'FTI measured', 'TBG measured', 'referral source', 'query on thyroxine']
 
     def __init__(self,
                     data_validation_config:config_entity.DataValidationConfig,
@@ -21,6 +24,7 @@ class DataValidation:
             self.data_validation_config = data_validation_config
             self.data_ingestion_artifact=data_ingestion_artifact
             self.validation_error=dict()
+            self.storage = DataFrameStorage(storage_format=data_validation_config.storage_format)
         except Exception as e:
             raise ThyroidException(e, sys)
 
@@ -62,7 +66,7 @@ class DataValidation:
         returns Pandas Dataframe by dropping 'TSH measured', 'T3 measured', 'TT4 measured', 'T4U measured', 'FTI measured', 'TBG measured', 'referral source', 'query on thyroxine'
         """
         try:
-            drop_columns = ['TSH measured', 'T3 measured', 'TT4 measured', 'T4U measured', 'FTI measured', 'TBG measured', 'referral source', 'query on thyroxine']
+            drop_columns = list(self.unnecessary_columns)
             logging.info(f"UnnecessaColumns dropped: {drop_columns}")
             self.validation_error[report_key_name] = drop_columns
             drop_columns = df[drop_columns]
@@ -72,13 +76,12 @@ class DataValidation:
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def is_required_columns_exists(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str)->bool:
+    def is_required_columns_exists(self,base_columns:list,current_df:pd.DataFrame,report_key_name:str)->bool:
         """
-        This function checks if required columns exists or not by comparing current df with base df and returns
+        This function checks if required columns exists or not by comparing current df with base columns and returns
         output as True and False
         """
         try:
-            base_columns = base_df.columns
             current_columns = current_df.columns
 
             missing_columns = []
@@ -96,83 +99,66 @@ class DataValidation:
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def data_drift(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str):
+    def data_drift(self,baseline_profile:BaselineProfile,base_columns:list,current_df:pd.DataFrame,report_key_name:str):
+        """
+        This function compares data type and number of classes of current df columns with the baseline profile
+        """
         try:
-            drift_report=dict()
-
-            base_columns = base_df.columns
-            current_columns = current_df.columns
-
-            for base_column in base_columns:
-                base_data,current_data = base_df[base_column],current_df[base_column]
-                # Null hypothesis : Both column data has same distribution
-                
-                logging.info(f"Checking Data Types of '{base_column}': {base_data.dtype}, {current_data.dtype} ")
-                
-                if base_df[base_column].dtype == current_df[base_column].dtype:
-                    drift_report[base_column] = {"Same data type": True}
-                else:
-                    drift_report[base_column] = {"Same data type": False}
-
-                logging.info(f"Checking number of classes in in {base_column} column\n: {base_df[base_column].value_counts(), current_df[base_column].value_counts()}")
-                if len(base_df[base_column].value_counts()) == len(current_df[base_column].value_counts()):
-                    drift_report[base_column] = {"Column has equal number of classes": True}
-                else:
-                    drift_report[base_column] = {"Column has equal number of classes": False} 
-
-            self.validation_error[report_key_name]=drift_report
+            current_dtypes, current_n_classes = BaselineProfile.get_current_statistics(df=current_df)
+            logging.info(f"Checking data types and number of classes of columns: {base_columns}")
+            self.validation_error[report_key_name]=baseline_profile.data_drift(base_columns=base_columns,
+                                                    current_dtypes=current_dtypes, current_n_classes=current_n_classes)
             
         except Exception as e:
             raise ThyroidException(e, sys)
 
     def initiate_data_validation(self)->artifact_entity.DataValidationArtifact:
         try:
-            logging.info("Reading base dataframe")
-            base_df = pd.read_csv(self.data_validation_config.base_file_path)
-            base_df.replace({"?":np.NAN},inplace=True)
-            logging.info("Replace ? value in base df")
-            #base_df has ? as null
-            logging.info("Drop null values colums from base df")
-            base_df=self.drop_missing_values_columns(df=base_df,report_key_name="missing_values_within_base_dataset")
+            logging.info("Reading base dataframe with the dtypes of the schema, '?' is read as null")
+            base_df = self.storage.read(file_path=self.data_validation_config.base_file_path)
+            # Base dataset is profiled once per training run, validation and prediction compare against the profile
+            logging.info("Building baseline profile of base df")
+            baseline_profile = BaselineProfile.from_dataframe(df=base_df)
+            baseline_profile.save(file_path=self.data_validation_config.baseline_profile_path)
+
+            logging.info("Null values colums of base df")
+            threshold = self.data_validation_config.missing_threshold
+            self.validation_error["missing_values_within_base_dataset"] = baseline_profile.get_missing_value_columns(threshold=threshold)
 
             logging.info("Reading train dataframe")
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
+            train_df = self.storage.read(file_path=self.data_ingestion_artifact.train_file_path)
             logging.info("Reading test dataframe")
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            test_df = self.storage.read(file_path=self.data_ingestion_artifact.test_file_path)
 
             logging.info("Drop null values colums from train df")
             train_df = self.drop_missing_values_columns(df=train_df,report_key_name="missing_values_within_train_dataset")
             logging.info("Drop null values colums from test df")
             test_df = self.drop_missing_values_columns(df=test_df,report_key_name="missing_values_within_test_dataset")
 
-            logging.info("Drop unnecessary columns from base df")
-            base_df = self.drop_unnecessary_columns(df=base_df, report_key_name="dropping_unnecessary_columns_base_df")
+            logging.info("Unnecessary columns of base df")
+            self.validation_error["dropping_unnecessary_columns_base_df"] = list(self.unnecessary_columns)
+            base_columns = baseline_profile.get_required_columns(threshold=threshold, exclude_columns=self.unnecessary_columns)
             logging.info("Drop unnecessary columns from train df")
             train_df = self.drop_unnecessary_columns(df=train_df, report_key_name="dropping_unnecessary_columns_train_df")
             logging.info("Drop unnecessary columns from test df")
             test_df = self.drop_unnecessary_columns(df=test_df, report_key_name="dropping_unnecessary_columns_test_df")
 
             logging.info("Is all required columns present in train df")
-            train_df_columns_status = self.is_required_columns_exists(base_df=base_df, current_df=train_df,report_key_name="missing_columns_within_train_dataset")
+            train_df_columns_status = self.is_required_columns_exists(base_columns=base_columns, current_df=train_df,report_key_name="missing_columns_within_train_dataset")
             logging.info("Is all required columns present in test df")
-            test_df_columns_status = self.is_required_columns_exists(base_df=base_df, current_df=test_df,report_key_name="missing_columns_within_test_dataset")
+            test_df_columns_status = self.is_required_columns_exists(base_columns=base_columns, current_df=test_df,report_key_name="missing_columns_within_test_dataset")
 
             if train_df_columns_status:     # If True
                 logging.info("As all column are available in train df hence detecting data drift in train dataframe")
-                self.data_drift(base_df=base_df, current_df=train_df,report_key_name="data_drift_within_train_dataset")
+                self.data_drift(baseline_profile=baseline_profile, base_columns=base_columns, current_df=train_df,report_key_name="data_drift_within_train_dataset")
             if test_df_columns_status:     # If True
                 logging.info("As all column are available in test df hence detecting data drift test dataframe")
-                self.data_drift(base_df=base_df, current_df=test_df,report_key_name="data_drift_within_test_dataset")
-
-            logging.info("create dataset directory folder if not available for validated train file and test file")
-            # Create dataset directory folder if not available
-            dataset_dir = os.path.dirname(self.data_validation_config.train_file_path)
-            os.makedirs(dataset_dir,exist_ok=True)
+                self.data_drift(baseline_profile=baseline_profile, base_columns=base_columns, current_df=test_df,report_key_name="data_drift_within_test_dataset")
 
             logging.info("Saving validated train df and test df to dataset folder")
-            # Saving validated train df and test df to dataset folder
-            train_df.to_csv(path_or_buf=self.data_validation_config.train_file_path,index=False,header=True)
-            test_df.to_csv(path_or_buf=self.data_validation_config.test_file_path,index=False,header=True)
+            # Saving validated train df and test df to dataset folder, folder is created if not available
+            self.storage.write(df=train_df, file_path=self.data_validation_config.train_file_path)
+            self.storage.write(df=test_df, file_path=self.data_validation_config.test_file_path)
             
             # Write the report
             logging.info("Writing report in yaml file")
@@ -180,7 +166,8 @@ class DataValidation:
             data=self.validation_error)   # valiadtion_error: drop columns, missing columns, drift report
 
             data_validation_artifact = artifact_entity.DataValidationArtifact(report_file_path=self.data_validation_config.report_file_path, 
-            train_file_path=self.data_validation_config.train_file_path, test_file_path=self.data_validation_config.test_file_path)
+            train_file_path=self.data_validation_config.train_file_path, test_file_path=self.data_validation_config.test_file_path,
+            baseline_profile_path=self.data_validation_config.baseline_profile_path)
             logging.info(f"Data validation artifact: {data_validation_artifact}")
             return data_validation_artifact
 
@@ -1,4 +1,5 @@
 import os, sys
+import filecmp
 import pandas as pd
 import numpy as np
 
@@ -6,12 +7,13 @@ from sklearn.metrics import f1_score
 
 from thyroid import utils
 from thyroid.logger import logging
+from thyroid.storage import DataFrameStorage
 from thyroid.utils import load_object
 from thyroid.config import TARGET_COLUMN
 from thyroid.predictor import ModelResolver
 from thyroid.exception import ThyroidException
 from thyroid.entity import config_entity, artifact_entity
-from thyroid.components.data_transformation import DataTransformation
+from thyroid.preprocessor import ThyroidPreprocessor
  
 
 class ModelEvaluation:
@@ -28,7 +30,6 @@ class ModelEvaluation:
             self.data_ingestion_artifact=data_ingestion_artifact
             self.data_transformation_artifact=data_transformation_artifact
             self.model_trainer_artifact=model_trainer_artifact
-            self.data_transformation= DataTransformation(data_transformation_config=config_entity.DataTransformationConfig, data_validation_artifact=artifact_entity.DataValidationArtifact)
             self.model_resolver = ModelResolver()
 
         except Exception as e:
@@ -50,37 +51,46 @@ class ModelEvaluation:
                 return model_eval_artifact
 
             # Finding location of model and target encoder
-            logging.info("Finding location of knn_imputer, model and target encoder")
+            logging.info("Finding location of preprocessor, knn_imputer, model and target encoder")
             knn_imputer_path = self.model_resolver.get_latest_knn_imputer_path()
+            preprocessor_path = self.model_resolver.get_latest_preprocessor_path()
             model_path = self.model_resolver.get_latest_model_path()
             target_encoder_path = self.model_resolver.get_latest_target_encoder_path()
 
+            # A stage cache hit returns the model of an earlier run, which may be the saved model itself
+            if os.path.exists(model_path) and filecmp.cmp(model_path, self.model_trainer_artifact.model_path, shallow=False):
+                logging.info(f"Current trained model is the saved model of: {latest_dir_path}, nothing to push")
+                model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted=False, improved_accuracy=0.0)
+                logging.info(f"Model evaluation artifact: {model_eval_artifact}")
+                return model_eval_artifact
+
             # Loading objects
-            logging.info("Previous trained objects of knn_imputer, model and target encoder")
+            logging.info("Previous trained objects of preprocessor, knn_imputer, model and target encoder")
             # Previous trained  objects
             knn_imputer = load_object(file_path=knn_imputer_path)
+            preprocessor = ThyroidPreprocessor.load(file_path=preprocessor_path, knn_imputer=knn_imputer)
             model = load_object(file_path=model_path)
             target_encoder = load_object(file_path=target_encoder_path)
             
             logging.info("Currently trained model objects")
             # Currently trained model objects
             current_knn_imputer = load_object(file_path=self.data_transformation_artifact.knn_imputer_object_path)
+            current_preprocessor = load_object(file_path=self.data_transformation_artifact.preprocessor_object_path)
             current_model  = load_object(file_path=self.model_trainer_artifact.model_path)
             current_target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
             
-            # Reading test file
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            # Reading test file, only the columns both models use and the target
+            input_feature_names = list(dict.fromkeys(list(knn_imputer.feature_names_in_)+list(current_knn_imputer.feature_names_in_)))
+            test_df = DataFrameStorage().read(file_path=self.data_ingestion_artifact.test_file_path,
+                                            columns=input_feature_names+[TARGET_COLUMN])
             # output label
             target_df = test_df[TARGET_COLUMN]
             y_true =target_encoder.transform(target_df)
             
             # Accuracy using previous trained model
-            exclude_columns = [TARGET_COLUMN]
             input_feature_name = list(knn_imputer.feature_names_in_)
             input_feature_test_df= test_df[input_feature_name]
-            input_feature_test_df= self.data_transformation.feature_encoding(df=input_feature_test_df)
-            input_feature_test_df= utils.convert_columns_float(df=input_feature_test_df, exclude_columns=exclude_columns)
-            input_feature_test_df= self.data_transformation.handling_null_value_and_outliers(df=input_feature_test_df)
+            input_feature_test_df= preprocessor.transform(input_feature_test_df)
 
             input_arr= knn_imputer.transform(input_feature_test_df)
             y_pred = model.predict(input_arr)
@@ -91,12 +101,9 @@ class ModelEvaluation:
             logging.info(f"Accuracy using previous trained model: {previous_model_score}")
 
             # Accuracy using current trained model
-            exclude_columns = [TARGET_COLUMN]
             input_feature_name = list(current_knn_imputer.feature_names_in_)
             input_feature_test_df= test_df[input_feature_name]
-            input_feature_test_df= self.data_transformation.feature_encoding(df=input_feature_test_df)
-            input_feature_test_df= utils.convert_columns_float(df=input_feature_test_df, exclude_columns=exclude_columns)
-            input_feature_test_df= self.data_transformation.handling_null_value_and_outliers(df=input_feature_test_df)
+            input_feature_test_df= current_preprocessor.transform(input_feature_test_df)
 
             input_arr= current_knn_imputer.transform(input_feature_test_df)
             y_pred= current_model.predict(input_arr)
@@ -1,19 +1,23 @@
 import os, sys
+import shutil
 from thyroid.logger import logging
 from thyroid.exception import ThyroidException
 from thyroid.predictor import ModelResolver
+from thyroid.serving.tree_ensemble import TreeEnsemble
 from thyroid.entity.config_entity import ModelPusherConfig
 from thyroid.utils import save_object, load_object
-from thyroid.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ModelPusherArtifact
+from thyroid.entity.artifact_entity import DataValidationArtifact, DataTransformationArtifact, ModelTrainerArtifact, ModelPusherArtifact
 
 class ModelPusher:
 
     def __init__(self,model_pusher_config:ModelPusherConfig,
+        data_validation_artifact:DataValidationArtifact,
         data_transformation_artifact:DataTransformationArtifact,
         model_trainer_artifact:ModelTrainerArtifact):
         try:
             logging.info(f"{'>>'*20} Model Pusher {'<<'*20}")
             self.model_pusher_config=model_pusher_config
+            self.data_validation_artifact=data_validation_artifact
             self.data_transformation_artifact=data_transformation_artifact
             self.model_trainer_artifact=model_trainer_artifact
             self.model_resolver = ModelResolver(model_registry=self.model_pusher_config.saved_model_dir)
@@ -24,26 +28,42 @@ class ModelPusher:
     def initiate_model_pusher(self)->ModelPusherArtifact:
         try:
             # Load object 
-            logging.info("Loading knn_imputer, model and target encoder")
+            logging.info("Loading preprocessor, knn_imputer, model and target encoder")
             model = load_object(file_path=self.model_trainer_artifact.model_path)
+            preprocessor = load_object(file_path=self.data_transformation_artifact.preprocessor_object_path)
             knn_imputer = load_object(file_path=self.data_transformation_artifact.knn_imputer_object_path)
             target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
 
+            # Flattening the booster so that serving can score without the xgboost runtime
+            logging.info("Flattening model trees into node arrays")
+            tree_ensemble = TreeEnsemble.from_booster(booster=model)
+
             # Model pusher dir
             logging.info("Saving model into model pusher directory")
             save_object(file_path= self.model_pusher_config.pusher_model_path, obj=model)
+            save_object(file_path=self.model_pusher_config.preprocessor_object_path, obj=preprocessor)
             save_object(file_path=self.model_pusher_config.knn_imputer_object_path, obj=knn_imputer)
             save_object(file_path=self.model_pusher_config.pusher_target_encoder_path, obj=target_encoder)
+            tree_ensemble.save(file_path=self.model_pusher_config.pusher_tree_ensemble_path)
+            shutil.copyfile(self.data_validation_artifact.baseline_profile_path, self.model_pusher_config.pusher_baseline_profile_path)
 
             # Getting or fetching the directory location to save latest model in different directory in each run
             logging.info("Saving model in saved model dir")
             model_path = self.model_resolver.get_latest_save_model_path()
             knn_imputer_path = self.model_resolver.get_latest_save_knn_imputer_path()
+            preprocessor_path = self.model_resolver.get_latest_save_preprocessor_path()
             target_encoder_path = self.model_resolver.get_latest_save_target_encoder_path()
+            tree_ensemble_path = self.model_resolver.get_latest_save_tree_ensemble_path()
+            baseline_profile_path = self.model_resolver.get_latest_save_baseline_profile_path()
 
             # Saved model dir outside artifact to use in prediction pipeline
             logging.info('Saving model outside of artifact directory')
+            tree_ensemble.save(file_path=tree_ensemble_path)
+            # Baseline profile of the training run, prediction validates input against it
+            os.makedirs(os.path.dirname(baseline_profile_path), exist_ok=True)
+            shutil.copyfile(self.data_validation_artifact.baseline_profile_path, baseline_profile_path)
             save_object(file_path=model_path, obj=model)
+            save_object(file_path=preprocessor_path, obj=preprocessor)
             save_object(file_path=knn_imputer_path, obj=knn_imputer)
             save_object(file_path=target_encoder_path, obj=target_encoder)
 
@@ -4,10 +4,10 @@ from typing import Optional
 from xgboost import XGBClassifier
 
 from sklearn.metrics import f1_score
-from sklearn.model_selection import GridSearchCV
 
-from thyroid import utils
+from thyroid import utils, rebalancing
 from thyroid.logger import logging
+from thyroid.tuning import HyperbandSearch, TuningCache
 from thyroid.exception import ThyroidException
 from thyroid.entity import artifact_entity,config_entity
 
@@ -25,36 +25,56 @@ class ModelTrainer:
             raise ThyroidException(e, sys)
 
 
-    def fine_tune(self,x,y):
+    def fine_tune(self,x,y,fixed_params:Optional[dict]=None):
         """
-        Hyper parameter tuning using GridSearchCV
-        This function accepts x and y 
+        Hyper parameter tuning using Hyperband (successive halving with early stopping)
+        Cached result is reused when the training arrays did not change materially since the last search
+        This function accepts x and y, and fixed_params every candidate is trained with
         -------------------------------------------
-        Returns best paramenters for XGBClassifier
+        Returns best paramenters for XGBClassifier, fingerprint digest of the arrays and the cache decision
         """
         try:
-            # Defining parameters
+            # Defining parameters, n_estimators is the resource of the search and eta is an alias of learning_rate
             parameters = {'max_depth': range (2, 10, 1),
-                            'eta': [0.1, 0.2, 0.3],
-                            'n_estimators': [100, 200, 300],
-                            'learning_rate': [0.01, 0.03, 0.05]} 
-
-            grid_search = GridSearchCV(estimator= XGBClassifier(), param_grid=parameters, n_jobs=-1, verbose=3, cv=3)
-            
-            grid_search.fit(x, y)
-            BestParams = grid_search.best_params_
-            
-            return BestParams
+                            'learning_rate': [0.01, 0.03, 0.05, 0.1, 0.2, 0.3]} 
+
+            search = HyperbandSearch(param_grid=parameters,
+                                    min_rounds=self.model_trainer_config.tuning_min_rounds,
+                                    max_rounds=self.model_trainer_config.tuning_max_rounds,
+                                    halving_factor=self.model_trainer_config.tuning_halving_factor,
+                                    early_stopping_rounds=self.model_trainer_config.tuning_early_stopping_rounds,
+                                    time_budget=self.model_trainer_config.tuning_time_budget,
+                                    validation_size=self.model_trainer_config.tuning_validation_size,
+                                    random_state=self.model_trainer_config.tuning_random_state,
+                                    fixed_params=fixed_params or {})
+
+            tuning_cache = TuningCache(cache_dir=self.model_trainer_config.tuning_cache_dir,
+                                    row_tolerance=self.model_trainer_config.tuning_cache_row_tolerance,
+                                    shift_tolerance=self.model_trainer_config.tuning_cache_shift_tolerance)
+            fingerprint = tuning_cache.get_fingerprint(x=x, y=y, search_space=search.get_search_space())
+            cache_entry = tuning_cache.load(fingerprint=fingerprint)
+            decision = tuning_cache.get_decision(fingerprint=fingerprint, entry=cache_entry)
+            logging.info(f"Tuning cache decision for fingerprint {fingerprint['digest']}: {decision}")
+
+            if decision=="reuse":
+                return {**cache_entry["best_params"], 'n_estimators': cache_entry["best_n_estimators"]}, fingerprint["digest"], decision
+
+            priority_candidates = cache_entry["top_params"] if decision=="warm_start" else []
+            search.fit(x, y, priority_candidates=priority_candidates)
+            logging.info(f"Hyperband search trained {len(search.results_)} candidates with {search.n_boosting_rounds_} boosting rounds "
+                        f"in {search.elapsed_seconds_:.1f} seconds, stopped by time budget: {search.stopped_by_budget_}")
+            tuning_cache.save(fingerprint=fingerprint, search=search)
+            return {**search.best_params_, 'n_estimators': search.best_n_estimators_}, fingerprint["digest"], decision
 
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def train_model(self,x,y):
+    def train_model(self,x,y,params:dict):
         """
-        Model training
+        Model training with the parameters found by fine_tune
         """
         try:
-            xgb_clf =  XGBClassifier(eta= 0.1, learning_rate= 0.05, max_depth= 4, n_estimators= 300)
+            xgb_clf =  XGBClassifier(**params)
             xgb_clf.fit(x,y)
             return xgb_clf
 
@@ -66,21 +86,27 @@ class ModelTrainer:
         Preparing dataset
         """
         try:
-            logging.info("Loading train and test array.")
-            train_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_path)
-            test_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_path)
-
-            logging.info("Splitting input and target feature from both train and test arr.")
-            x_train,y_train = train_arr[:,:-1],train_arr[:,-1]
-            x_test,y_test = test_arr[:,:-1],test_arr[:,-1]
-
-            logging.info('Hyperparameter tuning using GridSearchCV')
-            Best_Params = self.fine_tune(x=x_train,y=y_train)
+            logging.info("Loading input and target feature of train and test arrays.")
+            # Arrays are memory mapped, float32 features are passed to XGBoost as they are, without a conversion copy
+            x_train,y_train = utils.load_array_data(header_path=self.data_transformation_artifact.transformed_train_path)
+            x_test,y_test = utils.load_array_data(header_path=self.data_transformation_artifact.transformed_test_path)
+            logging.info(f"Train rows: {x_train.shape[0]}, test rows: {x_test.shape[0]}, features: "
+                        f"{utils.read_array_header(header_path=self.data_transformation_artifact.transformed_train_path)['feature_names']}")
+
+            # Training set is not resampled with scale_pos_weight rebalancing, classes are balanced by weights instead
+            fixed_params = dict()
+            if self.data_transformation_artifact.rebalancing=="scale_pos_weight":
+                fixed_params["scale_pos_weight"] = rebalancing.get_scale_pos_weight(y=y_train)
+                logging.info(f"Balancing classes with scale_pos_weight: {fixed_params['scale_pos_weight']}")
+
+            logging.info('Hyperparameter tuning using Hyperband')
+            Best_Params, tuning_fingerprint, tuning_cache_decision = self.fine_tune(x=x_train,y=y_train,fixed_params=fixed_params)
+            Best_Params = {**Best_Params, **fixed_params}
             print(f"The best parameters for XGBoostClassifier are : {Best_Params}")
             logging.info(f"The best parameters for XGBoostClassifier are : {Best_Params}")
 
-            logging.info("Train the model")
-            model = self.train_model(x=x_train,y=y_train)
+            logging.info("Train the model on whole train array with the best parameters")
+            model = self.train_model(x=x_train,y=y_train,params=Best_Params)
 
             # Prediction and accuracy using training data
             logging.info("Calculating f1 train score")
@@ -112,7 +138,8 @@ class ModelTrainer:
             # Prepare artifact
             logging.info("Prepare the artifact")
             model_trainer_artifact  = artifact_entity.ModelTrainerArtifact(model_path=self.model_trainer_config.model_path, 
-            f1_train_score=f1_train_score, f1_test_score=f1_test_score)
+            f1_train_score=f1_train_score, f1_test_score=f1_test_score, best_params=Best_Params,
+            tuning_fingerprint=tuning_fingerprint, tuning_cache_decision=tuning_cache_decision)
             logging.info(f"Model trainer artifact: {model_trainer_artifact}")
             return model_trainer_artifact
             
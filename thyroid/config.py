@@ -12,10 +12,14 @@ class EnvironmentVariable:
     mongo_db_url:str = os.getenv("MONGO_DB_URL")
     aws_access_key_id:str = os.getenv("AWS_ACCESS_KEY_ID")
     aws_access_secret_key:str = os.getenv("AWS_SECRET_ACCESS_KEY")
+    inference_engine:str = os.getenv("INFERENCE_ENGINE","xgboost")    # 'xgboost' or 'numpy' (flattened tree ensemble)
+    storage_format:str = os.getenv("STORAGE_FORMAT","csv")            # 'csv', 'parquet' or 'arrow' for files handed between stages
+    batch_prediction_chunk_size:int = int(os.getenv("BATCH_PREDICTION_CHUNK_SIZE","50000"))   # rows per chunk of each batch prediction file
 
 
 
 env_var = EnvironmentVariable()
 mongo_client = pymongo.MongoClient(env_var.mongo_db_url)
 TARGET_COLUMN = "binaryClass"
+RECORD_KEY_FIELD = "record_key"      # idempotent key set by the bulk loader, not a feature
 
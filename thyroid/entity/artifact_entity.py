@@ -11,19 +11,25 @@ class DataValidationArtifact:
     report_file_path:str
     train_file_path:str 
     test_file_path:str
+    baseline_profile_path:str
 
 @dataclass
 class DataTransformationArtifact:
     knn_imputer_object_path:str
+    preprocessor_object_path:str
     transformed_train_path:str
     transformed_test_path:str
     target_encoder_path:str
+    rebalancing:str
 
 @dataclass
 class ModelTrainerArtifact:
     model_path:str 
     f1_train_score:float 
     f1_test_score:float
+    best_params:dict
+    tuning_fingerprint:str
+    tuning_cache_decision:str
 
 @dataclass
 class ModelEvaluationArtifact:
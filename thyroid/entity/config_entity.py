@@ -2,19 +2,32 @@ import os, sys
 from datetime import datetime
 from thyroid.logger import logging
 from thyroid.exception import ThyroidException
+from thyroid.config import env_var
+from thyroid.storage import DataFrameStorage
 
 FILE_NAME = 'thyroid.csv'
 TRAIN_FILE_NAME = 'train.csv'
 TEST_FILE_NAME = 'test.csv'
 KNN_IMPUTER_OBJECT_FILE_NAME = "knn_imputer.pkl"
+PREPROCESSOR_OBJECT_FILE_NAME = "preprocessor.pkl"
 TARGET_ENCODER_OBJECT_FILE_NAME = "target_encoder.pkl"
 MODEL_FILE_NAME = "model.pkl"
+TREE_ENSEMBLE_FILE_NAME = "tree_ensemble.npz"
+BASELINE_PROFILE_FILE_NAME = "baseline_profile.yaml"
+ARRAY_HEADER_FILE_NAME = "header.yaml"
 
 
 class TrainingPipelineConfig:
-    def __init__(self):
+    def __init__(self, artifact_dir:str=None):
         try:
-            self.artifact_dir = os.path.join(os.getcwd(),"artifact",f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
+            # artifact_dir of an earlier run is given to resume that run
+            if artifact_dir is None:
+                artifact_dir = os.path.join(os.getcwd(),"artifact",f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
+            self.artifact_dir = os.path.abspath(artifact_dir)
+            # Format of the dataframes handed between stages, falls back to csv without pyarrow
+            self.storage_format = DataFrameStorage(storage_format=env_var.storage_format).storage_format
+            # Stage cache records are shared by all runs
+            self.stage_cache_dir = os.path.join(os.getcwd(),"artifact","stage_cache")
 
         except Exception as e:
             raise ThyroidException(e, sys)
@@ -25,10 +38,16 @@ class DataIngestionConfig:
             self.database_name="HealthCare"
             self.collection_name="Thyroid"
             self.data_ingestion_dir = os.path.join(training_pipeline_config.artifact_dir , "data_ingestion")
-            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,"feature_store",FILE_NAME)
-            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset",TRAIN_FILE_NAME)
-            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset",TEST_FILE_NAME)
+            self.storage_format = training_pipeline_config.storage_format
+            storage = DataFrameStorage(storage_format=self.storage_format)
+            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,"feature_store",storage.get_file_name(FILE_NAME))
+            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset",storage.get_file_name(TRAIN_FILE_NAME))
+            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset",storage.get_file_name(TEST_FILE_NAME))
             self.test_size = 0.2
+            self.batch_size = 10000     # documents per cursor batch and rows per chunk
+            self.parallelism = 4        # _id ranges read at once, each on its own pooled connection
+            # Append only feature store kept outside of artifact dir, each run only reads documents after its watermark
+            self.feature_store_dir = os.path.join("feature_store")
 
         except Exception as e:
             raise ThyroidException(e, sys)
@@ -48,10 +67,13 @@ class DataValidationConfig:
         try:
             self.data_validation_dir = os.path.join(training_pipeline_config.artifact_dir , "data_validation")
             self.report_file_path=os.path.join(self.data_validation_dir, "report.yaml")
-            self.train_file_path = os.path.join(self.data_validation_dir,"dataset",TRAIN_FILE_NAME)
-            self.test_file_path = os.path.join(self.data_validation_dir,"dataset",TEST_FILE_NAME)
+            self.storage_format = training_pipeline_config.storage_format
+            storage = DataFrameStorage(storage_format=self.storage_format)
+            self.train_file_path = os.path.join(self.data_validation_dir,"dataset",storage.get_file_name(TRAIN_FILE_NAME))
+            self.test_file_path = os.path.join(self.data_validation_dir,"dataset",storage.get_file_name(TEST_FILE_NAME))
             self.missing_threshold:float = 0.2
             self.base_file_path = os.path.join("hypothyroid.csv")
+            self.baseline_profile_path = os.path.join(self.data_validation_dir,"baseline_profile",BASELINE_PROFILE_FILE_NAME)
 
         except Exception as e:
             raise ThyroidException(e, sys)
@@ -61,9 +83,13 @@ class DataTransformationConfig:
         try:
             self.data_transformation_dir = os.path.join(training_pipeline_config.artifact_dir , "data_transformation")
             self.knn_imputer_object_path = os.path.join(self.data_transformation_dir,"imputer",KNN_IMPUTER_OBJECT_FILE_NAME)
-            self.transformed_train_path =  os.path.join(self.data_transformation_dir,"transformed",TRAIN_FILE_NAME.replace("csv","npz"))
-            self.transformed_test_path =os.path.join(self.data_transformation_dir,"transformed",TEST_FILE_NAME.replace("csv","npz"))
+            self.preprocessor_object_path = os.path.join(self.data_transformation_dir,"preprocessor",PREPROCESSOR_OBJECT_FILE_NAME)
+            # Header of the memory mapped feature and target arrays of each set, arrays are saved next to it
+            self.transformed_train_path =  os.path.join(self.data_transformation_dir,"transformed","train",ARRAY_HEADER_FILE_NAME)
+            self.transformed_test_path =os.path.join(self.data_transformation_dir,"transformed","test",ARRAY_HEADER_FILE_NAME)
             self.target_encoder_path = os.path.join(self.data_transformation_dir,"target_encoder",TARGET_ENCODER_OBJECT_FILE_NAME)
+            # Class rebalancing of training set: 'scale_pos_weight' (weights in XGBoost), 'smote' or 'smote_tomek'
+            self.rebalancing = "scale_pos_weight"
 
         except Exception as e:
             raise ThyroidException(e, sys)
@@ -75,6 +101,18 @@ class ModelTrainerConfig:
             self.model_path = os.path.join(self.model_trainer_dir,"model",MODEL_FILE_NAME)
             self.expected_score = 0.7
             self.overfitting_threshold = 0.1
+            # Hyperband search, number of boosting rounds is the resource of each candidate
+            self.tuning_time_budget = 600           # seconds, no new candidate run is started after it
+            self.tuning_min_rounds = 25
+            self.tuning_max_rounds = 300
+            self.tuning_halving_factor = 3
+            self.tuning_early_stopping_rounds = 20
+            self.tuning_validation_size = 0.2
+            self.tuning_random_state = 42
+            # Tuning results kept outside of artifact dir to reuse them across runs
+            self.tuning_cache_dir = os.path.join("tuning_cache")
+            self.tuning_cache_row_tolerance = 0.05
+            self.tuning_cache_shift_tolerance = 0.1
 
         except Exception as e:
             raise ThyroidException(e, sys)
@@ -94,6 +132,9 @@ class ModelPusherConfig:
             self.pusher_model_path = os.path.join(self.pusher_model_dir,MODEL_FILE_NAME)
             self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir,TARGET_ENCODER_OBJECT_FILE_NAME)
             self.knn_imputer_object_path = os.path.join(self.pusher_model_dir,KNN_IMPUTER_OBJECT_FILE_NAME)
+            self.preprocessor_object_path = os.path.join(self.pusher_model_dir,PREPROCESSOR_OBJECT_FILE_NAME)
+            self.pusher_tree_ensemble_path = os.path.join(self.pusher_model_dir,TREE_ENSEMBLE_FILE_NAME)
+            self.pusher_baseline_profile_path = os.path.join(self.pusher_model_dir,BASELINE_PROFILE_FILE_NAME)
 
         except Exception as e:
             raise ThyroidException(e, sys)
\ No newline at end of file
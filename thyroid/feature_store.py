@@ -0,0 +1,107 @@
+import os, sys
+import numpy as np
+import pandas as pd
+
+from thyroid import utils
+from thyroid.logger import logging
+from thyroid.exception import ThyroidException
+from thyroid.storage import DataFrameStorage
+
+
+STATE_FILE_NAME = "state.yaml"
+PARTITION_DIRS = ["data", "train", "test"]
+N_SPLIT_BUCKETS = 10000
+
+
+def get_record_hashes(df:pd.DataFrame)->np.ndarray:
+    """
+    Returns a uint64 hash of every row which depends only on the values of the record, not on the dtype
+    a column got in its chunk: numbers are hashed as float repr ('41' and 41 give '41.0'), nulls as empty string
+    """
+    normalized = dict()
+    for column in df.columns:
+        data = df[column]
+        numeric = pd.to_numeric(data, errors="coerce")
+        text = data.astype(str)
+        text[numeric.notna()] = numeric[numeric.notna()].astype(np.float64).map(repr)
+        text[data.isna()] = ""
+        normalized[column] = text
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy()
+
+
+def is_test_record(df:pd.DataFrame, test_size:float)->np.ndarray:
+    """
+    Deterministic split by record hash, a record is in the same split in every run
+    """
+    return (get_record_hashes(df=df)%N_SPLIT_BUCKETS)<int(round(test_size*N_SPLIT_BUCKETS))
+
+
+class FeatureStore:
+    """
+    This class is an append only feature store kept outside of artifact dir. Every ingestion appends
+    the new documents as one partition (data, train and test csv) and moves the watermark, the max _id
+    ingested so far, which is saved in state.yaml only after the partition files are written.
+    """
+    def __init__(self, store_dir:str):
+        try:
+            self.store_dir = store_dir
+            self.state_path = os.path.join(store_dir, STATE_FILE_NAME)
+            self.state = {"watermark": None, "columns": None, "partitions": []}
+            if os.path.exists(self.state_path):
+                self.state = utils.read_yaml_file(file_path=self.state_path)
+            logging.info(f"Feature store {store_dir}: {len(self.state['partitions'])} partitions, watermark {self.state['watermark']}")
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_partition_path(self, kind:str, partition:str)->str:
+        return os.path.join(self.store_dir, kind, f"{partition}.csv")
+
+    def append_partition(self, chunks, test_size:float, watermark:str)->int:
+        """
+        Writing new chunks of records as a new partition, returns the number of new rows
+        chunks : iterable of dataframes, '?' already replaced by NaN
+        watermark : max _id of the new records
+        """
+        try:
+            partition = f"part-{len(self.state['partitions']):05d}"
+            for kind in PARTITION_DIRS:
+                os.makedirs(os.path.dirname(self.get_partition_path(kind=kind, partition=partition)), exist_ok=True)
+
+            columns = self.state["columns"]
+            n_rows = 0
+            for chunk in chunks:
+                if columns is None:
+                    columns = list(chunk.columns)
+                if list(chunk.columns)!=columns:
+                    raise Exception(f"Columns of new records differ from the feature store: {list(chunk.columns)}")
+                is_test = is_test_record(df=chunk, test_size=test_size)
+                for kind,part in [("data", chunk), ("train", chunk[~is_test]), ("test", chunk[is_test])]:
+                    part.to_csv(path_or_buf=self.get_partition_path(kind=kind, partition=partition), index=False,
+                                header=n_rows==0, mode="w" if n_rows==0 else "a")
+                n_rows += chunk.shape[0]
+
+            if n_rows>0:
+                self.state = {"watermark": watermark, "columns": columns,
+                            "partitions": self.state["partitions"]+[{"name": partition, "n_rows": n_rows}]}
+                temp_path = f"{self.state_path}.tmp"
+                utils.write_yaml_file(file_path=temp_path, data=self.state)
+                os.replace(temp_path, self.state_path)
+            logging.info(f"Appended {n_rows} rows to feature store as {partition}")
+            return n_rows
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def export(self, kind:str, file_path:str, storage:DataFrameStorage)->None:
+        """
+        Writing the partition files of one kind (data, train or test) as one file, in the format of its extension
+        """
+        try:
+            if len(self.state["partitions"])==0:
+                raise Exception(f"Feature store {self.store_dir} is empty")
+            storage.write_csv_parts(part_file_paths=[self.get_partition_path(kind=kind, partition=partition["name"])
+                                                    for partition in self.state["partitions"]], file_path=file_path)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
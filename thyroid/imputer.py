@@ -0,0 +1,370 @@
+import sys
+import numpy as np
+from sklearn.impute import KNNImputer
+from sklearn.pipeline import Pipeline
+from sklearn.neighbors import KDTree, BallTree
+from sklearn.utils.validation import check_is_fitted
+
+from thyroid.exception import ThyroidException
+
+
+SPATIAL_INDEXES = {"kd_tree": KDTree, "ball_tree": BallTree}
+ALGORITHMS = ["brute"]+list(SPATIAL_INDEXES)
+MAX_DISTANCE_ELEMENTS = 2**24     # Distances of one dense block, 128 MB in float64
+MIN_GROUP_SIZE = 16               # Rows of rarer patterns are imputed together in one block
+
+
+def group_by_pattern(mask:np.ndarray):
+    """
+    Groups rows by missingness pattern, the pattern of each row is packed into a bitmask so grouping is an
+    integer sort instead of a sort of boolean rows
+    returns the distinct patterns (boolean rows) and the group of each row
+    """
+    if mask.shape[1]<=63:
+        bitmask = mask.astype(np.int64) @ (np.int64(1) << np.arange(mask.shape[1], dtype=np.int64))
+    else:
+        bitmask = np.packbits(mask, axis=1).view(np.dtype((np.void, (mask.shape[1]+7)//8))).ravel()
+    _, first_row, group = np.unique(bitmask, return_index=True, return_inverse=True)
+    return mask[first_row], group.ravel()
+
+
+class PatternKNNImputer(KNNImputer):
+    """
+    KNNImputer which imputes incoming rows grouped by missingness pattern. Rows without null values bypass
+    imputation, and the rows of one pattern share their missing columns, donor rows and distance terms.
+
+    Fitted and incoming rows are converted to float64, distances of float32 rows would depend on how rows are
+    blocked together (as they do in KNNImputer), which changes the neighbors of rows tied near the k-th distance.
+
+    algorithm 'kd_tree' (default) or 'ball_tree' : fitted rows are grouped by missingness pattern too. With the nan
+    euclidean distance, the distance between a row and the rows of one fitted group only depends on the features
+    observed in both, scaled by a factor which is the same for the whole group. So one tree per (fitted group,
+    observed features of the incoming pattern), over the distinct values of these features, gives the nearest rows
+    of that group and the nearest rows over all groups are merged from them. Trees are built by fit, transform does
+    not change the fitted object and can be called from several threads.
+
+    Fitted rows tied at the k-th distance are taken in fitted row order, so the output does not depend on the tree
+    or on how incoming rows are blocked together. KNNImputer takes the tied rows its partial sort happens to
+    return, and computes distances as |x|^2+|y|^2-2xy which rounds distances tied in exact arithmetic apart.
+    So a value differs from KNNImputer only where KNNImputer has several fitted rows at its k-th distance
+    (within rounding): the neighbor distances are the same, the tied rows taken are not.
+
+    algorithm 'brute' : distances of a pattern group to every fitted row are one dense masked matrix operation,
+    the terms which only depend on the pattern are computed once per group, with the same arithmetic as
+    KNNImputer. Neighbors are the same as KNNImputer on float64 data, except that a row with fitted rows tied at
+    the k-th distance can get other tied rows where the matrix products of its block round differently.
+
+    leaf_size : leaf size of the trees
+    """
+    def __init__(self, *, missing_values=np.nan, n_neighbors=5, weights="uniform", metric="nan_euclidean",
+                copy=True, add_indicator=False, algorithm="kd_tree", leaf_size=40):
+        super().__init__(missing_values=missing_values, n_neighbors=n_neighbors, weights=weights, metric=metric,
+                        copy=copy, add_indicator=add_indicator)
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+
+    @classmethod
+    def from_knn_imputer(cls, knn_imputer, algorithm:str="kd_tree"):
+        """
+        This function converts a fitted KNNImputer (or a pipeline ending with one, like knn_imputer.pkl)
+        without fitting it again, other objects are returned as they are
+        """
+        try:
+            if isinstance(knn_imputer, Pipeline):
+                name, imputer = knn_imputer.steps[-1]
+                converted = cls.from_knn_imputer(knn_imputer=imputer, algorithm=algorithm)
+                if converted is imputer:
+                    return knn_imputer
+                return Pipeline(steps=knn_imputer.steps[:-1]+[(name, converted)])
+            if type(knn_imputer) is not KNNImputer:
+                return knn_imputer
+
+            check_is_fitted(knn_imputer)
+            imputer = cls(**knn_imputer.get_params(), algorithm=algorithm)
+            # Fitted attributes (_fit_X, _mask_fit_X, _valid_mask, n_features_in_, ...) are reused as they are
+            imputer.__dict__.update({key: value for key,value in knn_imputer.__dict__.items() if key not in imputer.__dict__})
+            imputer._prepare()
+            return imputer
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _is_grouped(self)->bool:
+        """
+        Grouped imputation is used for the default uniform nan euclidean setup only
+        """
+        return (self.weights=="uniform" and self.metric=="nan_euclidean" and not self.add_indicator
+                and isinstance(self.missing_values,float) and np.isnan(self.missing_values))
+
+    def fit(self, X, y=None):
+        try:
+            if self.algorithm not in ALGORITHMS:
+                raise ValueError(f"algorithm: {self.algorithm} is not supported, supported algorithms: {ALGORITHMS}")
+            super().fit(X.astype(np.float64) if hasattr(X, "astype") else np.asarray(X, dtype=np.float64), y)
+            self._prepare()
+            return self
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _prepare(self)->None:
+        """
+        Computing the fitted state used by transform from the fitted rows
+        """
+        if not self._is_grouped():
+            return
+        self._fit_X = np.asarray(self._fit_X, dtype=np.float64)
+        self.col_means_ = np.ma.array(self._fit_X, mask=self._mask_fit_X).mean(axis=0).data
+        self.donors_idx_ = [np.flatnonzero(~self._mask_fit_X[:, col]) for col in range(self._fit_X.shape[1])]
+
+        if self.algorithm=="brute":
+            # Terms of the nan euclidean distance which only depend on the fitted rows
+            fit_X_zeroed = np.where(self._mask_fit_X, 0, self._fit_X)
+            self.fit_X_zeroed_T_ = np.ascontiguousarray(fit_X_zeroed.T)
+            self.fit_X_row_norms_ = np.einsum("ij,ij->i", fit_X_zeroed, fit_X_zeroed)[np.newaxis, :]
+            self.fit_X_squared_T_ = np.ascontiguousarray((fit_X_zeroed*fit_X_zeroed).T)
+            self.missing_fit_X_T_ = np.ascontiguousarray(self._mask_fit_X.T.astype(np.float64))
+            self.present_fit_X_T_ = np.ascontiguousarray((~self._mask_fit_X).T.astype(np.float64))
+            return
+
+        # Groups of fitted rows with the same missingness pattern
+        self.donor_patterns_, donor_group = group_by_pattern(mask=self._mask_fit_X)
+        self.donor_rows_ = np.split(np.argsort(donor_group, kind="stable"), np.cumsum(np.bincount(donor_group))[:-1])
+        # Trees for the patterns of the fitted data, built once here so that transform only reads them
+        self.index_ = dict()
+        for pattern in self.donor_patterns_[self.donor_patterns_.any(axis=1)]:
+            for group in range(len(self.donor_patterns_)):
+                common = ~pattern & ~self.donor_patterns_[group]
+                if common.any() and (group, common.tobytes()) not in self.index_:
+                    self.index_[(group, common.tobytes())] = self._build_index(group=group, common=common)
+
+    def _build_index(self, group:int, common:np.ndarray)->tuple:
+        """
+        Tree over the distinct values of the common features of a group, with the fitted rows of each distinct
+        value in ascending order (offsets into rows), so rows tied at a distance are taken in fitted row order
+        """
+        donor_rows = self.donor_rows_[group]
+        points, inverse = np.unique(self._fit_X[donor_rows][:, common], axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        rows = donor_rows[np.argsort(inverse, kind="stable")]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=points.shape[0]))])
+        return SPATIAL_INDEXES[self.algorithm](points, leaf_size=self.leaf_size), offsets, rows
+
+    def _get_index(self, group:int, common:np.ndarray, build:bool=True):
+        """
+        Returns the tree over the common features of the rows of a group, None if there is no common feature
+        or the tree was not built by fit and build is False. A tree built here is used for this call only
+        """
+        if not common.any():
+            return None
+        index = self.index_.get((group, common.tobytes()))
+        if index is None and build:
+            index = self._build_index(group=group, common=common)
+        return index
+
+    @staticmethod
+    def _nearest_rows(distance:np.ndarray, rows:np.ndarray, n_neighbors:int)->tuple:
+        """
+        Returns the n_neighbors candidates of each query row with the smallest distance, ties by fitted row
+        candidates are padded with infinite distance and a row of -1
+        """
+        order = np.lexsort((np.where(rows<0, np.iinfo(rows.dtype).max, rows), distance), axis=1)[:, :n_neighbors]
+        return np.take_along_axis(distance, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def _query_index(self, index:tuple, query_common:np.ndarray, n_neighbors:int)->tuple:
+        """
+        Nearest fitted rows of a group from its tree, distances are euclidean over the common features
+        The n_neighbors+1 nearest distinct values are queried, if the last one is still tied with the value
+        which completes n_neighbors rows every value at that distance is taken from a radius query
+        """
+        tree, offsets, rows = index
+        n_points = offsets.size-1
+        distance, points = tree.query(query_common, k=min(n_neighbors+1, n_points))
+        counts = offsets[points+1]-offsets[points]
+        boundary = (np.cumsum(counts, axis=1)>=n_neighbors).argmax(axis=1)
+        boundary_distance = distance[np.arange(distance.shape[0]), boundary]
+
+        # Candidates: values up to the boundary distance, each with its first n_neighbors rows
+        candidate_points = np.where(distance<=boundary_distance[:, np.newaxis], points, -1)
+        tied = np.flatnonzero((distance[:, -1]==boundary_distance) & (distance.shape[1]<n_points))
+        if tied.size>0:
+            radius_points, radius_distance = tree.query_radius(query_common[tied], r=boundary_distance[tied]*(1+1e-9),
+                                                            return_distance=True)
+            # Values of the first query are kept as well, whatever the radius query returns at its boundary
+            radius_candidates = []
+            for row,row_points,row_distance in zip(tied, radius_points, radius_distance):
+                row_points = np.concatenate([points[row], row_points[row_distance<=boundary_distance[row]]])
+                row_distance = np.concatenate([distance[row], row_distance[row_distance<=boundary_distance[row]]])
+                row_points, first = np.unique(row_points, return_index=True)
+                keep = row_distance[first]<=boundary_distance[row]
+                radius_candidates.append((row_points[keep], row_distance[first][keep]))
+            width = max(distance.shape[1], max(row_points.size for row_points,_ in radius_candidates))
+            candidate_points = np.pad(candidate_points, ((0, 0), (0, width-distance.shape[1])), constant_values=-1)
+            distance = np.pad(distance, ((0, 0), (0, width-distance.shape[1])), constant_values=np.inf)
+            for row,(row_points,row_distance) in zip(tied, radius_candidates):
+                candidate_points[row] = -1
+                candidate_points[row, :row_points.size] = row_points
+                distance[row] = np.inf
+                distance[row, :row_points.size] = row_distance
+
+        valid = candidate_points>=0
+        candidate_points = np.where(valid, candidate_points, 0)
+        start, count = offsets[candidate_points], np.where(valid, offsets[candidate_points+1]-offsets[candidate_points], 0)
+        rank = np.arange(n_neighbors)
+        has_row = rank<count[..., np.newaxis]
+        candidate_rows = np.where(has_row, rows[np.where(has_row, start[..., np.newaxis]+rank, 0)], -1)
+        candidate_distance = np.where(has_row, distance[..., np.newaxis], np.inf)
+        return self._nearest_rows(distance=candidate_distance.reshape(distance.shape[0], -1),
+                                rows=candidate_rows.reshape(distance.shape[0], -1), n_neighbors=n_neighbors)
+
+    def _query_group(self, query_X:np.ndarray, observed:np.ndarray, group:int):
+        """
+        Returns the nearest rows of a group to query rows (all with the same observed features) with their
+        nan euclidean distances, distance is infinite when there is no common observed feature
+        Distances are summed feature by feature in the same order with or without a tree, so a row gets the same
+        neighbors whichever way its group is searched
+        """
+        donor_rows = self.donor_rows_[group]
+        n_neighbors = min(self.n_neighbors, donor_rows.size)
+        common = observed & ~self.donor_patterns_[group]
+        if not common.any():
+            return (np.full((query_X.shape[0], n_neighbors), np.inf),
+                    np.broadcast_to(donor_rows[:n_neighbors], (query_X.shape[0], n_neighbors)))
+
+        scale = np.sqrt(observed.size/common.sum())
+        # A few rows of a pattern without tree are not worth building one, they are compared with every row of the group
+        index = self._get_index(group=group, common=common, build=query_X.shape[0]>=self.leaf_size)
+        if index is not None:
+            distance, neighbors = self._query_index(index=index, query_common=query_X[:, common], n_neighbors=n_neighbors)
+            return distance*scale, neighbors
+
+        fit_X, query_common = self._fit_X[donor_rows][:, common], query_X[:, common]
+        squared_distance = np.zeros((query_X.shape[0], donor_rows.size))
+        for col in range(fit_X.shape[1]):
+            difference = query_common[:, col, np.newaxis]-fit_X[np.newaxis, :, col]
+            squared_distance += difference*difference
+        distance = np.sqrt(squared_distance, out=squared_distance)
+        # Candidates up to the k-th distance, ties included, in fitted row order
+        kth_distance = np.partition(distance, n_neighbors-1, axis=1)[:, n_neighbors-1:n_neighbors]
+        candidates = [np.flatnonzero(row_distance<=row_kth) for row_distance,row_kth in zip(distance, kth_distance)]
+        width = max(row_candidates.size for row_candidates in candidates)
+        candidate_distance = np.full((query_X.shape[0], width), np.inf)
+        candidate_rows = np.full((query_X.shape[0], width), -1, dtype=donor_rows.dtype)
+        for row,row_candidates in enumerate(candidates):
+            candidate_distance[row, :row_candidates.size] = distance[row, row_candidates]
+            candidate_rows[row, :row_candidates.size] = donor_rows[row_candidates]
+        distance, neighbors = self._nearest_rows(distance=candidate_distance, rows=candidate_rows, n_neighbors=n_neighbors)
+        return distance*scale, neighbors
+
+    def _impute_group_indexed(self, X:np.ndarray, receivers:np.ndarray, pattern:np.ndarray)->None:
+        query_X = X[receivers]
+        # Nearest rows of each fitted group, shared by all missing columns of this pattern
+        group_neighbors = dict()
+        for col in np.flatnonzero(pattern):
+            donor_groups = np.flatnonzero(~self.donor_patterns_[:, col])
+            if donor_groups.size==0:
+                continue
+            for donor_group in donor_groups:
+                if donor_group not in group_neighbors:
+                    group_neighbors[donor_group] = self._query_group(query_X=query_X, observed=~pattern, group=donor_group)
+            distances = np.hstack([group_neighbors[donor_group][0] for donor_group in donor_groups])
+            donors = np.hstack([group_neighbors[donor_group][1] for donor_group in donor_groups])
+
+            # Nearest first, ties by fitted row order
+            n_neighbors = min(self.n_neighbors, donors.shape[1])
+            order = np.lexsort((donors, distances))[:, :n_neighbors]
+            neighbors = np.take_along_axis(donors, order, axis=1)
+            values = self._fit_X[neighbors, col].mean(axis=1)
+            # Rows without any common feature with fitted rows get the column mean
+            no_common = np.isinf(np.take_along_axis(distances, order[:, :1], axis=1)).ravel()
+            values[no_common] = self.col_means_[col]
+            X[receivers, col] = values
+
+    def _dense_distances(self, query_X:np.ndarray, mask:np.ndarray)->np.ndarray:
+        """
+        Nan euclidean distances of rows to every fitted row, same arithmetic as sklearn nan_euclidean_distances
+        mask : missingness pattern shared by all rows (1d), the terms which only depend on it are computed once,
+        or missing mask of each row (2d)
+        """
+        zeroed = np.where(mask, 0, query_X)
+        missing = np.atleast_2d(mask).astype(np.float64)
+        distances = -2*np.dot(zeroed, self.fit_X_zeroed_T_)
+        distances += np.einsum("ij,ij->i", zeroed, zeroed)[:, np.newaxis]
+        distances += self.fit_X_row_norms_
+        np.maximum(distances, 0, out=distances)
+        distances -= np.dot(zeroed*zeroed, self.missing_fit_X_T_)
+        distances -= np.dot(missing, self.fit_X_squared_T_)
+        np.clip(distances, 0, None, out=distances)
+        present_count = np.dot(1-missing, self.present_fit_X_T_)
+        distances[np.broadcast_to(present_count==0, distances.shape)] = np.nan
+        np.maximum(1, present_count, out=present_count)
+        distances /= present_count
+        distances *= query_X.shape[1]
+        return np.sqrt(distances, out=distances)
+
+    def _impute_dense(self, X:np.ndarray, receivers:np.ndarray, mask:np.ndarray)->None:
+        """
+        Imputes receivers from dense distances to every fitted row, in blocks of bounded memory
+        mask : missingness pattern shared by all receivers (1d) or missing mask of X (2d)
+        """
+        chunk_size = max(1, MAX_DISTANCE_ELEMENTS//self._fit_X.shape[0])
+        for start in range(0, receivers.size, chunk_size):
+            rows = receivers[start:start+chunk_size]
+            rows_mask = mask if mask.ndim==1 else mask[rows]
+            distances = self._dense_distances(query_X=X[rows], mask=rows_mask)
+            for col in np.flatnonzero(np.atleast_2d(rows_mask).any(axis=0)):
+                col_receivers = np.arange(rows.size) if mask.ndim==1 else np.flatnonzero(rows_mask[:, col])
+                donors_idx = self.donors_idx_[col]
+                dist_subset = distances[col_receivers][:, donors_idx]
+                # Receivers without any common observed feature get the column mean
+                all_nan_dist = np.isnan(dist_subset).all(axis=1)
+                X[rows[col_receivers[all_nan_dist]], col] = self.col_means_[col]
+                if all_nan_dist.all():
+                    continue
+                col_receivers, dist_subset = col_receivers[~all_nan_dist], dist_subset[~all_nan_dist]
+                n_neighbors = min(self.n_neighbors, donors_idx.size)
+                X[rows[col_receivers], col] = self._calc_impute(dist_subset, n_neighbors, self._fit_X[donors_idx, col],
+                                                                self._mask_fit_X[donors_idx, col])
+
+    def _can_impute_in_place(self)->bool:
+        """
+        True if rows are imputed by _impute, otherwise transform is the one of KNNImputer
+        (other weights or metric, or columns without any fitted value which KNNImputer drops)
+        """
+        return self._is_grouped() and hasattr(self, "col_means_") and bool(self._valid_mask.all())
+
+    def _impute(self, X:np.ndarray)->np.ndarray:
+        """
+        Imputes float64 rows in feature order in place, rows without null values are not touched
+        """
+        mask = np.isnan(X)
+        row_missing_idx = np.flatnonzero(mask.any(axis=1))
+        if row_missing_idx.size==0:
+            return X
+
+        query_patterns, query_group = group_by_pattern(mask=mask[row_missing_idx])
+        query_rows = np.split(row_missing_idx[np.argsort(query_group, kind="stable")], np.cumsum(np.bincount(query_group))[:-1])
+        rare_rows = []
+        for pattern,receivers in zip(query_patterns, query_rows):
+            if self.algorithm!="brute":
+                self._impute_group_indexed(X=X, receivers=receivers, pattern=pattern)
+            elif receivers.size>=MIN_GROUP_SIZE:
+                self._impute_dense(X=X, receivers=receivers, mask=pattern)
+            else:
+                rare_rows.append(receivers)
+        if len(rare_rows)>0:
+            self._impute_dense(X=X, receivers=np.sort(np.concatenate(rare_rows)), mask=mask)
+        return X
+
+    def transform(self, X):
+        try:
+            check_is_fitted(self)
+            if not self._can_impute_in_place():
+                return super().transform(X)
+
+            X = self._validate_data(X, accept_sparse=False, dtype=np.float64, force_all_finite="allow-nan",
+                                    copy=self.copy, reset=False)
+            return self._impute(X)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
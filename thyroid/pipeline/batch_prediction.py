@@ -1,15 +1,25 @@
 import os,sys
+import time
+import multiprocessing
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from thyroid import utils
+from thyroid import utils, schema
 from thyroid.logger import logging
 from thyroid.utils import load_object
 from thyroid.config import TARGET_COLUMN
 from thyroid.entity import config_entity
+from thyroid import predictor
 from thyroid.predictor import ModelResolver
 from thyroid.exception import ThyroidException
+from thyroid.baseline_profile import BaselineProfile
+from thyroid.imputer import PatternKNNImputer
+from thyroid.preprocessor import ThyroidPreprocessor
+from thyroid.serving.prediction_cache import PredictionCache
 from thyroid.components.data_validation import DataValidation
 from thyroid.entity.config_entity import DataValidationConfig
 
@@ -17,44 +27,208 @@ from thyroid.entity.config_entity import DataValidationConfig
 PREDICTION_DIR= "prediction"
 VALIDATION_DIR= "validation_report"
 
-validation_error=dict()
-
 
 base_file_path = os.path.join("hypothyroid.csv")
 
+# Predictions of repeated feature vectors are reused across files of the same process
+prediction_cache = PredictionCache(max_size=1000000, ttl_seconds=24*60*60)
+
+
+def get_report_file_path(input_file_path:str)->str:
+    """
+    Validation report of one input file, named after the file so that files predicted in parallel keep their own report
+    """
+    file_name = os.path.splitext(os.path.basename(input_file_path))[0]
+    return os.path.join(PREDICTION_DIR, VALIDATION_DIR, f"{file_name}_report.yaml")
+
+
+class BatchPredictionObjects:
+    """
+    This class loads everything batch prediction needs from the latest model version once:
+    baseline profile, preprocessor, knn imputer, model and target encoder, so several files can be predicted with them
+    """
+    def __init__(self, model_registry:str="saved_models"):
+        try:
+            logging.info("Creating model resolver object")
+            self.model_resolver = ModelResolver(model_registry=model_registry)   # Location where models are saved
+            self.model_version = self.model_resolver.get_latest_dir_path()
+
+            baseline_profile_path = self.model_resolver.get_latest_baseline_profile_path()
+            if os.path.exists(baseline_profile_path):
+                logging.info(f"Loading baseline profile: {baseline_profile_path}")
+                self.baseline_profile = BaselineProfile.load(file_path=baseline_profile_path)
+            else:
+                # Model versions pushed before baseline profiles were saved
+                logging.info(f"Baseline profile not found, building it from base file: {base_file_path}")
+                base_df = schema.read_csv(file_path=base_file_path)
+                self.baseline_profile = BaselineProfile.from_dataframe(df=base_df)
+
+            logging.info(f"Loading preprocessor, knn imputer, model and target encoder of version: {self.model_version}")
+            # Rows are imputed grouped by missingness pattern with kd-trees, a saved sklearn KNNImputer is converted without refitting
+            self.knn_imputer = PatternKNNImputer.from_knn_imputer(knn_imputer=load_object(file_path=self.model_resolver.get_latest_knn_imputer_path()))
+            # Fill values of the training set, every file and chunk is preprocessed with the same values
+            self.preprocessor = ThyroidPreprocessor.load(file_path=self.model_resolver.get_latest_preprocessor_path(), knn_imputer=self.knn_imputer)
+            self.model = load_object(file_path=self.model_resolver.get_latest_model_path())
+            self.target_encoder = load_object(file_path=self.model_resolver.get_latest_target_encoder_path())
+            self.input_feature_names = list(self.knn_imputer.feature_names_in_)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def impute_and_predict(self, feature_arr:np.ndarray)->np.ndarray:
+        input_arr = self.knn_imputer.transform(pd.DataFrame(feature_arr, columns=self.input_feature_names))
+        return self.model.predict(input_arr)
+
+    def predict(self, df:pd.DataFrame)->np.ndarray:
+        """
+        Only feature vectors which are not cached for the loaded model version are imputed and predicted
+        """
+        return prediction_cache.predict(input_arr=df[self.input_feature_names].to_numpy(dtype=np.float64),
+                                        model_version=self.model_version, predict_fn=self.impute_and_predict)
+
+
+class ChunkStatistics:
+    """
+    This class accumulates the validation statistics of an input file chunk by chunk:
+    null counts, data types and distinct values
+    """
+    def __init__(self):
+        self.n_rows = 0
+        self.null_counts = None
+        self.dtypes = dict()
+        self.distinct_values = dict()
+
+    def update(self, df:pd.DataFrame)->None:
+        try:
+            self.n_rows += df.shape[0]
+            null_counts = df.isna().sum()
+            self.null_counts = null_counts if self.null_counts is None else self.null_counts.add(null_counts, fill_value=0)
+            for column in df.columns:
+                self.dtypes.setdefault(column, []).append(df[column].dtype)
+                self.distinct_values.setdefault(column, set()).update(df[column].dropna().unique())
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def null_ratio(self)->pd.Series:
+        return self.null_counts/self.n_rows
+
+    def combined_dtypes(self)->dict:
+        """
+        Data type each column would get if the whole file was read at once
+        """
+        combined = dict()
+        for column,dtypes in self.dtypes.items():
+            # Category columns with categories inferred per chunk have the same dtype name
+            if all(str(dtype)==str(dtypes[0]) for dtype in dtypes):
+                combined[column] = dtypes[0]
+            elif any(dtype==object for dtype in dtypes):
+                combined[column] = np.dtype(object)
+            else:
+                combined[column] = np.result_type(*dtypes)
+        return combined
+
+    def n_classes(self)->dict:
+        """
+        Number of distinct values, compared as text for object columns as chunks of one column may be parsed as numbers or text
+        """
+        combined_dtypes = self.combined_dtypes()
+        return {column: len({str(value) for value in values}) if combined_dtypes[column]==object else len(values)
+                for column,values in self.distinct_values.items()}
+
+
+def stream_batch_prediction(input_file_path:str, chunk_size:int, prediction_objects:Optional[BatchPredictionObjects]=None)->str:
+    """
+    Batch prediction reading the input file in chunks of chunk_size rows so that memory stays bounded
+
+    First pass accumulates validation and drift statistics over all chunks, second pass preprocesses with the
+    fill values of the model version, imputes, predicts and decodes each chunk and appends it to the prediction file
+    """
+    try:
+        os.makedirs(PREDICTION_DIR,exist_ok=True)
+        report_file_dir = os.path.join(PREDICTION_DIR, VALIDATION_DIR)
+        os.makedirs(report_file_dir, exist_ok=True)
+
+        if prediction_objects is None:
+            prediction_objects = BatchPredictionObjects()
+        model_resolver = prediction_objects.model_resolver
+
+        # Validation
+        logging.info(f"Accumulating validation statistics of file: {input_file_path} in chunks of {chunk_size} rows")
+        chunk_statistics = ChunkStatistics()
+        for df in schema.read_csv(file_path=input_file_path, chunksize=chunk_size):
+            chunk_statistics.update(df=df)
+
+        null_ratio = chunk_statistics.null_ratio()
+        drop_column_names = list(null_ratio[null_ratio>predictor.missing_threshold].index)
+        logging.info(f"Columns to drop from input: {drop_column_names}")
+        # Report of this file only, a worker predicting several files starts each one with a new report
+        validation_error = {"missing_values_within_input_df": drop_column_names}
+        current_columns = [column for column in null_ratio.index if column not in drop_column_names]
+
+        logging.info("Checking required columns and data drift against baseline profile")
+        validation_error = model_resolver.validate_with_baseline_profile(baseline_profile=prediction_objects.baseline_profile,
+                                current_columns=current_columns, current_dtypes=chunk_statistics.combined_dtypes(),
+                                current_n_classes=chunk_statistics.n_classes(), validation_error=validation_error)
+        utils.write_yaml_file(file_path=get_report_file_path(input_file_path=input_file_path), data=validation_error)
+
+        prediction_file_name = os.path.basename(input_file_path).replace(".csv",f"{datetime.now().strftime('%m%d%Y__%H%M%S')}.csv")
+        prediction_file_path = os.path.join(PREDICTION_DIR,prediction_file_name)
+
+        logging.info(f"Predicting chunks and appending to: {prediction_file_path}")
+        for chunk_number,df in enumerate(schema.read_csv(file_path=input_file_path, chunksize=chunk_size)):
+            df.drop(columns=[column for column in drop_column_names if column in df.columns], inplace=True)
+            df = prediction_objects.preprocessor.transform(df)
+
+            prediction = prediction_objects.predict(df=df)
+            df["prediction"]=prediction
+            df["cat_pred"]=prediction_objects.target_encoder.inverse_transform(prediction)
+
+            # Header only with the first chunk
+            df.to_csv(prediction_file_path, mode="w" if chunk_number==0 else "a", index=False, header=chunk_number==0)
+
+        logging.info(f"Prediction cache: {prediction_cache.get_stats()}")
+        return prediction_file_path
+
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
 
-def start_batch_prediction(input_file_path):
+def start_batch_prediction(input_file_path, chunk_size:Optional[int]=None, prediction_objects:Optional[BatchPredictionObjects]=None):
+    """
+    Batch prediction of input_file_path, whole file is read at once unless chunk_size (rows) is given
+    prediction_objects : already loaded model version objects, loaded from the registry if not given
+    """
     try:
+        if chunk_size is not None:
+            return stream_batch_prediction(input_file_path=input_file_path, chunk_size=chunk_size, prediction_objects=prediction_objects)
+
         os.makedirs(PREDICTION_DIR,exist_ok=True)
         report_file_dir = os.path.join(PREDICTION_DIR, VALIDATION_DIR)
         os.makedirs(report_file_dir, exist_ok=True)
 
-        logging.info("Creating model resolver object")
-        model_resolver = ModelResolver(model_registry="saved_models")   # Location where models are saved
+        if prediction_objects is None:
+            prediction_objects = BatchPredictionObjects()
+        model_resolver = prediction_objects.model_resolver
         logging.info(f"Reading file :{input_file_path}")
-        df = pd.read_csv(input_file_path)
-        base_df= pd.read_csv(base_file_path)
-        logging.info("Replace '?' value to nan in base and input df")
-        df.replace({"?":np.NAN},inplace=True)
-        base_df.replace({"?":np.NAN},inplace=True)
+        # '?' is read as null
+        df = schema.read_csv(file_path=input_file_path)
         
         # Validation
         logging.info("Validating input file")
         try:
             logging.info("Dropping missing value columns from current df")
-            df = model_resolver.drop_missing_values_columns(df=df,report_key_name="missing_values_within_input_df")
-            logging.info("Dropping missing value columns from base df")
-            base_df = model_resolver.drop_missing_values_columns(df=base_df,report_key_name="missing_values_within_base_dataset")
-
-            logging.info("Checking required columns in current df")
-            current_column_status = model_resolver.is_required_columns_exists(base_df=base_df, current_df=df, report_key_name="missing_columns_within_input_dataset")
-
-            logging.info("Checking data drift current df")
-            if current_column_status:
-                validation_error = model_resolver.data_drift(base_df=base_df, current_df=df, report_key_name="data_drift_within_input_dataset")
+            # Report of this file only, a worker predicting several files starts each one with a new report
+            validation_error = dict()
+            df = model_resolver.drop_missing_values_columns(df=df,report_key_name="missing_values_within_input_df",
+                                                            validation_error=validation_error)
+            logging.info("Checking required columns and data drift of current df against baseline profile")
+            current_dtypes, current_n_classes = BaselineProfile.get_current_statistics(df=df)
+            validation_error = model_resolver.validate_with_baseline_profile(baseline_profile=prediction_objects.baseline_profile,
+                                    current_columns=list(df.columns), current_dtypes=current_dtypes, current_n_classes=current_n_classes,
+                                    validation_error=validation_error)
 
-            # Creating directory to save prediction file
-            report_file_path = os.path.join(report_file_dir,"report.yaml")
+            report_file_path = get_report_file_path(input_file_path=input_file_path)
 
             utils.write_yaml_file(file_path=report_file_path, data=validation_error)
 
@@ -63,33 +237,19 @@ def start_batch_prediction(input_file_path):
 
         logging.info("Data Transformation")
         try:
-            df = model_resolver.feature_encoding(df=df)
-            exclude_columns = [TARGET_COLUMN]
-            utils.convert_columns_float(df=df, exclude_columns=exclude_columns)
-            df = model_resolver.handling_null_value_and_outliers(df=df)
+            df = prediction_objects.preprocessor.transform(df)
 
         except Exception as e:
             raise ThyroidException(e, sys)
 
-        # Loading knn_imputer
-        logging.info("Loading knn imputer to get dataset")
-        knn_imputer = load_object(file_path=model_resolver.get_latest_knn_imputer_path())
-        
-        # Getting input features
-        input_feature_names =  list(knn_imputer.feature_names_in_)
-        # data frame
-        input_arr = knn_imputer.transform(df[input_feature_names])
-
         # Prediction    
-        logging.info("Loading model to make prediction")
-        model = load_object(file_path=model_resolver.get_latest_model_path())
-        prediction = model.predict(input_arr)
+        logging.info("Predicting with loaded model")
+        prediction = prediction_objects.predict(df=df)
+        logging.info(f"Prediction cache: {prediction_cache.get_stats()}")
 
         # Target decoding   
         logging.info("Target encoder to convert predicted column into categorical")
-        target_encoder = load_object(file_path=model_resolver.get_latest_target_encoder_path())
-
-        cat_prediction = target_encoder.inverse_transform(prediction)
+        cat_prediction = prediction_objects.target_encoder.inverse_transform(prediction)
 
         df["prediction"]=prediction
         df["cat_pred"]=cat_prediction
@@ -106,3 +266,105 @@ def start_batch_prediction(input_file_path):
 
     except Exception as e:
         raise ThyroidException(e, sys)
+
+
+# Objects loaded by the parent process, forked workers inherit them without unpickling again
+worker_prediction_objects:Optional[BatchPredictionObjects] = None
+
+
+def predict_file(input_file_path:str, chunk_size:Optional[int]=None)->dict:
+    """
+    Predicts one file in a worker process, a failure is returned in the summary instead of raised
+    """
+    global worker_prediction_objects
+    start_time = time.time()
+    try:
+        # Workers started with spawn do not inherit the parent objects
+        if worker_prediction_objects is None:
+            worker_prediction_objects = BatchPredictionObjects()
+        prediction_file_path = start_batch_prediction(input_file_path=input_file_path, chunk_size=chunk_size,
+                                                    prediction_objects=worker_prediction_objects)
+        return {"input_file_path": input_file_path, "status": "success", "prediction_file_path": prediction_file_path,
+                "error": None, "seconds": round(time.time()-start_time, 3)}
+    except Exception as e:
+        logging.info(f"Prediction of file: {input_file_path} failed: {e}")
+        return failed_file(input_file_path=input_file_path, error=e, seconds=time.time()-start_time)
+
+
+def failed_file(input_file_path:str, error:Exception, seconds:float=0.0)->dict:
+    return {"input_file_path": input_file_path, "status": "failed", "prediction_file_path": None,
+            "error": f"{type(error).__name__}: {error}", "seconds": round(seconds, 3)}
+
+
+def predict_files_in_pool(input_file_paths:list, n_workers:int, chunk_size:Optional[int], mp_context)->tuple:
+    """
+    One future per file, a future which raises is recorded as a failed file
+    returns status of each file by path and the paths whose worker process died (pool broken)
+    """
+    files = dict()
+    broken_file_paths = []
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context) as executor:
+        futures = {input_file_path: executor.submit(predict_file, input_file_path, chunk_size) for input_file_path in input_file_paths}
+        for input_file_path,future in futures.items():
+            try:
+                files[input_file_path] = future.result()
+            except BrokenProcessPool as e:
+                broken_file_paths.append(input_file_path)
+                files[input_file_path] = failed_file(input_file_path=input_file_path, error=e)
+            except Exception as e:
+                files[input_file_path] = failed_file(input_file_path=input_file_path, error=e)
+    return files, broken_file_paths
+
+
+def start_parallel_batch_prediction(input_dir:str, n_workers:Optional[int]=None, chunk_size:Optional[int]=None)->dict:
+    """
+    This function predicts every file of input_dir across a process pool
+    Model version objects are loaded once in the parent process and shared with the workers through fork,
+    a file which fails is recorded in the summary and does not stop the other files. When a worker process
+    dies (e.g. killed out of memory) every pending file of the pool fails, these files are retried one
+    pool per file so that only the file killing its worker stays failed
+    input_dir : directory of input csv files
+    n_workers : number of worker processes, number of cpus by default
+    chunk_size : rows per chunk for streaming prediction of each file
+    =========================================================================================
+    returns summary with the status of each file, also saved as yaml in the prediction directory
+    """
+    global worker_prediction_objects
+    try:
+        start_time = time.time()
+        input_file_paths = [os.path.join(input_dir,file_name) for file_name in sorted(os.listdir(input_dir))
+                            if os.path.isfile(os.path.join(input_dir,file_name))]
+        n_workers = min(n_workers or os.cpu_count() or 1, max(len(input_file_paths),1))
+        logging.info(f"Predicting {len(input_file_paths)} files from: {input_dir} with {n_workers} workers")
+
+        worker_prediction_objects = BatchPredictionObjects()
+        if "fork" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("fork")
+        else:
+            mp_context = multiprocessing.get_context()
+
+        files, broken_file_paths = predict_files_in_pool(input_file_paths=input_file_paths, n_workers=n_workers,
+                                                        chunk_size=chunk_size, mp_context=mp_context)
+        for input_file_path in broken_file_paths:
+            logging.info(f"Worker process died while predicting pending files, retrying file alone: {input_file_path}")
+            retried_files, _ = predict_files_in_pool(input_file_paths=[input_file_path], n_workers=1,
+                                                    chunk_size=chunk_size, mp_context=mp_context)
+            files.update(retried_files)
+        files = [files[input_file_path] for input_file_path in input_file_paths]
+
+        summary = {"model_version": worker_prediction_objects.model_version,
+                    "n_files": len(files),
+                    "n_success": sum(file["status"]=="success" for file in files),
+                    "n_failed": sum(file["status"]=="failed" for file in files),
+                    "n_workers": n_workers,
+                    "seconds": round(time.time()-start_time, 3),
+                    "files": files}
+
+        os.makedirs(PREDICTION_DIR,exist_ok=True)
+        summary_file_path = os.path.join(PREDICTION_DIR,f"batch_summary_{datetime.now().strftime('%m%d%Y__%H%M%S')}.yaml")
+        utils.write_yaml_file(file_path=summary_file_path, data=summary)
+        logging.info(f"Batch prediction summary saved at: {summary_file_path}, success: {summary['n_success']}, failed: {summary['n_failed']}")
+        return summary
+
+    except Exception as e:
+        raise ThyroidException(e, sys)
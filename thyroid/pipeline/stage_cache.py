@@ -0,0 +1,197 @@
+import os, sys
+import json
+import hashlib
+from datetime import datetime
+from typing import Callable, Optional
+from dataclasses import asdict
+
+from thyroid import utils
+from thyroid.logger import logging
+from thyroid.exception import ThyroidException
+
+
+MANIFEST_FILE_NAME = "manifest.yaml"
+STAGES = ["data_ingestion", "data_validation", "data_transformation", "model_trainer", "model_evaluation", "model_pusher"]
+
+# Part of every stage key, bump the version of a stage whenever its code changes what it writes or the
+# layout of its artifact files, so records of earlier versions are never returned as hits
+# data_transformation 3: x/y arrays with a header.yaml and float64 PatternKNNImputer, model_trainer 2: reads them
+# data_transformation 4: kd_tree PatternKNNImputer, ties at the k-th distance taken in fitted row order
+STAGE_FORMAT_VERSIONS = {"data_validation": 1, "data_transformation": 4, "model_trainer": 2}
+
+
+def get_file_hash(file_path:str)->str:
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file_reader:
+        for block in iter(lambda: file_reader.read(1<<20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def artifact_to_record(artifact)->dict:
+    """
+    Artifact values and the files they point to, json round trip turns numpy scalars into python values
+    """
+    artifact_values = json.loads(json.dumps(asdict(artifact), default=float))
+    file_paths = [value for value in artifact_values.values() if isinstance(value, str) and os.path.exists(value)]
+    return {"artifact": artifact_values, "file_paths": file_paths}
+
+
+def artifact_from_record(record:dict, artifact_class):
+    """
+    Returns the artifact of the record, None if one of its files is gone
+    """
+    missing_files = [file_path for file_path in record["file_paths"] if not os.path.exists(file_path)]
+    if len(missing_files)>0:
+        logging.info(f"{artifact_class.__name__} is missing files: {missing_files}")
+        return None
+    return artifact_class(**record["artifact"])
+
+
+class StageCache:
+    """
+    This class memoizes pipeline stages by content: the key of a stage is a hash of its config and inputs,
+    where every value which is an existing file is hashed by its content, so paths of earlier runs give the
+    same key as byte identical files of the current run. Config paths inside the current artifact dir are left out,
+    the layout of the files a stage writes is covered by its STAGE_FORMAT_VERSIONS entry instead.
+
+    Records are the *Artifact dataclasses of artifact_entity saved as yaml in cache_dir/<stage>/<key>.yaml,
+    on a hit the artifact of the earlier run is returned (its files are used where they are).
+    """
+    def __init__(self, cache_dir:str, artifact_dir:str, force_from_stage:Optional[str]=None):
+        try:
+            if force_from_stage is not None and force_from_stage not in STAGES:
+                raise Exception(f"Unknown stage: {force_from_stage}, stages are {STAGES}")
+            self.cache_dir = cache_dir
+            self.artifact_dir = artifact_dir
+            self.force_from_stage = force_from_stage
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def describe_value(self, value):
+        """
+        Content hash for existing files, value otherwise
+        """
+        if isinstance(value, str) and os.path.isfile(value):
+            return {"file_hash": get_file_hash(value)}
+        if isinstance(value, dict):
+            return {str(name): self.describe_value(item) for name,item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.describe_value(item) for item in value]
+        return repr(value)
+
+    def get_stage_key(self, stage:str, config, inputs:list)->str:
+        """
+        stage : name of the stage
+        config : config entity of the stage
+        inputs : artifacts the stage reads
+        """
+        try:
+            config_values = {name: value for name,value in vars(config).items()
+                            if not (isinstance(value, str) and value.startswith(self.artifact_dir))}
+            description = {"stage": stage,
+                        "format_version": STAGE_FORMAT_VERSIONS.get(stage, 1),
+                        "config": self.describe_value(config_values),
+                        "inputs": [{"type": type(artifact).__name__, "values": self.describe_value(asdict(artifact))} for artifact in inputs]}
+            return hashlib.blake2b(json.dumps(description, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_record_path(self, stage:str, key:str)->str:
+        return os.path.join(self.cache_dir, stage, f"{key}.yaml")
+
+    def is_forced(self, stage:str)->bool:
+        return self.force_from_stage is not None and STAGES.index(stage)>=STAGES.index(self.force_from_stage)
+
+    def load(self, stage:str, key:str, artifact_class):
+        """
+        Returns the cached artifact, None if there is no record or one of its files is gone
+        """
+        record_path = self.get_record_path(stage=stage, key=key)
+        if not os.path.exists(record_path):
+            return None
+        record = utils.read_yaml_file(file_path=record_path)
+        return artifact_from_record(record=record, artifact_class=artifact_class)
+
+    def save(self, stage:str, key:str, artifact)->None:
+        utils.write_yaml_file(file_path=self.get_record_path(stage=stage, key=key),
+                            data={"stage": stage, "artifact_dir": self.artifact_dir, **artifact_to_record(artifact=artifact)})
+
+    def run(self, stage:str, config, inputs:list, artifact_class, initiate:Callable):
+        """
+        This function returns the cached artifact of the stage on a hit, otherwise calls initiate and caches its artifact
+        """
+        try:
+            key = self.get_stage_key(stage=stage, config=config, inputs=inputs)
+            if self.is_forced(stage=stage):
+                logging.info(f"Recomputing {stage} as recomputation is forced from {self.force_from_stage}")
+            else:
+                artifact = self.load(stage=stage, key=key, artifact_class=artifact_class)
+                if artifact is not None:
+                    logging.info(f"Reusing cached {stage} artifact for key {key}: {artifact}")
+                    return artifact
+
+            artifact = initiate()
+            self.save(stage=stage, key=key, artifact=artifact)
+            return artifact
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+class StageManifest:
+    """
+    This class records the artifact of every completed stage in artifact_dir/manifest.yaml, so that a failed
+    run can be resumed in the same artifact dir: completed stages are rebuilt from the manifest and the
+    pipeline continues at the first incomplete stage.
+    """
+    def __init__(self, artifact_dir:str):
+        try:
+            self.artifact_dir = artifact_dir
+            self.manifest_path = os.path.join(artifact_dir, MANIFEST_FILE_NAME)
+            self.stages = dict()
+            if os.path.exists(self.manifest_path):
+                self.stages = utils.read_yaml_file(file_path=self.manifest_path)["stages"]
+                logging.info(f"Completed stages in {artifact_dir}: {list(self.stages)}")
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_artifact(self, stage:str, artifact_class):
+        """
+        Returns the artifact of a completed stage or None
+        """
+        if stage not in self.stages:
+            return None
+        return artifact_from_record(record=self.stages[stage], artifact_class=artifact_class)
+
+    def complete(self, stage:str, artifact)->None:
+        """
+        Recording the stage, later stages are dropped as they were built from an earlier artifact of this stage
+        manifest file is replaced at once so that a crash never leaves it half written
+        """
+        for later_stage in STAGES[STAGES.index(stage)+1:]:
+            self.stages.pop(later_stage, None)
+        self.stages[stage] = {"completed_at": datetime.now().isoformat(), **artifact_to_record(artifact=artifact)}
+        temp_path = f"{self.manifest_path}.tmp"
+        utils.write_yaml_file(file_path=temp_path, data={"artifact_dir": self.artifact_dir, "stages": self.stages})
+        os.replace(temp_path, self.manifest_path)
+
+    def run(self, stage:str, artifact_class, initiate:Callable):
+        """
+        This function returns the artifact of the stage from the manifest when it is completed, otherwise calls initiate
+        """
+        try:
+            artifact = self.get_artifact(stage=stage, artifact_class=artifact_class)
+            if artifact is not None:
+                logging.info(f"Resuming after completed {stage}: {artifact}")
+                return artifact
+
+            artifact = initiate()
+            self.complete(stage=stage, artifact=artifact)
+            return artifact
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
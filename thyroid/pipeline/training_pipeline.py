@@ -15,56 +15,77 @@ from thyroid.components.model_pusher import ModelPusher
 from thyroid.components.data_transformation import DataTransformation
 from thyroid.components.model_trainer import ModelTrainer
 from thyroid.components.model_evaluation import ModelEvaluation
+from thyroid.pipeline.stage_cache import StageCache, StageManifest
 
 
 
 
 
-def start_training_pipeline():
+def start_training_pipeline(force_from_stage:str=None, resume:str=None):
+     """
+     Validation, transformation and training reuse the artifact of an earlier run when their config and input
+     files are byte identical, force_from_stage recomputes the given stage and every stage after it
+     resume : artifact dir of an earlier run, its completed stages are rebuilt from its manifest and
+     the run continues at the first incomplete stage
+     """
      try:
-         training_pipeline_config = config_entity.TrainingPipelineConfig()
+         training_pipeline_config = config_entity.TrainingPipelineConfig(artifact_dir=resume)
+         stage_cache = StageCache(cache_dir=training_pipeline_config.stage_cache_dir,
+                        artifact_dir=training_pipeline_config.artifact_dir, force_from_stage=force_from_stage)
+         stage_manifest = StageManifest(artifact_dir=training_pipeline_config.artifact_dir)
 
          #data ingestion         
          data_ingestion_config  = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
          print(data_ingestion_config.to_dict())
-         data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
-         data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
+         data_ingestion_artifact = stage_manifest.run(stage="data_ingestion", artifact_class=artifact_entity.DataIngestionArtifact,
+                        initiate=lambda: DataIngestion(data_ingestion_config=data_ingestion_config).initiate_data_ingestion())
 
 
          #data validation
          data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
-         data_validation = DataValidation(data_validation_config=data_validation_config,
-                        data_ingestion_artifact=data_ingestion_artifact)
-
-         data_validation_artifact = data_validation.initiate_data_validation()
+         data_validation_artifact = stage_manifest.run(stage="data_validation", artifact_class=artifact_entity.DataValidationArtifact,
+                        initiate=lambda: stage_cache.run(stage="data_validation", config=data_validation_config,
+                        inputs=[data_ingestion_artifact], artifact_class=artifact_entity.DataValidationArtifact,
+                        initiate=lambda: DataValidation(data_validation_config=data_validation_config,
+                        data_ingestion_artifact=data_ingestion_artifact).initiate_data_validation()))
 
          #data transformation
          data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
-         data_transformation = DataTransformation(data_transformation_config=data_transformation_config, 
-         data_validation_artifact=data_validation_artifact)
-         data_transformation_artifact = data_transformation.initiate_data_transformation()
+         data_transformation_artifact = stage_manifest.run(stage="data_transformation", artifact_class=artifact_entity.DataTransformationArtifact,
+         initiate=lambda: stage_cache.run(stage="data_transformation", config=data_transformation_config,
+         inputs=[data_validation_artifact], artifact_class=artifact_entity.DataTransformationArtifact,
+         initiate=lambda: DataTransformation(data_transformation_config=data_transformation_config, 
+         data_validation_artifact=data_validation_artifact).initiate_data_transformation()))
 
          #model trainer
          model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
-         model_trainer = ModelTrainer(model_trainer_config=model_trainer_config, data_transformation_artifact=data_transformation_artifact)
-         model_trainer_artifact = model_trainer.initiate_model_trainer()
+         model_trainer_artifact = stage_manifest.run(stage="model_trainer", artifact_class=artifact_entity.ModelTrainerArtifact,
+         initiate=lambda: stage_cache.run(stage="model_trainer", config=model_trainer_config,
+         inputs=[data_transformation_artifact], artifact_class=artifact_entity.ModelTrainerArtifact,
+         initiate=lambda: ModelTrainer(model_trainer_config=model_trainer_config, 
+         data_transformation_artifact=data_transformation_artifact).initiate_model_trainer()))
+
+         # Model evaluation and pusher are not memoized as they depend on the models saved so far
 
          #model evaluation
          model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
-         model_eval  = ModelEvaluation(model_eval_config=model_eval_config,
+         model_eval_artifact = stage_manifest.run(stage="model_evaluation", artifact_class=artifact_entity.ModelEvaluationArtifact,
+         initiate=lambda: ModelEvaluation(model_eval_config=model_eval_config,
          data_ingestion_artifact=data_ingestion_artifact,
          data_transformation_artifact=data_transformation_artifact,
-         model_trainer_artifact=model_trainer_artifact)
-         model_eval_artifact = model_eval.initiate_model_evaluation()
+         model_trainer_artifact=model_trainer_artifact).initiate_model_evaluation())
+         if not model_eval_artifact.is_model_accepted:
+              logging.info("Model is not pushed as it is already the saved model")
+              return
 
          # Model Pusher
          model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config)
 
-         model_pusher = ModelPusher(model_pusher_config=model_pusher_config, 
+         model_pusher_artifact = stage_manifest.run(stage="model_pusher", artifact_class=artifact_entity.ModelPusherArtifact,
+         initiate=lambda: ModelPusher(model_pusher_config=model_pusher_config, 
+                  data_validation_artifact=data_validation_artifact,
                   data_transformation_artifact=data_transformation_artifact,
-                  model_trainer_artifact=model_trainer_artifact)
-
-         model_pusher_artifact = model_pusher.initiate_model_pusher()
+                  model_trainer_artifact=model_trainer_artifact).initiate_model_pusher())
 
      except Exception as e:
           raise ThyroidException(error_message=e, error_detail=sys)
\ No newline at end of file
@@ -1,12 +1,11 @@
 import os, sys
 import pandas as pd
 import numpy as np
-from thyroid.entity.config_entity import TARGET_ENCODER_OBJECT_FILE_NAME, MODEL_FILE_NAME, KNN_IMPUTER_OBJECT_FILE_NAME
+from thyroid.entity.config_entity import TARGET_ENCODER_OBJECT_FILE_NAME, MODEL_FILE_NAME, KNN_IMPUTER_OBJECT_FILE_NAME, PREPROCESSOR_OBJECT_FILE_NAME, TREE_ENSEMBLE_FILE_NAME, BASELINE_PROFILE_FILE_NAME
 from typing import Optional
 from thyroid.exception import ThyroidException
 
 missing_threshold = 0.2
-validation_error=dict()
 
 
 class ModelResolver:
@@ -17,13 +16,19 @@ class ModelResolver:
     def __init__(self,model_registry:str = "saved_models",
                 target_encoder_dir_name = "target_encoder",
                 knn_imputer_dir_name = "knn_imputer",
-                model_dir_name = "model"):
+                preprocessor_dir_name = "preprocessor",
+                model_dir_name = "model",
+                tree_ensemble_dir_name = "tree_ensemble",
+                baseline_profile_dir_name = "baseline_profile"):
 
         self.model_registry=model_registry
         os.makedirs(self.model_registry,exist_ok=True)
         self.target_encoder_dir_name=target_encoder_dir_name
         self.model_dir_name=model_dir_name
         self.knn_imputer_dir_name= knn_imputer_dir_name
+        self.preprocessor_dir_name = preprocessor_dir_name
+        self.tree_ensemble_dir_name = tree_ensemble_dir_name
+        self.baseline_profile_dir_name = baseline_profile_dir_name
 
 
     def get_latest_dir_path(self)->Optional[str]:
@@ -81,6 +86,45 @@ class ModelResolver:
         except Exception as e:
             raise ThyroidException(e, sys)
 
+    def get_latest_preprocessor_path(self):
+        """
+        This function raise Exception if there is no model present in saved models dir
+        Otherwise returns the path of the preprocessor of the latest saved_models directory
+        """
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"Preprocessor is not available")
+            return os.path.join(latest_dir,self.preprocessor_dir_name,PREPROCESSOR_OBJECT_FILE_NAME)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_latest_tree_ensemble_path(self):
+        """
+        This function raise Exception if there is no model present in saved models dir
+        Otherwise returns the path of the latest flattened tree ensemble present in saved_models directory
+        """
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"Tree ensemble is not available")
+            return os.path.join(latest_dir,self.tree_ensemble_dir_name,TREE_ENSEMBLE_FILE_NAME)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_latest_baseline_profile_path(self):
+        """
+        This function raise Exception if there is no model present in saved models dir
+        Otherwise returns the path of the baseline profile of the latest saved_models directory
+        """
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"Baseline profile is not available")
+            return os.path.join(latest_dir,self.baseline_profile_dir_name,BASELINE_PROFILE_FILE_NAME)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
 
     def get_latest_save_dir_path(self)->str:
         """
@@ -128,10 +172,44 @@ class ModelResolver:
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def drop_missing_values_columns(self,df:pd.DataFrame,report_key_name:str)->Optional[pd.DataFrame]:
+    def get_latest_save_preprocessor_path(self):
+        """
+        This function extracts the latest saved_models directory and returns the path to save the latest preprocessor
+        """
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir,self.preprocessor_dir_name,PREPROCESSOR_OBJECT_FILE_NAME)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_latest_save_tree_ensemble_path(self):
+        """
+        This function extracts the latest saved_models directory and returns the path to save the latest flattened tree ensemble
+        """
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir,self.tree_ensemble_dir_name,TREE_ENSEMBLE_FILE_NAME)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_latest_save_baseline_profile_path(self):
+        """
+        This function extracts the latest saved_models directory and returns the path to save the baseline profile
+        """
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir,self.baseline_profile_dir_name,BASELINE_PROFILE_FILE_NAME)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def drop_missing_values_columns(self,df:pd.DataFrame,report_key_name:str,validation_error:dict)->Optional[pd.DataFrame]:
         """
         This function will drop column which contains missing value more than specified threshold
         df : Accepts a pandas dataframe
+        validation_error : validation report of the input file, dropped columns are added to it
         =========================================================================================
         returns Pandas Dataframe if atleast a single column is available after missing columns drop else None
         """
@@ -155,10 +233,10 @@ class ModelResolver:
             raise ThyroidException(e, sys)
 
 
-    def is_required_columns_exists(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str)->bool:
+    def is_required_columns_exists(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str,validation_error:dict)->bool:
         """
         This function checks if required columns exists or not by comparing current df with base df and returns
-        output as True and False
+        output as True and False, missing columns are added to validation_error (validation report of the input file)
         """
         try:
             base_columns = base_df.columns
@@ -179,8 +257,12 @@ class ModelResolver:
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def data_drift(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str):
+    def data_drift(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str,validation_error:Optional[dict]=None):
+        """
+        validation_error : validation report of the input file the drift report is added to, a new one if None
+        """
         try:
+            validation_error = dict() if validation_error is None else validation_error
             drift_report=dict()
 
             base_columns = base_df.columns
@@ -207,46 +289,31 @@ class ModelResolver:
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def feature_encoding(self,df:pd.DataFrame)->Optional[pd.DataFrame]:
+    def validate_with_baseline_profile(self,baseline_profile,current_columns:list,current_dtypes:dict,current_n_classes:dict,
+                                    validation_error:Optional[dict]=None):
         """
-        This function will replace the categorical data of each column to numerical (Array type)
-
-        df : Accepts a pandas dataframe
+        This function runs the base dataset checks (missing value columns, required columns and data drift)
+        against the baseline profile saved with the model version instead of the base dataset
+        current_columns : columns of current df left after dropping its missing value columns
+        current_dtypes : column name to dtype
+        current_n_classes : column name to number of distinct non null values
+        validation_error : validation report of the input file the results are added to, a new one if None
         =========================================================================================
-        returns Pandas Dataframe after converting to numerical value
+        returns the validation report, one per input file so that files predicted by the same process keep apart
         """
         try:
-            df = df.replace({'f':0, 't':1})
-
-            df['sex'] = df['sex'].replace({'F':0, 'M':1})
-            return df
+            validation_error = dict() if validation_error is None else validation_error
+            validation_error["missing_values_within_base_dataset"] = baseline_profile.get_missing_value_columns(threshold=missing_threshold)
+            base_columns = baseline_profile.get_required_columns(threshold=missing_threshold)
 
-        except Exception as e:
-            raise ThyroidException(e, sys)
-
-    def handling_null_value_and_outliers(self,df:pd.DataFrame)->Optional[pd.DataFrame]:
-        """
-        This function will fill median in 'age' to handle outlier and null and mode in 'sex' column for null value
-
-        df : Accepts a pandas dataframe
-        ==========================================================================================================
-        returns Pandas Dataframe after filling the value
-        """
-        try:
-            median = df.loc[df['age']<=94, 'age'].median()
-            df.loc[df.age > 94, 'age'] = np.nan
-            df['age'].fillna(median,inplace=True)
-
-            df['sex'] = df['sex'].replace(np.nan, df['sex'].mode()[0])
+            missing_columns = [base_column for base_column in base_columns if base_column not in current_columns]
+            if len(missing_columns)>0:
+                validation_error["missing_columns_within_input_dataset"]=missing_columns
+                return validation_error
 
-            return df
+            validation_error["data_drift_within_input_dataset"] = baseline_profile.data_drift(base_columns=base_columns,
+                                                                    current_dtypes=current_dtypes, current_n_classes=current_n_classes)
+            return validation_error
 
         except Exception as e:
             raise ThyroidException(e, sys)
-
-
-
-
-
-
-    
\ No newline at end of file
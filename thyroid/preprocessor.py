@@ -0,0 +1,99 @@
+import os, sys
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils.validation import check_is_fitted
+
+from thyroid import schema
+from thyroid.utils import load_object
+from thyroid.exception import ThyroidException
+
+
+AGE_COLUMN = "age"
+AGE_OUTLIER_LIMIT = 94
+
+
+class ThyroidPreprocessor(BaseEstimator, TransformerMixin):
+    """
+    Fitted preprocessing of the thyroid features, applied before the knn imputer:
+    flags and 'sex' are encoded by their schema category codes ('f'/'t' and 'F'/'M' to 0/1),
+    'age' above age_outlier_limit or null gets the median of the training 'age' up to the limit
+    and null 'sex' gets the training mode.
+
+    Fill values are learnt by fit and saved with the model version next to knn_imputer.pkl,
+    so a batch is transformed the same way whatever rows it holds.
+    """
+    def __init__(self, age_outlier_limit:float=AGE_OUTLIER_LIMIT):
+        self.age_outlier_limit = age_outlier_limit
+
+    def fit(self, df:pd.DataFrame, y=None):
+        try:
+            encoded_df = schema.encode_features(df=df)
+            self.feature_names_in_ = np.asarray(df.columns, dtype=object)
+            self.age_median_ = None
+            self.sex_mode_ = None
+            if AGE_COLUMN in encoded_df.columns:
+                age = encoded_df[AGE_COLUMN]
+                self.age_median_ = float(age[age<=self.age_outlier_limit].median())
+            if schema.SEX_COLUMN in encoded_df.columns:
+                self.sex_mode_ = float(encoded_df[schema.SEX_COLUMN].mode()[0])
+            return self
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def transform(self, df:pd.DataFrame)->pd.DataFrame:
+        """
+        Returns a new dataframe, columns which are not features of the schema are passed through
+        """
+        try:
+            check_is_fitted(self, "feature_names_in_")
+            df = schema.encode_features(df=df)
+            if AGE_COLUMN in df.columns and self.age_median_ is not None:
+                age = df[AGE_COLUMN]
+                df[AGE_COLUMN] = age.mask(age.isna() | (age>self.age_outlier_limit), self.age_median_)
+            if schema.SEX_COLUMN in df.columns and self.sex_mode_ is not None:
+                df[schema.SEX_COLUMN] = df[schema.SEX_COLUMN].fillna(self.sex_mode_)
+            return df
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @classmethod
+    def from_knn_imputer(cls, knn_imputer)->"ThyroidPreprocessor":
+        """
+        Preprocessor of a model version saved without one, fill values are taken from the data the
+        knn imputer (or a pipeline ending with one) was fitted on, which is the preprocessed training data
+        """
+        try:
+            imputer = knn_imputer.steps[-1][1] if hasattr(knn_imputer, "steps") else knn_imputer
+            preprocessor = cls()
+            preprocessor.feature_names_in_ = np.asarray(imputer.feature_names_in_, dtype=object)
+            preprocessor.age_median_ = None
+            preprocessor.sex_mode_ = None
+            feature_names = list(preprocessor.feature_names_in_)
+            fit_X = getattr(imputer, "_fit_X", None)
+            if fit_X is not None and AGE_COLUMN in feature_names:
+                age = fit_X[:, feature_names.index(AGE_COLUMN)]
+                preprocessor.age_median_ = float(np.nanmedian(age[age<=preprocessor.age_outlier_limit]))
+            if fit_X is not None and schema.SEX_COLUMN in feature_names:
+                sex = fit_X[:, feature_names.index(schema.SEX_COLUMN)]
+                values, counts = np.unique(sex[~np.isnan(sex)], return_counts=True)
+                preprocessor.sex_mode_ = float(values[counts.argmax()])
+            return preprocessor
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @classmethod
+    def load(cls, file_path:str, knn_imputer)->"ThyroidPreprocessor":
+        """
+        Saved preprocessor of a model version, built from its knn imputer when the version has none
+        """
+        try:
+            if os.path.exists(file_path):
+                return load_object(file_path=file_path)
+            return cls.from_knn_imputer(knn_imputer=knn_imputer)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
@@ -0,0 +1,58 @@
+import sys
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+from imblearn.over_sampling import SMOTE
+from imblearn.combine import SMOTETomek
+
+from thyroid.logger import logging
+from thyroid.exception import ThyroidException
+
+
+# scale_pos_weight : classes are balanced by weighting the positive class in XGBoost, rows are left as they are
+# smote : synthetic minority rows interpolated between each minority row and its nearest minority rows (kd-tree search)
+# smote_tomek : SMOTE followed by removal of Tomek links, exact neighbors over all rows (earlier behaviour)
+REBALANCING_METHODS = ["scale_pos_weight", "smote", "smote_tomek"]
+
+
+def get_scale_pos_weight(y:np.ndarray)->float:
+    """
+    Number of negative over number of positive rows, the XGBoost weight of label 1 which gives both classes the same total weight
+    """
+    try:
+        n_positive = int(np.count_nonzero(y==1))
+        if n_positive==0:
+            raise Exception("Target has no positive rows")
+        return float((y.shape[0]-n_positive)/n_positive)
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def rebalance(x:np.ndarray, y:np.ndarray, method:str, random_state:int=42, k_neighbors:int=5)->tuple:
+    """
+    Description: This function rebalances the classes of a training set, test sets are never rebalanced
+    =========================================================
+    Params:
+    x: feature array, y: target array
+    method: one of REBALANCING_METHODS, 'scale_pos_weight' returns the arrays as they are
+    k_neighbors: neighbors SMOTE interpolates between
+    =========================================================
+    return feature and target arrays
+    """
+    try:
+        if method not in REBALANCING_METHODS:
+            raise Exception(f"Unknown rebalancing method: {method}, methods are {REBALANCING_METHODS}")
+        if method=="scale_pos_weight":
+            logging.info(f"Rows are not resampled, scale_pos_weight: {get_scale_pos_weight(y=y)}")
+            return x, y
+        if method=="smote":
+            # SMOTE fits its neighbor search on the minority rows only. With more than 15 features the "auto"
+            # algorithm of sklearn falls back to brute force, the kd-tree is explicit so queries stay sub-quadratic
+            sampler = SMOTE(sampling_strategy='minority', random_state=random_state,
+                            k_neighbors=NearestNeighbors(n_neighbors=k_neighbors+1, algorithm="kd_tree"))
+        else:
+            sampler = SMOTETomek(random_state=random_state, sampling_strategy='minority')
+        x_resampled, y_resampled = sampler.fit_resample(x, y)
+        return x_resampled.astype(x.dtype, copy=False), y_resampled.astype(y.dtype, copy=False)
+
+    except Exception as e:
+        raise ThyroidException(e, sys)
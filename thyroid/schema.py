@@ -0,0 +1,87 @@
+import sys
+import numpy as np
+import pandas as pd
+
+from thyroid.config import TARGET_COLUMN
+from thyroid.exception import ThyroidException
+
+
+# Tokens read as null besides empty cells
+NA_VALUES = ["?"]
+
+NUMERIC_COLUMNS = ["age", "TSH", "T3", "TT4", "T4U", "FTI", "TBG"]
+BOOLEAN_COLUMNS = ["on thyroxine", "query on thyroxine", "on antithyroid medication", "sick", "pregnant", "thyroid surgery",
+                "I131 treatment", "query hypothyroid", "query hyperthyroid", "lithium", "goitre", "tumor", "hypopituitary",
+                "psych", "TSH measured", "T3 measured", "TT4 measured", "T4U measured", "FTI measured", "TBG measured"]
+SEX_COLUMN = "sex"
+
+# Categories in code order, the code of a value is its encoding: 'f' -> 0, 't' -> 1, 'F' -> 0, 'M' -> 1
+BOOLEAN_CATEGORIES = ["f", "t"]
+SEX_CATEGORIES = ["F", "M"]
+
+COLUMN_DTYPES = {**{column: np.float32 for column in NUMERIC_COLUMNS},
+                **{column: pd.CategoricalDtype(categories=BOOLEAN_CATEGORIES) for column in BOOLEAN_COLUMNS},
+                SEX_COLUMN: pd.CategoricalDtype(categories=SEX_CATEGORIES),
+                "referral source": "category",
+                TARGET_COLUMN: "category"}
+
+# Columns encoded to numbers by their category codes
+ENCODED_COLUMNS = BOOLEAN_COLUMNS+[SEX_COLUMN]
+
+# Transformed arrays: features in the dtype XGBoost builds its matrix from, target as label codes
+FEATURE_DTYPE = np.float32
+TARGET_DTYPE = np.int8
+
+
+def read_csv(file_path:str, columns:list=None, chunksize:int=None):
+    """
+    Description: This function parses a thyroid csv into typed columns in one pass
+    =========================================================
+    Params:
+    file_path: csv file
+    columns: columns to read, all columns if None
+    chunksize: rows per chunk, an iterator of chunks is returned if given
+    =========================================================
+    return Pandas dataframe with float32 numeric columns and category flags, sex, referral source and target,
+    NA_VALUES and values outside the categories of a flag or sex are null. Columns unknown to the schema are inferred
+    """
+    try:
+        df = pd.read_csv(file_path, usecols=columns, dtype=COLUMN_DTYPES, na_values=NA_VALUES, chunksize=chunksize)
+        return df[columns] if columns is not None and chunksize is None else df
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def apply_schema(df:pd.DataFrame)->pd.DataFrame:
+    """
+    Same dtypes as read_csv for a dataframe which is already in memory, e.g. documents read from mongo
+    or an input json, values are text or numbers with NA_VALUES or None as null
+    """
+    try:
+        df = df.copy()
+        for column in df.columns:
+            if column not in COLUMN_DTYPES or df[column].dtype==COLUMN_DTYPES[column]:
+                continue
+            data = df[column].mask(df[column].isin(NA_VALUES))
+            if column in NUMERIC_COLUMNS:
+                df[column] = pd.to_numeric(data, errors="coerce").astype(np.float32)
+            else:
+                df[column] = data.astype(COLUMN_DTYPES[column])
+        return df
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def encode_features(df:pd.DataFrame)->pd.DataFrame:
+    """
+    Flags and sex as float32 category codes with null kept as NaN for imputation, other columns unchanged
+    """
+    try:
+        df = apply_schema(df=df)
+        for column in ENCODED_COLUMNS:
+            if column in df.columns:
+                codes = df[column].cat.codes
+                df[column] = codes.astype(np.float32).where(codes>=0)
+        return df
+    except Exception as e:
+        raise ThyroidException(e, sys)
@@ -0,0 +1,152 @@
+import sys
+import threading
+import numpy as np
+
+from thyroid import schema
+from thyroid.imputer import PatternKNNImputer
+from thyroid.preprocessor import ThyroidPreprocessor
+from thyroid.exception import ThyroidException
+
+
+# Encoding lookup tables, category codes of the schema like ModelResolver.feature_encoding with its null tokens and None as null
+NUMERIC_LOOKUP = {**{token: np.nan for token in schema.NA_VALUES}, None: np.nan, '': np.nan}
+BOOLEAN_LOOKUP = {**{value: float(code) for code,value in enumerate(schema.BOOLEAN_CATEGORIES)}, **NUMERIC_LOOKUP}
+SEX_LOOKUP = {**{value: float(code) for code,value in enumerate(schema.SEX_CATEGORIES)}, **NUMERIC_LOOKUP}
+
+
+class InferencePlan:
+    """
+    This class compiles a saved model version into a plan that scores NumPy rows without pandas:
+    fixed feature order, encoding lookup tables, stored fill values for 'age' and 'sex',
+    the fitted knn imputer, the booster and the label decoder.
+
+    Fill values are the ones of the fitted preprocessor (taken from the data the imputer was fitted on
+    for model versions saved without one), so a single row gets the same 'age' median and 'sex' mode
+    as the training data instead of the statistics of its own batch.
+
+    Rows are scored the way batch prediction scores them (ThyroidPreprocessor.transform, imputer, model): 'age'
+    and 'sex' are filled first, then null values are imputed by the imputer converted with
+    PatternKNNImputer.from_knn_imputer like batch prediction does, so a row gets the same neighbors as there.
+    """
+    def __init__(self, knn_imputer, model, target_encoder, tree_ensemble=None, preprocessor=None):
+        try:
+            self.feature_names = list(knn_imputer.feature_names_in_)
+            self.n_features = len(self.feature_names)
+            self.labels = np.asarray(target_encoder.classes_)
+            self.lookups = [SEX_LOOKUP if name=='sex' else BOOLEAN_LOOKUP if name not in schema.NUMERIC_COLUMNS
+                            else NUMERIC_LOOKUP for name in self.feature_names]
+
+            # Fitted imputer, the pipeline wrapper is skipped, a sklearn KNNImputer is converted as in batch prediction
+            imputer = knn_imputer.steps[-1][1] if hasattr(knn_imputer,'steps') else knn_imputer
+            self.imputer = PatternKNNImputer.from_knn_imputer(knn_imputer=imputer)
+            self.is_pattern_imputer = isinstance(self.imputer,PatternKNNImputer) and self.imputer._can_impute_in_place()
+
+            # Stored fill values for 'age' (median below outlier limit) and 'sex' (mode)
+            preprocessor = preprocessor if preprocessor is not None else ThyroidPreprocessor.from_knn_imputer(knn_imputer=knn_imputer)
+            self.age_index = self.feature_names.index('age') if 'age' in self.feature_names else None
+            self.sex_index = self.feature_names.index('sex') if 'sex' in self.feature_names else None
+            self.age_outlier_limit = preprocessor.age_outlier_limit
+            self.age_median = preprocessor.age_median_
+            self.sex_mode = preprocessor.sex_mode_
+
+            # Flattened tree ensemble if given, otherwise booster and the iteration range XGBClassifier.predict would use
+            self.tree_ensemble = tree_ensemble
+            self.booster = None
+            self.iteration_range = (0, 0)
+            if tree_ensemble is None:
+                self.booster = model.get_booster()
+                try:
+                    self.iteration_range = (0, int(model.best_iteration)+1)
+                except AttributeError:
+                    pass
+
+            # Preallocated row for single record requests, one per thread
+            self.thread_local = threading.local()
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @classmethod
+    def from_model_bundle(cls, model_bundle)->"InferencePlan":
+        return cls(knn_imputer=model_bundle.knn_imputer, model=model_bundle.model, target_encoder=model_bundle.target_encoder,
+                    tree_ensemble=model_bundle.tree_ensemble, preprocessor=model_bundle.preprocessor)
+
+    def encode_record(self, record, out:np.ndarray)->np.ndarray:
+        """
+        This function writes a raw record into a preallocated row in model feature order
+        record : dict of feature name to raw value ('t'/'f', 'M'/'F', '?', numbers) or sequence in feature order
+        """
+        values = [record[name] for name in self.feature_names] if isinstance(record,dict) else record
+        for index,(value,lookup) in enumerate(zip(values,self.lookups)):
+            try:
+                out[index] = lookup[value]
+            except (KeyError, TypeError):
+                out[index] = value
+        return out
+
+    def fill_age_and_sex(self, input_arr:np.ndarray)->np.ndarray:
+        """
+        This function replaces 'age' outliers and null with stored median and null 'sex' with stored mode (in place)
+        """
+        if self.age_index is not None and self.age_median is not None:
+            age = input_arr[:,self.age_index]
+            age[np.isnan(age) | (age>self.age_outlier_limit)] = self.age_median
+        if self.sex_index is not None and self.sex_mode is not None:
+            sex = input_arr[:,self.sex_index]
+            sex[np.isnan(sex)] = self.sex_mode
+        return input_arr
+
+    def impute(self, input_arr:np.ndarray)->np.ndarray:
+        """
+        This function imputes null values (in place) the same way as the imputer transform
+        Rows without null values are not touched
+        """
+        if self.is_pattern_imputer:
+            return self.imputer._impute(input_arr)
+        row_missing_idx = np.flatnonzero(np.isnan(input_arr).any(axis=1))
+        if row_missing_idx.size>0:
+            input_arr[row_missing_idx] = self.imputer.transform(input_arr[row_missing_idx])
+        return input_arr
+
+    def predict_proba(self, input_arr:np.ndarray)->np.ndarray:
+        """
+        Returns positive class probability of already encoded and imputed rows
+        """
+        if self.tree_ensemble is not None:
+            return self.tree_ensemble.predict_proba(input_arr=input_arr)
+        return self.booster.inplace_predict(input_arr, iteration_range=self.iteration_range)
+
+    def predict_matrix(self, input_arr:np.ndarray):
+        """
+        This function scores encoded rows, 'age' and 'sex' are filled with the stored values and null values are imputed
+        input_arr : float numpy array in model feature order (modified in place)
+        =========================================================================================
+        returns encoded prediction, decoded prediction and class probabilities
+        """
+        try:
+            input_arr = self.impute(self.fill_age_and_sex(input_arr))
+            positive_proba = self.predict_proba(input_arr)
+            prediction = (positive_proba>0.5).astype(np.int64)
+            probability = np.column_stack([1-positive_proba, positive_proba])
+            return prediction, self.labels[prediction], probability
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def predict_record(self, record):
+        """
+        This function scores a single raw record (as sent in the input csv) using the preallocated row
+        returns encoded prediction, decoded prediction and positive class probability
+        """
+        try:
+            row_buffer = getattr(self.thread_local,'row_buffer',None)
+            if row_buffer is None:
+                row_buffer = self.thread_local.row_buffer = np.empty(self.n_features,dtype=np.float64)
+            row = self.encode_record(record=record, out=row_buffer)
+            input_arr = self.impute(self.fill_age_and_sex(row.reshape(1,-1)))
+            positive_proba = float(self.predict_proba(input_arr)[0])
+            prediction = int(positive_proba>0.5)
+            return prediction, self.labels[prediction], positive_proba
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
@@ -0,0 +1,177 @@
+import sys
+import time
+import queue
+import threading
+import numpy as np
+from typing import Callable
+from concurrent.futures import Future
+
+from thyroid.logger import logging
+from thyroid.exception import ThyroidException
+
+
+class MicroBatcher:
+    """
+    This class coalesces concurrent single record requests into one matrix for the model.
+    Queued rows are flushed when the current batch size is reached or the current wait is over,
+    each caller then gets its own row of the output.
+
+    Both the batch size and the wait adapt to load:
+    - batch size doubles when a batch is flushed full while more rows are waiting, and halves
+      when batches stay below a quarter of it
+    - wait is the time expected to fill the batch at the current arrival rate (bounded by
+      max_wait_ms), so a lone request under low load is flushed almost immediately
+    """
+    def __init__(self, predict_fn:Callable, max_batch_size:int=256, max_wait_ms:float=2.0,
+                min_batch_size:int=1, ewma_alpha:float=0.1):
+        try:
+            self.predict_fn = predict_fn
+            self.max_batch_size = max_batch_size
+            self.min_batch_size = min_batch_size
+            self.max_wait = max_wait_ms/1000
+            self.ewma_alpha = ewma_alpha
+
+            self.batch_size = min_batch_size
+            self.wait = self.max_wait
+            self.arrival_interval = self.max_wait
+            self.last_arrival = None
+
+            self.request_queue = queue.Queue()
+            self.lock = threading.Lock()
+            self.worker = None
+
+            # Histograms are keyed by the bucket upper bound (powers of 2)
+            self.buckets = [2**power for power in range(int(np.log2(max_batch_size))+1)]
+            if self.buckets[-1]<max_batch_size:
+                self.buckets.append(max_batch_size)
+            self.batch_size_histogram = dict.fromkeys(self.buckets,0)
+            self.queue_depth_histogram = dict.fromkeys([0]+self.buckets+["inf"],0)
+            self.flush_reasons = {"size": 0, "wait": 0}
+            self.n_batches = 0
+            self.n_rows = 0
+            self.n_errors = 0
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def start(self)->None:
+        """
+        Starting the worker thread, it is started by submit whenever no worker is running in this
+        process, so each forked server worker starts its own on its first request
+        """
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self.worker.start()
+
+    def submit(self, row:np.ndarray)->Future:
+        """
+        Queues one input row and returns a future for its own output row
+        """
+        if self.worker is None or not self.worker.is_alive():
+            self.start()
+        now = time.perf_counter()
+        with self.lock:
+            if self.last_arrival is not None:
+                self.arrival_interval += self.ewma_alpha*(now-self.last_arrival-self.arrival_interval)
+            self.last_arrival = now
+        future = Future()
+        self.request_queue.put((np.asarray(row,dtype=np.float64).ravel(), future))
+        return future
+
+    def predict(self, row:np.ndarray, timeout:float=None):
+        """
+        Queues one input row and waits for its output
+        """
+        return self.submit(row=row).result(timeout=timeout)
+
+    def _bucket(self, value:int):
+        if value==0:
+            return 0
+        for bucket in self.buckets:
+            if value<=bucket:
+                return bucket
+        return "inf"
+
+    def _adapt(self, n_rows:int, backlog:int)->None:
+        """
+        Adapting batch size and wait after each flush
+        """
+        if n_rows>=self.batch_size and backlog>0:
+            self.batch_size = min(self.batch_size*2, self.max_batch_size)
+        elif n_rows<self.batch_size//4:
+            self.batch_size = max(self.batch_size//2, self.min_batch_size)
+        # Time needed to fill the rest of the batch at the current arrival rate
+        self.wait = min(self.arrival_interval*(self.batch_size-1), self.max_wait)
+        if self.arrival_interval>self.max_wait:
+            self.wait = 0.0
+
+    def _run(self)->None:
+        while True:
+            batch = [self.request_queue.get()]
+            deadline = time.perf_counter()+self.wait
+            reason = "wait"
+            while len(batch)<self.batch_size:
+                remaining = deadline-time.perf_counter()
+                try:
+                    batch.append(self.request_queue.get(timeout=remaining) if remaining>0 else self.request_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if len(batch)>=self.batch_size:
+                reason = "size"
+            self._flush(batch=batch, reason=reason)
+
+    def _predict_group(self, group:list)->None:
+        """
+        One model call for rows of the same width, a failure is set on the futures of this group only
+        """
+        futures = [future for _,future in group]
+        try:
+            output = self.predict_fn(np.vstack([row for row,_ in group]))
+            for index,future in enumerate(futures):
+                if isinstance(output,tuple):
+                    future.set_result(tuple(item[index] for item in output))
+                else:
+                    future.set_result(output[index])
+        except Exception as e:
+            logging.info(f"Micro batch of {len(group)} rows failed: {e}")
+            with self.lock:
+                self.n_errors += 1
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _flush(self, batch:list, reason:str)->None:
+        backlog = self.request_queue.qsize()
+        # Rows are grouped by width so that a caller sending a wrong number of features
+        # does not fail the rows of other callers stacked in the same batch
+        groups = {}
+        for row,future in batch:
+            groups.setdefault(row.shape[0],[]).append((row,future))
+        for group in groups.values():
+            self._predict_group(group=group)
+
+        with self.lock:
+            self.n_batches += 1
+            self.n_rows += len(batch)
+            self.flush_reasons[reason] += 1
+            self.batch_size_histogram[self._bucket(len(batch))] += 1
+            self.queue_depth_histogram[self._bucket(backlog)] += 1
+            self._adapt(n_rows=len(batch), backlog=backlog)
+
+    def get_stats(self)->dict:
+        """
+        Returns queue depth, batch size histograms and the current adaptive settings
+        """
+        with self.lock:
+            return {"queue_depth": self.request_queue.qsize(),
+                    "batch_size": self.batch_size,
+                    "wait_ms": self.wait*1000,
+                    "arrival_interval_ms": self.arrival_interval*1000,
+                    "n_batches": self.n_batches,
+                    "n_rows": self.n_rows,
+                    "n_errors": self.n_errors,
+                    "mean_batch_size": self.n_rows/self.n_batches if self.n_batches else 0.0,
+                    "flush_reasons": dict(self.flush_reasons),
+                    "batch_size_histogram": {str(bucket): count for bucket,count in self.batch_size_histogram.items()},
+                    "queue_depth_histogram": {str(bucket): count for bucket,count in self.queue_depth_histogram.items()}}
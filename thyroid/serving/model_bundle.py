@@ -0,0 +1,138 @@
+import os, sys
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+from thyroid.logger import logging
+from thyroid.utils import load_object
+from thyroid.predictor import ModelResolver
+from thyroid.config import env_var
+from thyroid.exception import ThyroidException
+from thyroid.serving.tree_ensemble import TreeEnsemble
+from thyroid.serving.inference_plan import InferencePlan
+from thyroid.imputer import PatternKNNImputer
+from thyroid.preprocessor import ThyroidPreprocessor
+from thyroid.entity.config_entity import TARGET_ENCODER_OBJECT_FILE_NAME, MODEL_FILE_NAME, KNN_IMPUTER_OBJECT_FILE_NAME, PREPROCESSOR_OBJECT_FILE_NAME, TREE_ENSEMBLE_FILE_NAME
+
+INFERENCE_ENGINES = ("xgboost", "numpy")
+
+
+class InvalidRequestError(Exception):
+    """
+    Raised when the records sent for scoring does not match the feature order of the model
+    """
+
+
+class ModelBundle:
+    """
+    This class keeps the preprocessor, knn_imputer, model and target encoder of one saved_models version together
+    so that every request is scored against a consistent set of objects
+
+    inference_engine: 'xgboost' scores with the booster, 'numpy' scores with the flattened tree ensemble
+    saved by ModelPusher and does not unpickle the xgboost model when that file is present
+
+    Objects are loaded the way BatchPredictionObjects loads them, so a record is scored as in batch prediction:
+    fill values of the preprocessor, then the imputer (a sklearn KNNImputer converted to PatternKNNImputer), then the model
+    """
+    def __init__(self, model_dir:str, model_resolver:Optional[ModelResolver]=None, inference_engine:Optional[str]=None):
+        try:
+            model_resolver = model_resolver or ModelResolver()
+            self.model_dir = model_dir
+            self.version = os.path.basename(os.path.normpath(model_dir))
+            self.inference_engine = inference_engine or env_var.inference_engine
+            if self.inference_engine not in INFERENCE_ENGINES:
+                raise Exception(f"Inference engine: {self.inference_engine} is not one of {INFERENCE_ENGINES}")
+
+            logging.info(f"Loading preprocessor, knn_imputer, model and target encoder from: {model_dir} for {self.inference_engine} engine")
+            knn_imputer = load_object(file_path=os.path.join(model_dir,model_resolver.knn_imputer_dir_name,KNN_IMPUTER_OBJECT_FILE_NAME))
+            self.knn_imputer = PatternKNNImputer.from_knn_imputer(knn_imputer=knn_imputer)
+            # 'age' and 'sex' fill values, applied by the inference plan to every row before imputation
+            self.preprocessor = ThyroidPreprocessor.load(file_path=os.path.join(model_dir,model_resolver.preprocessor_dir_name,PREPROCESSOR_OBJECT_FILE_NAME),
+                                                        knn_imputer=self.knn_imputer)
+            self.model = None
+            self.tree_ensemble = None
+            tree_ensemble_path = os.path.join(model_dir,model_resolver.tree_ensemble_dir_name,TREE_ENSEMBLE_FILE_NAME)
+            if self.inference_engine=="numpy" and os.path.exists(tree_ensemble_path):
+                self.tree_ensemble = TreeEnsemble.load(file_path=tree_ensemble_path)
+            else:
+                self.model = load_object(file_path=os.path.join(model_dir,model_resolver.model_dir_name,MODEL_FILE_NAME))
+                if self.inference_engine=="numpy":
+                    # Model versions pushed before the tree ensemble was saved are flattened on load
+                    self.tree_ensemble = TreeEnsemble.from_booster(booster=self.model)
+            self.target_encoder = load_object(file_path=os.path.join(model_dir,model_resolver.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME))
+
+            # Feature order the model was trained with
+            self.feature_names = list(self.knn_imputer.feature_names_in_)
+            self.labels = [str(label) for label in self.target_encoder.classes_]
+
+            # Compiled numpy plan used to score requests without pandas
+            self.inference_plan = InferencePlan.from_model_bundle(model_bundle=self)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def check_feature_names(self, feature_names)->None:
+        """
+        This function raise InvalidRequestError if the request has missing or unknown features
+        """
+        missing_features = [name for name in self.feature_names if name not in feature_names]
+        unknown_features = [name for name in feature_names if name not in self.feature_names]
+        if len(missing_features)>0 or len(unknown_features)>0:
+            raise InvalidRequestError(f"Missing features: {missing_features}, unknown features: {unknown_features}")
+
+    def records_to_array(self, records:list)->np.ndarray:
+        """
+        This function converts list of named feature records into input array in model feature order
+        records : [{"age": 41, "sex": 0, ...}, ...]
+        =========================================================================================
+        returns float numpy array of shape (number of records, number of features), null as np.nan
+        """
+        if not isinstance(records,list) or len(records)==0:
+            raise InvalidRequestError("'records' must be a non empty list")
+        input_arr = np.empty((len(records),len(self.feature_names)),dtype=np.float64)
+        for row_index,record in enumerate(records):
+            if not isinstance(record,dict):
+                raise InvalidRequestError(f"Record at index {row_index} is not an object")
+            if len(record)!=len(self.feature_names):
+                self.check_feature_names(feature_names=list(record))
+            try:
+                input_arr[row_index] = [np.nan if record[name] is None else record[name] for name in self.feature_names]
+            except KeyError:
+                self.check_feature_names(feature_names=list(record))
+            except (TypeError, ValueError):
+                raise InvalidRequestError(f"Record at index {row_index} has non numeric value")
+        return input_arr
+
+    def columns_to_array(self, columns:dict)->np.ndarray:
+        """
+        This function converts columnar input into input array in model feature order
+        columns : {"age": [41, 23, ...], "sex": [0, 0, ...], ...}
+        =========================================================================================
+        returns float numpy array of shape (number of rows, number of features), null as np.nan
+        """
+        if not isinstance(columns,dict):
+            raise InvalidRequestError("'columns' must be an object of feature name to list of values")
+        self.check_feature_names(feature_names=list(columns))
+        if not all(isinstance(columns[name],list) for name in self.feature_names):
+            raise InvalidRequestError("All columns must be non empty lists of same length")
+        n_rows = {len(columns[name]) for name in self.feature_names}
+        if len(n_rows)!=1 or 0 in n_rows:
+            raise InvalidRequestError("All columns must be non empty lists of same length")
+        try:
+            return np.array([columns[name] for name in self.feature_names],dtype=np.float64).T
+        except (TypeError, ValueError):
+            raise InvalidRequestError("Columns has non numeric value")
+
+    def predict(self, input_arr:np.ndarray):
+        """
+        This function fills 'age' and 'sex' with the values of the preprocessor, imputes the rows having null values
+        (in place) and scores all rows with one booster call, same output as batch prediction of the same records
+        input_arr : float numpy array in model feature order, encoded like ThyroidPreprocessor encodes flags and 'sex'
+        =========================================================================================
+        returns encoded prediction, decoded prediction and class probabilities
+        """
+        try:
+            return self.inference_plan.predict_matrix(input_arr=input_arr)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
@@ -0,0 +1,130 @@
+import sys
+import time
+import threading
+import numpy as np
+from typing import Optional
+from datetime import datetime
+
+from thyroid.logger import logging
+from thyroid.predictor import ModelResolver
+from thyroid.exception import ThyroidException
+from thyroid.serving.model_bundle import ModelBundle
+
+
+class ModelWatcher:
+    """
+    This class watches the model registry for a new version directory pushed by ModelPusher.
+    A new version is loaded and warmed up in a background thread and then swapped in with a single
+    reference assignment, so requests keep being served by the previous version meanwhile.
+    """
+    def __init__(self, model_resolver:ModelResolver, poll_interval:float=30.0, n_warmup_rows:int=64):
+        try:
+            self.model_resolver = model_resolver
+            self.poll_interval = poll_interval
+            self.n_warmup_rows = n_warmup_rows
+
+            self.model_bundle:Optional[ModelBundle] = None
+            self.loaded_at = None
+            self.last_error = None
+            self.worker = None
+            self.lock = threading.Lock()
+            self.stop_event = threading.Event()
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @property
+    def is_ready(self)->bool:
+        """
+        True once a model version has been loaded and warmed up
+        """
+        return self.model_bundle is not None
+
+    def warmup(self, model_bundle:ModelBundle)->None:
+        """
+        This function scores synthetic rows (with and without null values) so that the imputer and
+        booster are fully initialised before the first real request reaches them
+        """
+        try:
+            random_state = np.random.RandomState(42)
+            input_arr = random_state.randint(0, 2, size=(self.n_warmup_rows, len(model_bundle.feature_names))).astype(np.float64)
+            # Half of the rows carry null values to go through the knn imputer as well
+            input_arr[::2, -1] = np.nan
+            model_bundle.predict(input_arr=input_arr)
+            for row in input_arr[:2]:
+                model_bundle.predict(input_arr=row.reshape(1,-1))
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def check_for_new_version(self)->bool:
+        """
+        This function loads, warms up and swaps in the latest model version if it is not the one serving
+        returns True if a new version was swapped in
+        """
+        try:
+            latest_dir = self.model_resolver.get_latest_dir_path()
+            if latest_dir is None:
+                return False
+            if self.model_bundle is not None and self.model_bundle.model_dir==latest_dir:
+                return False
+
+            logging.info(f"Loading model version: {latest_dir}")
+            model_bundle = ModelBundle(model_dir=latest_dir, model_resolver=self.model_resolver)
+            self.warmup(model_bundle=model_bundle)
+
+            previous_version = None if self.model_bundle is None else self.model_bundle.version
+            # Single reference assignment, in flight requests finish on the bundle they already hold
+            self.model_bundle = model_bundle
+            self.loaded_at = datetime.now().isoformat()
+            self.last_error = None
+            logging.info(f"Swapped serving model version from {previous_version} to {model_bundle.version}")
+            return True
+
+        except Exception as e:
+            # A version directory still being written by ModelPusher fails to load, it is retried on next poll
+            self.last_error = str(e)
+            logging.info(f"Could not load latest model version, will retry: {e}")
+            return False
+
+    def _run(self)->None:
+        while not self.stop_event.is_set():
+            self.check_for_new_version()
+            self.stop_event.wait(self.poll_interval if self.is_ready else min(self.poll_interval, 1.0))
+
+    def start(self)->None:
+        """
+        Starting the background thread which loads the first version and then polls for new versions.
+        It is called on every request and only starts a thread when none is running in this process,
+        so forked server workers each start their own
+        """
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.stop_event.clear()
+                self.worker = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+                self.worker.start()
+
+    def stop(self)->None:
+        self.stop_event.set()
+
+    def wait_until_ready(self, timeout:float=None)->bool:
+        """
+        Blocks until a model version is serving or timeout is over
+        """
+        start_time = time.time()
+        while not self.is_ready:
+            if timeout is not None and time.time()-start_time>timeout:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def get_status(self)->dict:
+        """
+        Returns which model version is serving
+        """
+        model_bundle = self.model_bundle
+        return {"ready": model_bundle is not None,
+                "model_version": None if model_bundle is None else model_bundle.version,
+                "model_dir": None if model_bundle is None else model_bundle.model_dir,
+                "loaded_at": self.loaded_at,
+                "last_error": self.last_error}
@@ -0,0 +1,143 @@
+import sys
+import time
+import hashlib
+import threading
+import numpy as np
+from typing import Callable
+from collections import OrderedDict
+
+from thyroid.exception import ThyroidException
+
+
+class PredictionCache:
+    """
+    This class is a size bounded LRU cache with TTL in front of the model.
+    Key is a hash of the canonicalized encoded feature vector (before imputation) and the model version
+    directory, so requests still held by the previous version during a hot swap neither read nor clear
+    the entries of the new one. Entries of a version which is no longer serving age out by LRU and TTL.
+    """
+    def __init__(self, max_size:int=100000, ttl_seconds:float=3600.0):
+        try:
+            self.max_size = max_size
+            self.ttl_seconds = ttl_seconds
+            self.entries = OrderedDict()    # key -> (expires_at, output row)
+            self.lock = threading.Lock()
+
+            self.hits = 0
+            self.misses = 0
+            self.expired = 0
+            self.evictions = 0
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @staticmethod
+    def canonicalize(input_arr:np.ndarray)->np.ndarray:
+        """
+        Same values give same bytes: float64, C order, -0.0 as 0.0 and one NaN bit pattern
+        """
+        input_arr = np.array(input_arr, dtype=np.float64, order="C", ndmin=2)
+        input_arr += 0.0
+        input_arr[np.isnan(input_arr)] = np.nan
+        return input_arr
+
+    def make_keys(self, input_arr:np.ndarray, model_version:str)->list:
+        """
+        Returns one key per row of the input array
+        """
+        input_arr = self.canonicalize(input_arr)
+        version_hash = hashlib.blake2b(str(model_version).encode(), digest_size=16)
+        keys = []
+        for row in input_arr:
+            row_hash = version_hash.copy()
+            row_hash.update(row.tobytes())
+            keys.append(row_hash.digest())
+        return keys
+
+    def get_many(self, keys:list)->list:
+        """
+        Returns the cached output row for each key or None
+        """
+        now = time.monotonic()
+        values = []
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                    values.append(None)
+                elif entry[0]<now:
+                    del self.entries[key]
+                    self.expired += 1
+                    self.misses += 1
+                    values.append(None)
+                else:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    values.append(entry[1])
+        return values
+
+    def put_many(self, keys:list, values:list)->None:
+        """
+        Adding output rows, least recently used entries are evicted beyond max_size
+        """
+        expires_at = time.monotonic()+self.ttl_seconds
+        with self.lock:
+            for key,value in zip(keys,values):
+                self.entries[key] = (expires_at, value)
+                self.entries.move_to_end(key)
+            while len(self.entries)>self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def predict(self, input_arr:np.ndarray, model_version:str, predict_fn:Callable):
+        """
+        This function returns the output of predict_fn for the input array, only rows which are not cached
+        (each distinct row once) are passed to predict_fn in one call
+        input_arr : encoded feature array before imputation
+        model_version : model version directory serving the request
+        predict_fn : function scoring an array, returns an array or a tuple of arrays with one row per input row
+        """
+        try:
+            keys = self.make_keys(input_arr=input_arr, model_version=model_version)
+            if len(keys)==0:
+                return predict_fn(np.asarray(input_arr))
+            rows = self.get_many(keys=keys)
+
+            # Distinct missing rows
+            missing_index = {}
+            for index,(key,row) in enumerate(zip(keys,rows)):
+                if row is None and key not in missing_index:
+                    missing_index[key] = index
+
+            if len(missing_index)>0:
+                output = predict_fn(np.asarray(input_arr)[list(missing_index.values())])
+                if isinstance(output,tuple):
+                    new_rows = [tuple(item[position] for item in output) for position in range(len(missing_index))]
+                else:
+                    new_rows = [output[position] for position in range(len(missing_index))]
+                self.put_many(keys=list(missing_index), values=new_rows)
+                new_rows = dict(zip(missing_index,new_rows))
+                rows = [new_rows[key] if row is None else row for key,row in zip(keys,rows)]
+
+            if isinstance(rows[0],tuple):
+                return tuple(np.asarray([row[position] for row in rows]) for position in range(len(rows[0])))
+            return np.asarray(rows)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_stats(self)->dict:
+        """
+        Returns hit and miss counts of the cache
+        """
+        with self.lock:
+            lookups = self.hits+self.misses
+            return {"size": len(self.entries),
+                    "max_size": self.max_size,
+                    "ttl_seconds": self.ttl_seconds,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits/lookups if lookups else 0.0,
+                    "expired": self.expired,
+                    "evictions": self.evictions}
@@ -0,0 +1,176 @@
+import os, sys
+import json
+import numpy as np
+
+from thyroid.exception import ThyroidException
+
+
+SUPPORTED_OBJECTIVES = ("binary:logistic",)
+
+
+class TreeEnsemble:
+    """
+    This class holds a trained XGBoost gbtree model as contiguous node arrays (feature index,
+    threshold, children, leaf value and missing value direction) and evaluates all trees over
+    a batch with vectorized NumPy traversal.
+
+    The arrays are saved as a plain .npz file, so scoring needs NumPy only and not the xgboost runtime.
+    Inputs are compared in float32 and leaf values are summed tree by tree in float32 like XGBoost does,
+    which keeps the margin equal to Booster.predict(output_margin=True).
+    """
+    def __init__(self, feature:np.ndarray, threshold:np.ndarray, left:np.ndarray, right:np.ndarray,
+                default_left:np.ndarray, leaf_value:np.ndarray, roots:np.ndarray, max_depth:int,
+                base_margin:float, objective:str, n_features:int):
+        try:
+            if objective not in SUPPORTED_OBJECTIVES:
+                raise Exception(f"Objective: {objective} is not supported, supported objectives: {SUPPORTED_OBJECTIVES}")
+            self.feature = feature.astype(np.int32)
+            self.threshold = threshold.astype(np.float32)
+            self.left = left.astype(np.int32)
+            self.right = right.astype(np.int32)
+            self.default_left = default_left.astype(bool)
+            self.leaf_value = leaf_value.astype(np.float32)
+            self.roots = roots.astype(np.int32)
+            self.max_depth = int(max_depth)
+            self.base_margin = np.float32(base_margin)
+            self.objective = str(objective)
+            self.n_features = int(n_features)
+
+            # Traversal arrays: intp indices avoid conversion on every take, children of node i are at 2*i and 2*i+1
+            self.feature_index = self.feature.astype(np.intp)
+            self.children = np.stack([self.left, self.right], axis=1).ravel().astype(np.intp)
+            self.default_right = ~self.default_left
+            self.root_index = self.roots.astype(np.intp)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @classmethod
+    def from_booster(cls, booster)->"TreeEnsemble":
+        """
+        This function flattens the trees of a trained xgboost Booster (or XGBClassifier) into node arrays
+        """
+        try:
+            if hasattr(booster,'get_booster'):
+                booster = booster.get_booster()
+            model_json = json.loads(booster.save_raw(raw_format="json"))
+            learner = model_json["learner"]
+            gradient_booster = learner["gradient_booster"]
+            if gradient_booster["name"]!="gbtree":
+                raise Exception(f"Booster: {gradient_booster['name']} is not supported, only gbtree")
+            trees = gradient_booster["model"]["trees"]
+            # Same trees as XGBClassifier.predict when the model was trained with early stopping
+            best_iteration = booster.attr("best_iteration")
+            if best_iteration is not None:
+                trees = trees[:int(best_iteration)+1]
+
+            feature, threshold, left, right, default_left, roots = [], [], [], [], [], []
+            max_depth = 0
+            offset = 0
+            for tree in trees:
+                tree_left = np.asarray(tree["left_children"],dtype=np.int64)
+                tree_right = np.asarray(tree["right_children"],dtype=np.int64)
+                is_leaf = tree_left==-1
+                # Leaf nodes point to themselves so that traversal can run a fixed number of steps
+                node_index = np.arange(len(tree_left))
+                left.append(np.where(is_leaf,node_index,tree_left)+offset)
+                right.append(np.where(is_leaf,node_index,tree_right)+offset)
+                feature.append(np.where(is_leaf,0,tree["split_indices"]))
+                # For leaf nodes split_conditions holds the leaf value
+                threshold.append(np.asarray(tree["split_conditions"],dtype=np.float32))
+                default_left.append(np.asarray(tree["default_left"],dtype=bool))
+                roots.append(offset)
+
+                depth = np.zeros(len(tree_left),dtype=np.int64)
+                for node in range(len(tree_left)):
+                    if not is_leaf[node]:
+                        depth[tree_left[node]] = depth[tree_right[node]] = depth[node]+1
+                max_depth = max(max_depth,int(depth.max()))
+                offset += len(tree_left)
+
+            threshold = np.concatenate(threshold)
+            is_leaf = np.concatenate(left)==np.arange(offset)
+            base_score = np.float32(float(learner["learner_model_param"]["base_score"]))
+            # Logistic objective keeps base_score as probability, margin is its logit
+            base_margin = -np.log(np.float32(1)/base_score-np.float32(1))
+
+            return cls(feature=np.concatenate(feature), threshold=threshold, left=np.concatenate(left),
+                        right=np.concatenate(right), default_left=np.concatenate(default_left),
+                        leaf_value=np.where(is_leaf,threshold,0), roots=np.asarray(roots), max_depth=max_depth,
+                        base_margin=base_margin, objective=learner["objective"]["name"],
+                        n_features=int(learner["learner_model_param"]["num_feature"]))
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def save(self, file_path:str)->None:
+        """
+        Saving node arrays to .npz file
+        """
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as file_obj:
+                np.savez(file_obj, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                        default_left=self.default_left, leaf_value=self.leaf_value, roots=self.roots,
+                        max_depth=self.max_depth, base_margin=self.base_margin, objective=self.objective,
+                        n_features=self.n_features)
+        except Exception as e:
+            raise ThyroidException(e, sys) from e
+
+    @classmethod
+    def load(cls, file_path:str)->"TreeEnsemble":
+        """
+        Loading node arrays from .npz file
+        """
+        try:
+            if not os.path.exists(file_path):
+                raise Exception(f"The file: {file_path} is not exists")
+            with np.load(file_path) as arrays:
+                return cls(feature=arrays["feature"], threshold=arrays["threshold"], left=arrays["left"],
+                            right=arrays["right"], default_left=arrays["default_left"], leaf_value=arrays["leaf_value"],
+                            roots=arrays["roots"], max_depth=int(arrays["max_depth"]), base_margin=float(arrays["base_margin"]),
+                            objective=str(arrays["objective"]), n_features=int(arrays["n_features"]))
+        except Exception as e:
+            raise ThyroidException(e, sys) from e
+
+    def predict_leaf(self, input_arr:np.ndarray)->np.ndarray:
+        """
+        Returns the leaf node (global index) reached in every tree, shape (number of rows, number of trees)
+        """
+        input_arr = np.ascontiguousarray(input_arr,dtype=np.float32)
+        if input_arr.ndim==1:
+            input_arr = input_arr.reshape(1,-1)
+        n_rows,n_features = input_arr.shape
+        flat_input = input_arr.ravel()
+        row_offset = (np.arange(n_rows,dtype=np.intp)*n_features)[:,np.newaxis]
+        has_null = np.isnan(flat_input).any()
+
+        node = np.broadcast_to(self.root_index,(n_rows,self.root_index.size))
+        for _ in range(self.max_depth):
+            value = flat_input.take(row_offset+self.feature_index.take(node))
+            # Same test as XGBoost: go left if value < threshold, null values follow the default direction
+            go_right = value>=self.threshold.take(node)
+            if has_null:
+                go_right |= np.isnan(value) & self.default_right.take(node)
+            node = self.children.take(2*node+go_right)
+        return node
+
+    def predict_margin(self, input_arr:np.ndarray)->np.ndarray:
+        """
+        Returns raw margin, leaf values are added tree by tree in float32 starting at base margin
+        """
+        try:
+            leaf_value = self.leaf_value.take(self.predict_leaf(input_arr=input_arr).T)
+            base_margin = np.full((1,leaf_value.shape[1]), self.base_margin, dtype=np.float32)
+            # cumsum adds sequentially in tree order, which is the order XGBoost accumulates in
+            return np.cumsum(np.vstack([base_margin,leaf_value]), axis=0, dtype=np.float32)[-1]
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def predict_proba(self, input_arr:np.ndarray)->np.ndarray:
+        """
+        Returns positive class probability
+        """
+        margin = self.predict_margin(input_arr=input_arr)
+        return np.float32(1)/(np.float32(1)+np.exp(-margin))
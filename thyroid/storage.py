@@ -0,0 +1,122 @@
+import os, sys
+import shutil
+import pandas as pd
+
+from thyroid import schema
+from thyroid.exception import ThyroidException
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+FILE_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+
+def get_file_format(file_path:str)->str:
+    extension = os.path.splitext(file_path)[1]
+    for file_format,format_extension in FILE_EXTENSIONS.items():
+        if extension==format_extension:
+            return file_format
+    raise Exception(f"Unknown file format of {file_path}, known extensions are {list(FILE_EXTENSIONS.values())}")
+
+
+class DataFrameStorage:
+    """
+    This class is the one place stages read and write dataframes through.
+
+    csv : text, dtypes are inferred again on every read
+    parquet : typed columnar file (pyarrow), read with column projection
+    arrow : Arrow IPC file (pyarrow), read memory mapped with column projection
+
+    Files are written in storage_format and read in the format of their extension, so artifacts of earlier runs
+    stay readable when the format changes. Every format is read with the dtypes of the thyroid schema, so a
+    parquet or arrow file reads back with the same dtypes and values as the csv of the same data
+    (benchmarks/storage_format_benchmark.py checks this). Typed formats need pyarrow (pinned in requirements.txt).
+    """
+    def __init__(self, storage_format:str="csv"):
+        try:
+            if storage_format not in FILE_EXTENSIONS:
+                raise Exception(f"Unknown storage format: {storage_format}, formats are {list(FILE_EXTENSIONS)}")
+            if storage_format!="csv" and not PYARROW_AVAILABLE:
+                raise Exception(f"Storage format: {storage_format} needs pyarrow, install requirements.txt or use csv")
+            self.storage_format = storage_format
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_file_name(self, file_name:str)->str:
+        """
+        File name with the extension of the storage format
+        """
+        return os.path.splitext(file_name)[0]+FILE_EXTENSIONS[self.storage_format]
+
+    @staticmethod
+    def infer_dtypes(df:pd.DataFrame)->pd.DataFrame:
+        """
+        Same dtypes a csv round trip gives: object columns whose values are all numbers become numeric,
+        so that stages see the same dtypes whichever format they read
+        """
+        df = df.copy()
+        for column in df.columns[df.dtypes==object]:
+            numeric = pd.to_numeric(df[column], errors="coerce")
+            if numeric.notna().sum()==df[column].notna().sum():
+                df[column] = numeric
+        return df
+
+    def write(self, df:pd.DataFrame, file_path:str)->None:
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            file_format = get_file_format(file_path=file_path)
+            if file_format=="csv":
+                df.to_csv(path_or_buf=file_path, index=False, header=True)
+                return
+            # Columns are persisted with the dtypes of the schema, so reading them back needs no cast
+            table = pyarrow.Table.from_pandas(self.infer_dtypes(df=schema.apply_schema(df=df)), preserve_index=False)
+            if file_format=="parquet":
+                pyarrow.parquet.write_table(table, file_path)
+            else:
+                pyarrow.feather.write_feather(table, file_path, compression="uncompressed")
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def read(self, file_path:str, columns:list=None)->pd.DataFrame:
+        """
+        columns : columns to read, all columns if None
+        """
+        try:
+            file_format = get_file_format(file_path=file_path)
+            if file_format=="csv":
+                return schema.read_csv(file_path=file_path, columns=columns)
+            if file_format=="parquet":
+                return schema.apply_schema(df=pyarrow.parquet.read_table(file_path, columns=columns).to_pandas())
+            return schema.apply_schema(df=pyarrow.feather.read_table(file_path, columns=columns, memory_map=True).to_pandas())
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def write_csv_parts(self, part_file_paths:list, file_path:str)->None:
+        """
+        Writing csv files with the same header as one file, csv parts are concatenated without parsing,
+        for a typed format they are parsed with the dtypes of the schema before writing
+        """
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            if get_file_format(file_path=file_path)!="csv":
+                self.write(df=pd.concat([schema.read_csv(file_path=part_file_path) for part_file_path in part_file_paths],
+                                        ignore_index=True), file_path=file_path)
+                return
+            with open(file_path, "wb") as file_writer:
+                for index,part_file_path in enumerate(part_file_paths):
+                    with open(part_file_path, "rb") as file_reader:
+                        if index>0:
+                            file_reader.readline()
+                        shutil.copyfileobj(file_reader, file_writer)
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
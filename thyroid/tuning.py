@@ -0,0 +1,245 @@
+import os, sys
+import math
+import json
+import time
+import hashlib
+import numpy as np
+from typing import Optional
+from xgboost import XGBClassifier
+
+from sklearn.metrics import f1_score
+from sklearn.model_selection import ParameterGrid, train_test_split
+
+from thyroid import utils
+from thyroid.logger import logging
+from thyroid.exception import ThyroidException
+
+
+class HyperbandSearch:
+    """
+    This class searches XGBClassifier parameters with Hyperband, the number of boosting rounds is the resource.
+
+    Each bracket runs successive halving: many candidates are trained for a few rounds, the best
+    1/halving_factor of them go on with halving_factor times more rounds, until max_rounds. Brackets go
+    from many candidates with few rounds to few candidates with max_rounds. Every run uses early stopping
+    on a stratified validation split, and no new run is started once time_budget seconds are over.
+
+    param_grid : candidate values of each parameter, candidates are drawn from their combinations
+    fixed_params : parameters every candidate is trained with, e.g. scale_pos_weight of the training set
+    """
+    def __init__(self, param_grid:dict, min_rounds:int=25, max_rounds:int=300, halving_factor:int=3,
+                early_stopping_rounds:int=20, time_budget:Optional[float]=None, validation_size:float=0.2,
+                random_state:int=42, fixed_params:Optional[dict]=None):
+        try:
+            self.param_grid = param_grid
+            self.fixed_params = fixed_params or {}
+            self.min_rounds = min_rounds
+            self.max_rounds = max_rounds
+            self.halving_factor = halving_factor
+            self.early_stopping_rounds = early_stopping_rounds
+            self.time_budget = time_budget
+            self.validation_size = validation_size
+            self.random_state = random_state
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_search_space(self)->dict:
+        """
+        Candidate values and search settings, results are only comparable between searches with the same space
+        Names of fixed parameters are part of it, their values depend on the data which the fingerprint covers
+        """
+        return {"param_grid": {name: list(values) for name,values in self.param_grid.items()},
+                "fixed_params": sorted(self.fixed_params),
+                "min_rounds": self.min_rounds,
+                "max_rounds": self.max_rounds,
+                "halving_factor": self.halving_factor,
+                "early_stopping_rounds": self.early_stopping_rounds,
+                "validation_size": self.validation_size,
+                "random_state": self.random_state}
+
+    def get_candidates(self)->list:
+        return list(ParameterGrid(self.param_grid))
+
+    def evaluate(self, params:dict, n_rounds:int, x_train, y_train, x_valid, y_valid)->dict:
+        """
+        Trains one candidate for at most n_rounds with early stopping on the validation split
+        returns the validation log loss and f1 score at the best round
+        """
+        model = XGBClassifier(**params, **self.fixed_params, n_estimators=n_rounds, early_stopping_rounds=self.early_stopping_rounds,
+                            eval_metric="logloss", random_state=self.random_state)
+        model.fit(x_train, y_train, eval_set=[(x_valid, y_valid)], verbose=False)
+        best_n_estimators = int(model.best_iteration)+1
+        return {"params": params,
+                "n_rounds": n_rounds,
+                "best_n_estimators": best_n_estimators,
+                "valid_logloss": float(model.best_score),
+                "valid_f1": float(f1_score(y_true=y_valid, y_pred=model.predict(x_valid)))}
+
+    def get_brackets(self)->list:
+        """
+        Returns (number of candidates, rounds of the first rung) of each Hyperband bracket
+        """
+        s_max = int(math.floor(math.log(self.max_rounds/self.min_rounds, self.halving_factor)+1e-9))
+        brackets = []
+        for s in range(s_max, -1, -1):
+            n_candidates = int(math.ceil((s_max+1)/(s+1)*self.halving_factor**s))
+            brackets.append((n_candidates, max(self.min_rounds, int(round(self.max_rounds/self.halving_factor**s)))))
+        return brackets
+
+    def is_over_budget(self)->bool:
+        return self.time_budget is not None and time.time()-self.start_time_>self.time_budget
+
+    def fit(self, x, y, priority_candidates:Optional[list]=None):
+        """
+        Runs the search, best candidate is the one with the lowest validation log loss over all runs
+        priority_candidates : candidates tried first in every bracket (e.g. best ones of an earlier search)
+        """
+        try:
+            priority_candidates = priority_candidates or []
+            self.start_time_ = time.time()
+            random_state = np.random.RandomState(self.random_state)
+            x_train, x_valid, y_train, y_valid = train_test_split(x, y, test_size=self.validation_size, stratify=y,
+                                                                random_state=self.random_state)
+            candidates = self.get_candidates()
+            self.results_ = []
+            self.stopped_by_budget_ = False
+
+            for n_candidates, n_rounds in self.get_brackets():
+                if self.is_over_budget():
+                    break
+                # Priority candidates first, the rest drawn at random from the grid
+                priority = [params for params in priority_candidates if params in candidates][:n_candidates]
+                others = [params for params in candidates if params not in priority]
+                drawn = random_state.permutation(len(others))[:n_candidates-len(priority)]
+                bracket = priority+[others[index] for index in drawn]
+                logging.info(f"Hyperband bracket: {len(bracket)} candidates starting with {n_rounds} rounds")
+
+                while len(bracket)>0:
+                    rung_results = []
+                    for params in bracket:
+                        if len(self.results_)>0 and self.is_over_budget():
+                            self.stopped_by_budget_ = True
+                            break
+                        result = self.evaluate(params=params, n_rounds=n_rounds, x_train=x_train, y_train=y_train,
+                                            x_valid=x_valid, y_valid=y_valid)
+                        logging.info(f"Candidate {params} with {n_rounds} rounds: {result}")
+                        rung_results.append(result)
+                    self.results_.extend(rung_results)
+                    if self.stopped_by_budget_ or n_rounds>=self.max_rounds:
+                        break
+                    # Best 1/halving_factor of the rung go on with halving_factor times more rounds
+                    rung_results.sort(key=lambda result: result["valid_logloss"])
+                    bracket = [result["params"] for result in rung_results[:len(rung_results)//self.halving_factor]]
+                    n_rounds = min(n_rounds*self.halving_factor, self.max_rounds)
+                if self.stopped_by_budget_:
+                    logging.info(f"Tuning time budget of {self.time_budget} seconds is over")
+                    break
+
+            best_result = min(self.results_, key=lambda result: result["valid_logloss"])
+            self.best_params_ = dict(best_result["params"])
+            self.best_n_estimators_ = best_result["best_n_estimators"]
+            self.best_score_ = best_result["valid_logloss"]
+            self.n_boosting_rounds_ = int(sum(result["n_rounds"] for result in self.results_))
+            self.elapsed_seconds_ = time.time()-self.start_time_
+            return self
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+def get_hash(data)->str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class TuningCache:
+    """
+    This class keeps the result of the last search per schema and search space as yaml in cache_dir,
+    keyed by a fingerprint of the training arrays, so that retrains on nearly identical data skip the search.
+
+    Decision for a new fingerprint:
+    reuse      : same data, or row count, column means and class balance within the tolerances
+    warm_start : data changed, the best candidates of the last search are tried first
+    search     : nothing cached for this schema and search space
+    """
+    def __init__(self, cache_dir:str, row_tolerance:float=0.05, shift_tolerance:float=0.1, n_samples:int=1000):
+        try:
+            self.cache_dir = cache_dir
+            self.row_tolerance = row_tolerance          # relative change of row count
+            self.shift_tolerance = shift_tolerance      # change of column mean in cached standard deviations, and of class ratio
+            self.n_samples = n_samples
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_fingerprint(self, x:np.ndarray, y:np.ndarray, search_space:dict)->dict:
+        """
+        Row count, schema, hash of evenly spaced sample rows and per column statistics of the arrays
+        """
+        try:
+            x = np.ascontiguousarray(x, dtype=np.float64)
+            y = np.ascontiguousarray(y, dtype=np.float64)
+            sample_index = np.unique(np.linspace(0, x.shape[0]-1, num=min(self.n_samples, x.shape[0])).astype(np.int64))
+            classes, class_counts = np.unique(y, return_counts=True)
+
+            fingerprint = {"n_rows": int(x.shape[0]),
+                        "n_columns": int(x.shape[1]),
+                        "search_space_hash": get_hash(json.dumps(search_space, sort_keys=True).encode()),
+                        "content_hash": get_hash(x[sample_index].tobytes()+y[sample_index].tobytes()),
+                        "column_means": np.nan_to_num(np.nanmean(x, axis=0)).tolist(),
+                        "column_stds": np.nan_to_num(np.nanstd(x, axis=0)).tolist(),
+                        "class_ratios": {str(label): float(count/y.shape[0]) for label,count in zip(classes,class_counts)}}
+            fingerprint["key"] = get_hash(f"{fingerprint['search_space_hash']}-{fingerprint['n_columns']}".encode())
+            fingerprint["digest"] = get_hash(f"{fingerprint['key']}-{fingerprint['n_rows']}-{fingerprint['content_hash']}".encode())
+            return fingerprint
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_cache_path(self, fingerprint:dict)->str:
+        return os.path.join(self.cache_dir, f"{fingerprint['key']}.yaml")
+
+    def load(self, fingerprint:dict)->Optional[dict]:
+        """
+        Returns the cached entry with the same schema and search space or None
+        """
+        cache_path = self.get_cache_path(fingerprint=fingerprint)
+        if not os.path.exists(cache_path):
+            return None
+        return utils.read_yaml_file(file_path=cache_path)
+
+    def save(self, fingerprint:dict, search:HyperbandSearch, n_top:int=3)->None:
+        """
+        Saving best parameters and the n_top distinct best candidates of the search
+        """
+        top_params = []
+        for result in sorted(search.results_, key=lambda result: result["valid_logloss"]):
+            if result["params"] not in top_params:
+                top_params.append(result["params"])
+        utils.write_yaml_file(file_path=self.get_cache_path(fingerprint=fingerprint),
+                            data={"fingerprint": fingerprint,
+                                "best_params": search.best_params_,
+                                "best_n_estimators": search.best_n_estimators_,
+                                "best_score": search.best_score_,
+                                "top_params": [dict(params) for params in top_params[:n_top]]})
+
+    def get_decision(self, fingerprint:dict, entry:Optional[dict])->str:
+        """
+        Returns reuse, warm_start or search for the fingerprint and the cached entry
+        """
+        if entry is None:
+            return "search"
+        cached = entry["fingerprint"]
+        if cached["digest"]==fingerprint["digest"]:
+            return "reuse"
+
+        row_change = abs(fingerprint["n_rows"]-cached["n_rows"])/max(cached["n_rows"], 1)
+        column_stds = np.array(cached["column_stds"])
+        column_shift = np.abs(np.array(fingerprint["column_means"])-np.array(cached["column_means"]))/np.where(column_stds>0, column_stds, 1.0)
+        labels = set(fingerprint["class_ratios"])|set(cached["class_ratios"])
+        class_shift = max(abs(fingerprint["class_ratios"].get(label, 0.0)-cached["class_ratios"].get(label, 0.0)) for label in labels)
+        logging.info(f"Change from cached tuning data: rows {row_change:.3f}, column mean shift {column_shift.max():.3f}, class ratio {class_shift:.3f}")
+
+        if row_change<=self.row_tolerance and column_shift.max()<=self.shift_tolerance and class_shift<=self.shift_tolerance:
+            return "reuse"
+        return "warm_start"
@@ -2,29 +2,171 @@ import pandas as pd
 import numpy as np
 import os, sys
 import yaml
+import hashlib
 import dill    # To store python object as a file like pkl
+from typing import Iterator
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from thyroid.logger import logging
-from thyroid.config import mongo_client
+from thyroid.config import mongo_client, RECORD_KEY_FIELD
 from thyroid.exception import ThyroidException
 
 
-def get_collection_as_dataframe(database_name:str,collection_name:str)->pd.DataFrame:
+def iter_collection_chunks(database_name:str,collection_name:str,batch_size:int=10000,client=None,
+                        query:dict=None,sort:list=None)->Iterator[pd.DataFrame]:
+    """
+    Description: This function streams a collection as dataframe chunks
+    =========================================================
+    Params:
+    database_name: database name
+    collection_name: collection name
+    batch_size: documents per cursor batch and rows per chunk, memory stays bounded by it
+    client: mongo client, thyroid.config.mongo_client if None (any client with the pymongo api, e.g. mongomock)
+    query: filter of the documents
+    sort: list of (key, direction) to read the documents in
+    =========================================================
+    yields Pandas dataframe of at most batch_size rows, _id and the loader key are excluded by projection
+    """
+    try:
+        client = mongo_client if client is None else client
+        logging.info(f"Streaming data from database: {database_name} and collection: {collection_name} in chunks of {batch_size}")
+        cursor = client[database_name][collection_name].find(query or {}, projection={"_id": 0, RECORD_KEY_FIELD: 0}, batch_size=batch_size)
+        if sort is not None:
+            cursor = cursor.sort(sort)
+        columns = []
+        documents = []
+        for document in cursor:
+            documents.append(document)
+            if len(documents)==batch_size:
+                chunk = documents_to_dataframe(documents=documents, columns=columns)
+                columns = list(chunk.columns)
+                documents = []
+                yield chunk
+        if len(documents)>0:
+            yield documents_to_dataframe(documents=documents, columns=columns)
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def documents_to_dataframe(documents:list,columns:list)->pd.DataFrame:
+    """
+    Column wise conversion of a batch of documents, columns keep the order of earlier chunks
+    and keys first seen in this batch are added after them
+    """
+    columns = list(dict.fromkeys(columns+[column for document in documents for column in document]))
+    return pd.DataFrame({column: [document.get(column) for document in documents] for column in columns})
+
+
+def get_split_ids(database_name:str,collection_name:str,query:dict,n_ranges:int,client=None,samples_per_range:int=20)->list:
+    """
+    Returns up to n_ranges-1 sorted _id split points of the documents matching query, taken as quantiles
+    of a $sample of the _id values so that ranges hold about the same number of documents
+    """
+    try:
+        client = mongo_client if client is None else client
+        if n_ranges<=1:
+            return []
+        sample = client[database_name][collection_name].aggregate([{"$match": query},
+                                                                {"$sample": {"size": n_ranges*samples_per_range}},
+                                                                {"$project": {"_id": 1}}])
+        sample_ids = sorted(document["_id"] for document in sample)
+        split_ids = [sample_ids[len(sample_ids)*index//n_ranges] for index in range(1, n_ranges)] if len(sample_ids)>0 else []
+        return sorted(set(split_ids))
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def iter_collection_chunks_parallel(database_name:str,collection_name:str,lower_id=None,upper_id=None,parallelism:int=4,
+                                    batch_size:int=10000,client=None,chunks_per_range:int=2)->Iterator[pd.DataFrame]:
+    """
+    Description: This function streams the documents with lower_id < _id <= upper_id as dataframe chunks
+    in _id order, like iter_collection_chunks, but the _id space is split into ranges which are read
+    by parallelism threads, each on its own connection of the client pool
+    =========================================================
+    Params:
+    lower_id: _id after which documents are read (None for the first document)
+    upper_id: last _id to read (None for the last document)
+    parallelism: number of ranges read at once
+    chunks_per_range: ranges are sized by document count to about chunks_per_range*batch_size documents,
+    at most 2*parallelism ranges are held before they are yielded, so peak memory is about
+    2*parallelism*chunks_per_range*batch_size rows whatever the number of documents
+    =========================================================
+    """
+    try:
+        client = mongo_client if client is None else client
+        id_query = dict()
+        if lower_id is not None:
+            id_query["$gt"] = lower_id
+        if upper_id is not None:
+            id_query["$lte"] = upper_id
+        query = {"_id": id_query} if len(id_query)>0 else {}
+
+        n_documents = client[database_name][collection_name].count_documents(query)
+        n_ranges = max(1, -(-n_documents//(batch_size*chunks_per_range)))
+        split_ids = get_split_ids(database_name=database_name, collection_name=collection_name, query=query,
+                                n_ranges=n_ranges, client=client)
+        bounds = [lower_id]+split_ids+[upper_id]
+        range_queries = []
+        for lower,upper in zip(bounds[:-1], bounds[1:]):
+            range_query = dict()
+            if lower is not None:
+                range_query["$gt"] = lower
+            if upper is not None:
+                range_query["$lte"] = upper
+            range_queries.append({"_id": range_query} if len(range_query)>0 else {})
+        logging.info(f"Reading {n_documents} documents of {collection_name} as {len(range_queries)} _id ranges with {parallelism} threads")
+
+        def read_range(range_query:dict)->list:
+            return list(iter_collection_chunks(database_name=database_name, collection_name=collection_name,
+                                            batch_size=batch_size, client=client, query=range_query, sort=[("_id", 1)]))
+
+        # Ranges are yielded in order, the next one is submitted as each one is yielded
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            pending = deque()
+            range_queries = iter(range_queries)
+            for range_query in islice(range_queries, 2*parallelism):
+                pending.append(executor.submit(read_range, range_query))
+            while len(pending)>0:
+                chunks = pending.popleft().result()
+                for range_query in islice(range_queries, 1):
+                    pending.append(executor.submit(read_range, range_query))
+                yield from chunks
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def get_latest_id(database_name:str,collection_name:str,query:dict=None,client=None):
+    """
+    Returns the max _id of the documents matching query, None if there is none
+    """
+    try:
+        client = mongo_client if client is None else client
+        documents = list(client[database_name][collection_name].find(query or {}, projection={"_id": 1}).sort("_id", -1).limit(1))
+        return documents[0]["_id"] if len(documents)>0 else None
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def get_collection_as_dataframe(database_name:str,collection_name:str,batch_size:int=10000,client=None)->pd.DataFrame:
     """
     Description: This function return collection as dataframe
     =========================================================
     Params:
     database_name: database name
     collection_name: collection name
+    batch_size: documents per cursor batch
+    client: mongo client, thyroid.config.mongo_client if None
     =========================================================
-    return Pandas dataframe of a collection
+    return Pandas dataframe of a collection, the whole collection is held in memory: ingestion streams
+    iter_collection_chunks_parallel into the feature store chunk by chunk instead
     """
     try:    
         logging.info(f"Reading data from database: {database_name} and collection: {collection_name}")
-        df = pd.DataFrame(list(mongo_client[database_name][collection_name].find()))
+        chunks = list(iter_collection_chunks(database_name=database_name, collection_name=collection_name,
+                                            batch_size=batch_size, client=client))
+        df = pd.concat(chunks, ignore_index=True) if len(chunks)>0 else pd.DataFrame()
         logging.info(f"Found columns: {df.columns}")
-        if "_id" in df.columns:
-            logging.info(f"Dropping column: _id ")
-            df = df.drop("_id",axis=1)
         logging.info(f"Row and columns in df: {df.shape}")
         return df
     except Exception as e:
@@ -43,6 +185,16 @@ def write_yaml_file(file_path,data:dict):
     except Exception as e:
         raise ThyroidException(e, sys)
 
+def read_yaml_file(file_path:str)->dict:
+    """
+    Reading yaml file as dict
+    """
+    try:
+        with open(file_path,"r") as file_reader:
+            return yaml.safe_load(file_reader)
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
 def convert_columns_float(df:pd.DataFrame,exclude_columns:list)->pd.DataFrame:
     """
     Converting column to float type except target column
@@ -52,9 +204,7 @@ def convert_columns_float(df:pd.DataFrame,exclude_columns:list)->pd.DataFrame:
         obj_cols = df[obj_cols]
         for column in obj_cols.columns:
             if column not in exclude_columns:
-                #df[column]=df[column].astype('float')
-                #df[column] = df[column].apply(pd.to_numeric, errors='coerce') 
-                df[column] = pd.to_numeric(column, errors='coerce') # ignore errors
+                df[column] = pd.to_numeric(df[column], errors='coerce') # values which are not numbers become NaN
         return df
     except Exception as e:
         raise ThyroidException(e, sys)
@@ -87,29 +237,72 @@ def load_object(file_path: str, ) -> object:
         raise ThyroidException(e, sys) from e
 
 
-def save_numpy_array_data(file_path: str, array: np.array):
+FEATURE_ARRAY_FILE_NAME = "x.npy"
+TARGET_ARRAY_FILE_NAME = "y.npy"
+
+
+def get_array_checksum(array: np.ndarray) -> str:
+    return hashlib.blake2b(np.ascontiguousarray(array).data, digest_size=16).hexdigest()
+
+
+def save_array_data(header_path: str, x: np.ndarray, y: np.ndarray, feature_names: list) -> None:
     """
-    Save numpy array data to file
-    file_path: str location of file to save
-    array: np.array data to save
+    Save feature and target arrays as separate .npy files next to a yaml header, the header is written last
+    header_path: str location of the header, arrays are saved in its directory
+    x: feature array, y: target array with one value per row of x
+    feature_names: name of each column of x
+    header holds number of rows, feature names and file name, dtype, shape and content checksum of each array
     """
     try:
-        dir_path = os.path.dirname(file_path)
+        if x.shape[0]!=y.shape[0]:
+            raise Exception(f"Feature array has {x.shape[0]} rows and target array has {y.shape[0]} rows")
+        if x.shape[1]!=len(feature_names):
+            raise Exception(f"Feature array has {x.shape[1]} columns and {len(feature_names)} feature names")
+        dir_path = os.path.dirname(header_path)
         os.makedirs(dir_path, exist_ok=True)
-        with open(file_path, "wb") as file_obj:
-            np.save(file_obj, array)
+        header = {"n_rows": int(x.shape[0]), "feature_names": [str(name) for name in feature_names]}
+        for key,file_name,array in [("x", FEATURE_ARRAY_FILE_NAME, x), ("y", TARGET_ARRAY_FILE_NAME, y)]:
+            with open(os.path.join(dir_path, file_name), "wb") as file_obj:
+                np.save(file_obj, np.ascontiguousarray(array))
+            header[key] = {"file_name": file_name, "dtype": str(array.dtype), "shape": list(array.shape),
+                        "checksum": get_array_checksum(array=array)}
+        write_yaml_file(file_path=header_path, data=header)
     except Exception as e:
         raise ThyroidException(e, sys) from e
 
 
-def load_numpy_array_data(file_path: str) -> np.array:
+def read_array_header(header_path: str) -> dict:
     """
-    load numpy array data from file
-    file_path: str location of file to load
-    return: np.array data loaded
+    Header of arrays saved by save_array_data, reading it does not touch the arrays
     """
     try:
-        with open(file_path, "rb") as file_obj:
-            return np.load(file_obj)
+        if not os.path.exists(header_path):
+            raise Exception(f"The file: {header_path} is not exists")
+        return read_yaml_file(file_path=header_path)
     except Exception as e:
-        raise ThyroidException(e, sys) from e
\ No newline at end of file
+        raise ThyroidException(e, sys) from e
+
+
+def load_array_data(header_path: str, start: int = None, stop: int = None, mmap_mode: str = "r") -> tuple:
+    """
+    load feature and target arrays saved by save_array_data
+    header_path: str location of the header
+    start, stop: row range to return, all rows if None
+    mmap_mode: arrays are memory mapped read only by default, so loading is instant, only the pages which are
+    used are read and processes loading the same file share them. None reads the rows into memory
+    return: feature array and target array of the row range
+    """
+    try:
+        header = read_array_header(header_path=header_path)
+        dir_path = os.path.dirname(header_path)
+        arrays = []
+        for key in ["x", "y"]:
+            array = np.load(os.path.join(dir_path, header[key]["file_name"]), mmap_mode=mmap_mode or "r")
+            if str(array.dtype)!=header[key]["dtype"] or list(array.shape)!=header[key]["shape"]:
+                raise Exception(f"Array {header[key]['file_name']} is {array.dtype} {array.shape}, header says "
+                                f"{header[key]['dtype']} {header[key]['shape']}")
+            array = array[start:stop]
+            arrays.append(np.array(array) if mmap_mode is None else array)
+        return arrays[0], arrays[1]
+    except Exception as e:
+        raise ThyroidException(e, sys) from e